@@ -0,0 +1,198 @@
+"""Семантический кэш ответов по близости эмбеддингов вопросов."""
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedAnswer:
+    """Запись кэша ответов."""
+
+    question: str
+    answer: str
+    sources: dict[str, Any]
+    vector: np.ndarray
+    # Область поиска ответа: документы корпуса (пусто - весь корпус)
+    scope: str = ""
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class SemanticAnswerCache:
+    """
+    Кэш ответов, ключом которого служит эмбеддинг вопроса.
+
+    Поиск - косинусная близость ко всем сохраненным вопросам одним
+    матричным умножением. Вытеснение - LRU по количеству записей и TTL.
+    Кэш полностью сбрасывается при смене fingerprint (версия индекса,
+    промпты, модель LLM).
+
+    Ответ годится только для вопроса с той же областью поиска (набором
+    документов корпуса): записи других областей при поиске не учитываются.
+    """
+
+    def __init__(self, threshold: float, max_entries: int, ttl_seconds: float) -> None:
+        """
+        Args:
+            threshold: Минимальная косинусная близость для попадания
+            max_entries: Максимальное количество записей (LRU)
+            ttl_seconds: Время жизни записи в секундах (0 - без ограничения)
+        """
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._entries: OrderedDict[int, CachedAnswer] = OrderedDict()
+        self._next_id = 0
+        self._fingerprint: Optional[str] = None
+        self._lock = threading.Lock()
+
+        # Матрица векторов, пересобирается лениво после изменений
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: list[int] = []
+        self._matrix_scopes: Optional[np.ndarray] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(vector: list[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm > 0 else v
+
+    def _check_fingerprint(self, fingerprint: str) -> None:
+        """Сбрасывает кэш, если изменились индекс, промпты или модель."""
+        if self._fingerprint == fingerprint:
+            return
+        if self._fingerprint is not None and self._entries:
+            logger.info(
+                f"Answer cache invalidated ({len(self._entries)} entries dropped)"
+            )
+            self.invalidations += 1
+        self._entries.clear()
+        self._matrix = None
+        self._fingerprint = fingerprint
+
+    def _evict_expired(self) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        deadline = time.monotonic() - self.ttl_seconds
+        expired = [i for i, e in self._entries.items() if e.created_at < deadline]
+        for entry_id in expired:
+            del self._entries[entry_id]
+        if expired:
+            self._matrix = None
+
+    def lookup(
+        self, vector: list[float], fingerprint: str, scope: str = ""
+    ) -> Optional[CachedAnswer]:
+        """
+        Ищет ответ на достаточно похожий вопрос.
+
+        Args:
+            vector: Эмбеддинг вопроса
+            fingerprint: Текущий fingerprint индекса/промптов/модели
+            scope: Область поиска вопроса (пусто - весь корпус)
+
+        Returns:
+            Запись кэша или None
+        """
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            self._evict_expired()
+
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            if self._matrix is None:
+                self._matrix_ids = list(self._entries.keys())
+                self._matrix = np.stack(
+                    [self._entries[i].vector for i in self._matrix_ids]
+                )
+                self._matrix_scopes = np.asarray(
+                    [self._entries[i].scope for i in self._matrix_ids], dtype=object
+                )
+
+            scores = self._matrix @ self._normalize(vector)
+            scores[self._matrix_scopes != scope] = -np.inf
+            best = int(np.argmax(scores))
+            score = float(scores[best])
+            if score < self.threshold:
+                self.misses += 1
+                return None
+
+            entry_id = self._matrix_ids[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            entry = self._entries[entry_id]
+            logger.info(
+                f"Answer cache hit (similarity={score:.4f}): '{entry.question}'"
+            )
+            return entry
+
+    def store(
+        self,
+        vector: list[float],
+        question: str,
+        answer: str,
+        sources: dict[str, Any],
+        fingerprint: str,
+        scope: str = "",
+    ) -> None:
+        """
+        Сохраняет ответ в кэш.
+
+        Args:
+            vector: Эмбеддинг вопроса
+            question: Текст вопроса
+            answer: Ответ LLM
+            sources: Источники ответа (цитаты и chunk_ids)
+            fingerprint: Fingerprint, с которым был получен ответ
+            scope: Область поиска, по которой получен ответ
+        """
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            self._entries[self._next_id] = CachedAnswer(
+                question=question,
+                answer=answer,
+                sources=sources,
+                vector=self._normalize(vector),
+                scope=scope,
+            )
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self) -> None:
+        """Очищает кэш."""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> dict[str, Any]:
+        """
+        Статистика кэша.
+
+        Returns:
+            Словарь со счетчиками попаданий/промахов и размером
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "invalidations": self.invalidations,
+            }
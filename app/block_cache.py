@@ -0,0 +1,169 @@
+"""Дисковый кэш разбора PDF: блоки § разделов по sha256 документа."""
+
+import glob
+import gzip
+import json
+import logging
+import os
+import statistics
+from collections.abc import Iterable, Iterator, Mapping
+from typing import Any, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Версия формата файла кэша
+BLOCK_CACHE_FORMAT = 1
+
+# Поля блока, которые хранятся колонками (текст - отдельной колонкой)
+BLOCK_FIELDS = (
+    "part",
+    "subpart",
+    "section",
+    "title",
+    "page_start",
+    "page_end",
+    "chunk_id",
+    "citation",
+)
+
+Block = dict[str, Union[str, int]]
+
+
+class BlockCache:
+    """
+    Блоки § разделов, разобранные из PDF (метаданные, страницы, текст).
+
+    Извлечение текста, разбор PART / SUBPART / § и сборка блоков
+    детерминированы для данного файла, поэтому результат хранится по ключу
+    (sha256 документа, версия парсера) и пересборка с другими
+    ``CHUNK_SIZE`` / ``CHUNK_OVERLAP`` сразу переходит к нарезке на чанки.
+    Файл - gzip JSON с полями блоков по колонкам.
+    """
+
+    def __init__(self, directory: str, parser_version: int) -> None:
+        """
+        Args:
+            directory: Директория кэша
+            parser_version: Версия разбора структуры документа
+        """
+        self.directory = directory
+        self.parser_version = parser_version
+
+    def path(self, document_sha256: str) -> str:
+        """Файл кэша документа для текущей версии парсера."""
+        return os.path.join(
+            self.directory, f"{document_sha256}-p{self.parser_version}.json.gz"
+        )
+
+    def load(self, document_sha256: str) -> Optional[list[Block]]:
+        """
+        Блоки документа из кэша.
+
+        Args:
+            document_sha256: SHA-256 PDF файла
+
+        Returns:
+            Блоки с текстом в ключе ``text`` или None, если их нет в кэше
+        """
+        path = self.path(document_sha256)
+        if not os.path.exists(path):
+            return None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format") != BLOCK_CACHE_FORMAT:
+                raise ValueError(f"unsupported format {data.get('format')}")
+            columns = data["columns"]
+            return [
+                {
+                    **{name: columns[name][i] for name in BLOCK_FIELDS},
+                    "text": text,
+                }
+                for i, text in enumerate(data["texts"])
+            ]
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            logger.warning(f"Ignoring unreadable block cache {path}: {e}")
+            return None
+
+    def save(self, document_sha256: str, blocks: list[Block]) -> None:
+        """
+        Атомарно сохраняет блоки документа; файлы других версий парсера
+        для этого документа удаляются.
+
+        Args:
+            document_sha256: SHA-256 PDF файла
+            blocks: Блоки с текстом в ключе ``text``
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        data = {
+            "format": BLOCK_CACHE_FORMAT,
+            "document_sha256": document_sha256,
+            "parser_version": self.parser_version,
+            "columns": {
+                name: [block[name] for block in blocks] for name in BLOCK_FIELDS
+            },
+            "texts": [block["text"] for block in blocks],
+        }
+        path = self.path(document_sha256)
+        with gzip.open(f"{path}.tmp", "wt", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(f"{path}.tmp", path)
+        for stale in glob.glob(os.path.join(self.directory, f"{document_sha256}-p*")):
+            if stale != path:
+                os.remove(stale)
+
+    def record(self, document_sha256: str, blocks: Iterable[Block]) -> Iterator[Block]:
+        """
+        Пропускает поток блоков через себя и сохраняет их в кэш, когда
+        поток дочитан до конца (прерванный разбор не сохраняется).
+
+        Args:
+            document_sha256: SHA-256 PDF файла
+            blocks: Поток блоков разбора
+
+        Yields:
+            Те же блоки
+        """
+        seen: list[Block] = []
+        for block in blocks:
+            seen.append(block)
+            yield block
+        try:
+            self.save(document_sha256, seen)
+            logger.info(f"Parsed blocks cached: {len(seen)} blocks")
+        except OSError as e:
+            logger.warning(f"Failed to save block cache: {e}")
+
+
+def parse_stats(blocks: Iterable[Mapping[str, Any]]) -> dict[str, Any]:
+    """
+    Статистика разбора документа по блокам.
+
+    Args:
+        blocks: Блоки с текстом в ключе ``text``
+
+    Returns:
+        Количество блоков, найденных разделов §, частей и подчастей, строк
+        и блоков вне разделов (``unknown``), распределение страниц на блок
+        и самый длинный по страницам блок
+    """
+    blocks = list(blocks)
+    pages = [int(b["page_end"]) - int(b["page_start"]) + 1 for b in blocks]
+    unknown = [b for b in blocks if b["section"] == "unknown"]
+    longest = max(range(len(blocks)), key=pages.__getitem__, default=None)
+    return {
+        "blocks": len(blocks),
+        "sections": len({b["section"] for b in blocks} - {"unknown"}),
+        "parts": len({b["part"] for b in blocks} - {"unknown"}),
+        "subparts": len(
+            {(b["part"], b["subpart"]) for b in blocks if b["subpart"] != "unknown"}
+        ),
+        "unknown_blocks": len(unknown),
+        "unknown_lines": sum(len(str(b["text"]).splitlines()) for b in unknown),
+        "lines": sum(len(str(b["text"]).splitlines()) for b in blocks),
+        "pages_per_block_mean": statistics.fmean(pages) if pages else 0.0,
+        "pages_per_block_median": statistics.median(pages) if pages else 0,
+        "pages_per_block_max": max(pages, default=0),
+        "multi_page_blocks": sum(1 for p in pages if p > 1),
+        "longest_block": blocks[longest]["citation"] if longest is not None else "",
+    }
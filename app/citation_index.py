@@ -0,0 +1,115 @@
+"""Индекс разделов документа: § раздел / Part / Subpart -> id чанков."""
+
+import json
+import logging
+import os
+from collections.abc import Mapping
+from typing import Any, Optional
+
+from app.near_duplicates import duplicate_sources
+
+logger = logging.getLogger(__name__)
+
+# Версия формата файла индекса
+SECTION_INDEX_FORMAT = 1
+
+
+class SectionIndex:
+    """
+    Индекс структуры документа, построенный по метаданным чанков.
+
+    - sections: номер раздела ("164.512") -> id записей в порядке документа
+      (в корпусе - по документам)
+    - subparts: номер части ("164") -> буквы подчастей ("A", "E", ...)
+    """
+
+    def __init__(
+        self,
+        sections: dict[str, list[str]],
+        subparts: dict[str, list[str]],
+        index_version: str,
+    ) -> None:
+        """
+        Args:
+            sections: Раздел -> id записей коллекции
+            subparts: Часть -> подчасти
+            index_version: Версия векторного индекса, по которому построен
+        """
+        self.sections = sections
+        self.subparts = subparts
+        self.index_version = index_version
+
+    @classmethod
+    def from_metadatas(
+        cls,
+        ids: list[str],
+        metadatas: list[Optional[Mapping[str, Any]]],
+        index_version: str,
+    ) -> "SectionIndex":
+        """
+        Строит индекс по метаданным чанков коллекции.
+
+        Args:
+            ids: Id записей коллекции
+            metadatas: Метаданные записей (part, subpart, section, page_start,
+                цитаты слитых повторов)
+            index_version: Версия векторного индекса
+
+        Returns:
+            SectionIndex
+        """
+        records = sorted(
+            zip(ids, [m or {} for m in metadatas], strict=True),
+            key=lambda r: (
+                str(r[1].get("doc_id", "")),
+                int(r[1].get("page_start", 0)),
+                str(r[1].get("chunk_id")),
+            ),
+        )
+        sections: dict[str, list[str]] = {}
+        subparts: dict[str, list[str]] = {}
+        for record_id, meta in records:
+            section = str(meta.get("section", "unknown"))
+            if section != "unknown":
+                sections.setdefault(section, []).append(record_id)
+            # Чанк отвечает и за разделы слитых с ним почти повторов
+            for citation, _, _ in duplicate_sources(meta):
+                duplicate = citation.removeprefix("§")
+                if citation.startswith("§") and duplicate != section:
+                    known_ids = sections.setdefault(duplicate, [])
+                    if record_id not in known_ids:
+                        known_ids.append(record_id)
+            part = str(meta.get("part", "unknown"))
+            subpart = str(meta.get("subpart", "unknown"))
+            if part != "unknown":
+                known = subparts.setdefault(part, [])
+                if subpart != "unknown" and subpart not in known:
+                    known.append(subpart)
+        return cls(sections, subparts, index_version)
+
+    def save(self, path: str) -> None:
+        """Сохраняет индекс в JSON-файл."""
+        data = {
+            "format": SECTION_INDEX_FORMAT,
+            "index_version": self.index_version,
+            "sections": self.sections,
+            "subparts": self.subparts,
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SectionIndex":
+        """
+        Загружает индекс из JSON-файла.
+
+        Raises:
+            ValueError: Если формат файла не поддерживается
+        """
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format") != SECTION_INDEX_FORMAT:
+            raise ValueError(f"Unsupported section index format: {data.get('format')}")
+        return cls(data["sections"], data["subparts"], data["index_version"])
@@ -0,0 +1,450 @@
+"""
+Утилиты векторной базы: сборка версий и снимков индекса, отчеты и замеры.
+
+Запуск: ``python -m app.cli <команда>`` (список команд - ``--help``).
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections.abc import Sequence
+from typing import Optional
+
+import fitz
+import numpy as np
+
+from app.block_cache import parse_stats
+from app.config import (
+    get_dedup_threshold,
+    get_document_path,
+    get_document_paths,
+    get_flat_index_reduction,
+    get_flat_rescore_candidates,
+    get_index_keep_versions,
+    get_search_k,
+)
+from app.document_parser import PARSER_VERSION, iter_blocks
+from app.embeddings import create_embeddings, embed_queries
+from app.flat_index import benchmark_search
+from app.index_manifest import file_sha256
+from app.index_versions import (
+    collect_garbage,
+    read_current_version,
+    write_current_version,
+)
+from app.near_duplicates import DUPLICATE_CITATIONS_KEY, ChunkDeduplicator
+from app.pdf_extract import iter_page_texts
+from app.vector_compression import REDUCTIONS, VectorCompression, recall_report
+from app.vector_store import (
+    INGEST_CHECKPOINT_FILENAME,
+    VECTOR_DB_PATH,
+    build_index_version,
+    chunk_record_id,
+    create_vector_db,
+    export_snapshot,
+    get_index_directory,
+    iter_pdf_chunks,
+    load_flat_index,
+    load_vector_db,
+    open_block_cache,
+    release_chroma,
+)
+
+
+def dedup_report(pdf_path: str, threshold: float, top: int) -> bool:
+    """
+    Отчет об удалении почти повторяющихся чанков без эмбеддинга.
+
+    Args:
+        pdf_path: Путь к PDF файлу
+        threshold: Порог сходства Жаккара
+        top: Сколько самых больших групп повторов показать
+
+    Returns:
+        True, если документ разобран
+    """
+    if not os.path.exists(pdf_path):
+        print(f"❌ PDF файл не найден: {pdf_path}")
+        return False
+    dedup = ChunkDeduplicator(threshold)
+    texts: dict[str, str] = {}
+    citations: dict[str, str] = {}
+    started = time.monotonic()
+    doc = fitz.open(pdf_path)
+    try:
+        for _, chunks in iter_pdf_chunks(doc, pdf_path, block_cache=open_block_cache()):
+            for chunk in chunks:
+                record_id = chunk_record_id(chunk.metadata)
+                if dedup.check(record_id, chunk) is None:
+                    texts[record_id] = chunk.page_content
+                    citations[record_id] = str(chunk.metadata["citation"])
+    finally:
+        doc.close()
+    elapsed = time.monotonic() - started
+    if not dedup.chunks:
+        print(f"❌ В документе нет текста: {pdf_path}")
+        return False
+
+    print(f"Порог сходства: {threshold}, разбор и проверка за {elapsed:.2f}с")
+    print(
+        f"Чанков: {dedup.chunks}, удалено повторов: {dedup.removed} "
+        f"({100 * dedup.removed / dedup.chunks:.1f}%), "
+        f"текста: {100 * dedup.removed_chars / max(dedup.chars, 1):.1f}%"
+    )
+    print(f"Канонических чанков с повторами: {len(dedup.duplicates)}")
+    groups = sorted(dedup.duplicates.items(), key=lambda g: -len(g[1]))[:top]
+    for record_id, duplicates in groups:
+        preview = " ".join(texts[record_id].split())[:70]
+        sources = dedup.duplicate_metadata(record_id)[DUPLICATE_CITATIONS_KEY]
+        print(f"  {len(duplicates):>4} x {citations[record_id]:<10} {preview}…")
+        print(f"         также: {str(sources)[:100]}")
+    print("✅ Отчет построен")
+    return True
+
+
+def build_snapshot_cli(pdf_paths: Sequence[str], out: str) -> bool:
+    """
+    Собирает индекс во временной директории и сохраняет его снимок (например,
+    в CI, чтобы поставить его с образом).
+
+    Args:
+        pdf_paths: PDF файлы корпуса
+        out: Директория снимка
+
+    Returns:
+        True, если снимок сохранен
+    """
+    with tempfile.TemporaryDirectory(prefix="index-build-") as directory:
+        try:
+            vectordb = create_vector_db(pdf_paths, directory)
+            snapshot = export_snapshot(vectordb, out)
+        except Exception as e:
+            print(f"❌ Снимок не собран: {e}")
+            return False
+        finally:
+            release_chroma(directory)
+    size = sum(snapshot.files.values())
+    print(
+        f"✅ Снимок {snapshot.index_version} сохранен в {out}: "
+        f"{snapshot.count} чанков, размерность {snapshot.dimensions}, "
+        f"{size / 2**20:.1f} МБ"
+    )
+    return True
+
+
+def parse_stats_cli(pdf_path: str) -> bool:
+    """
+    Статистика разбора структуры документа из кэша разбора (при промахе
+    документ разбирается и кэшируется).
+
+    Args:
+        pdf_path: Путь к PDF файлу
+
+    Returns:
+        True, если документ разобран
+    """
+    if not os.path.exists(pdf_path):
+        print(f"❌ PDF файл не найден: {pdf_path}")
+        return False
+    document_sha256 = file_sha256(pdf_path)
+    cache = open_block_cache()
+    started = time.monotonic()
+    blocks = cache.load(document_sha256) if cache is not None else None
+    source = "кэш разбора"
+    if blocks is None:
+        source = "разбор PDF"
+        doc = fitz.open(pdf_path)
+        try:
+            blocks = list(iter_blocks(iter_page_texts(doc)))
+        finally:
+            doc.close()
+        if cache is not None:
+            cache.save(document_sha256, blocks)
+    elapsed = time.monotonic() - started
+    if not blocks:
+        print(f"❌ В документе нет текста: {pdf_path}")
+        return False
+
+    stats = parse_stats(blocks)
+    print(
+        f"Документ: {os.path.basename(pdf_path)} (sha256 {document_sha256[:12]}), "
+        f"парсер v{PARSER_VERSION}, источник: {source}, {elapsed:.2f}с"
+    )
+    print(
+        f"Блоков: {stats['blocks']}, разделов §: {stats['sections']}, "
+        f"частей: {stats['parts']}, подчастей: {stats['subparts']}"
+    )
+    print(
+        f"Строк вне разделов (unknown): {stats['unknown_lines']} из "
+        f"{stats['lines']} в {stats['unknown_blocks']} блоках"
+    )
+    print(
+        f"Страниц на блок: среднее {stats['pages_per_block_mean']:.2f}, "
+        f"медиана {stats['pages_per_block_median']}, "
+        f"максимум {stats['pages_per_block_max']} ({stats['longest_block']}), "
+        f"блоков на нескольких страницах: {stats['multi_page_blocks']}"
+    )
+    print("✅ Статистика построена")
+    return True
+
+
+def _synthetic_queries(vectors: np.ndarray, count: int, noise: float) -> np.ndarray:
+    """Векторы случайных чанков с гауссовым шумом (запросы без Ollama)."""
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.integers(0, len(vectors), count)]
+    queries = queries + rng.normal(0, noise / np.sqrt(vectors.shape[1]), queries.shape)
+    synthetic: np.ndarray = queries.astype(np.float32)
+    return synthetic
+
+
+def benchmark_flat(queries: int, k: int, batch_size: int, noise: float) -> bool:
+    """
+    Сравнивает поиск Chroma и плоского индекса на активной версии индекса.
+
+    Запросы - векторы случайных чанков с гауссовым шумом, поэтому Ollama
+    не нужна, а распределение запросов близко к реальным вопросам.
+
+    Args:
+        queries: Количество запросов
+        k: Количество результатов на запрос
+        batch_size: Размер пачки запросов для батчевого режима
+        noise: Стандартное отклонение шума относительно нормы вектора
+
+    Returns:
+        True, если индекс найден и замеры выполнены
+    """
+    directory = get_index_directory()
+    vectordb = load_vector_db(directory) if directory else None
+    if vectordb is None:
+        print("❌ Индекс не найден, сначала соберите его")
+        return False
+    flat_index = load_flat_index(vectordb)
+    if flat_index is None or flat_index.count() == 0:
+        print("❌ Не удалось построить плоский индекс")
+        return False
+
+    result = benchmark_search(
+        vectordb._collection,
+        flat_index,
+        _synthetic_queries(flat_index.vectors, queries, noise),
+        k,
+        batch_size,
+    )
+    size_mb = flat_index.vectors.nbytes / 2**20
+    print(
+        f"Индекс: {flat_index.count()} векторов, размерность "
+        f"{flat_index.vectors.shape[1]}, {size_mb:.1f} МБ"
+    )
+    print(f"Запросов: {result['queries']}, k={result['k']}, пачка {batch_size}")
+    print(
+        f"Chroma: {result['chroma_ms']:.3f} мс/запрос, "
+        f"пачками {result['chroma_batch_ms']:.3f} мс/запрос"
+    )
+    print(
+        f"Flat:   {result['flat_ms']:.3f} мс/запрос, "
+        f"пачками {result['flat_batch_ms']:.3f} мс/запрос"
+    )
+    print(f"Совпадение top-{k} с Chroma: {result['overlap']:.1%}")
+    print("✅ Замер завершен")
+    return True
+
+
+def flat_recall_report(
+    questions_path: Optional[str],
+    queries: int,
+    k: int,
+    dimensions: list[int],
+    reduction: str,
+    candidates: list[int],
+) -> bool:
+    """
+    Печатает recall@k и память вариантов сжатия плоского индекса
+    относительно точного поиска float32 на активной версии индекса.
+
+    Args:
+        questions_path: Файл с вопросами (по одному в строке); без него
+            запросы - векторы случайных чанков с шумом
+        queries: Количество синтетических запросов
+        k: Количество результатов на запрос
+        dimensions: Варианты размерности (0 - полная)
+        reduction: Способ понижения размерности (truncate или pca)
+        candidates: Размеры пула точной переоценки (0 - без нее)
+
+    Returns:
+        True, если индекс найден и отчет построен
+    """
+    directory = get_index_directory()
+    vectordb = load_vector_db(directory) if directory else None
+    if vectordb is None:
+        print("❌ Индекс не найден, сначала соберите его")
+        return False
+    flat_index = load_flat_index(vectordb)
+    if flat_index is None or flat_index.count() == 0:
+        print("❌ Не удалось построить плоский индекс")
+        return False
+    vectors = np.asarray(flat_index.vectors)
+
+    if questions_path:
+        with open(questions_path, encoding="utf-8") as f:
+            questions = [line.strip() for line in f if line.strip()]
+        try:
+            query_vectors = np.asarray(
+                embed_queries(create_embeddings(), questions), dtype=np.float32
+            )
+        except Exception as e:
+            print(f"❌ Не удалось получить эмбеддинги вопросов: {e}")
+            return False
+        source = f"{len(questions)} вопросов из {questions_path}"
+    else:
+        query_vectors = _synthetic_queries(vectors, queries, 0.3)
+        source = f"{queries} синтетических запросов"
+
+    settings = [
+        VectorCompression(dtype, dims, reduction)
+        for dims in dimensions
+        for dtype in ("float32", "float16", "int8")
+    ]
+    rows = recall_report(vectors, query_vectors, k, settings, candidates)
+    print(
+        f"Индекс: {len(vectors)} векторов, размерность {vectors.shape[1]}, "
+        f"float32 {vectors.nbytes / 2**20:.1f} МБ; {source}, k={k}"
+    )
+    print(
+        f"{'сжатие':<22} {'пул':>5} {'recall@' + str(k):>10} "
+        f"{'байт/вектор':>12} {'МБ':>8} {'мс/запрос':>10}"
+    )
+    for row in rows:
+        print(
+            f"{row['compression']:<22} {row['rescore']:>5} {row['recall']:>10.3f} "
+            f"{row['bytes_per_vector']:>12.0f} {row['memory_bytes'] / 2**20:>8.2f} "
+            f"{row['ms_per_query']:>10.3f}"
+        )
+    print("✅ Отчет построен")
+    return True
+
+
+def rebuild_cli(pdf_paths: Sequence[str]) -> bool:
+    """
+    Собирает новую версию индекса и делает ее активной для следующего
+    запуска; работающий сервер переключается на нее через
+    ``POST /admin/index/reload``.
+
+    Args:
+        pdf_paths: PDF файлы корпуса
+
+    Returns:
+        True, если версия собрана
+    """
+    previous = read_current_version(VECTOR_DB_PATH)
+    try:
+        handle = build_index_version(pdf_paths)
+    except Exception as e:
+        print(f"❌ Сборка не удалась: {e}")
+        return False
+    name = os.path.basename(handle.directory)
+    write_current_version(VECTOR_DB_PATH, name)
+    release_chroma(handle.directory)
+    # Прежняя версия может еще обслуживать запросы работающего сервера
+    keep = {name} if previous is None else {name, previous}
+    removed = collect_garbage(
+        VECTOR_DB_PATH, keep, get_index_keep_versions(), INGEST_CHECKPOINT_FILENAME
+    )
+    print(f"✅ Версия {name} собрана: {handle.directory}")
+    if removed:
+        print(f"Удалены старые версии: {', '.join(removed)}")
+    return True
+
+
+def main() -> None:
+    """Разбор аргументов и запуск команды."""
+    parser = argparse.ArgumentParser(description="Утилиты векторной базы")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser(
+        "rebuild",
+        help="Собрать новую версию индекса и сделать ее активной",
+    )
+    rebuild.add_argument("pdfs", nargs="*", default=get_document_paths())
+
+    build = commands.add_parser(
+        "build",
+        help="Собрать снимок индекса для загрузки при запуске без Ollama",
+    )
+    build.add_argument("pdfs", nargs="*", default=get_document_paths())
+    build.add_argument("--out", required=True, help="Директория снимка")
+
+    dedup = commands.add_parser(
+        "dedup-report",
+        help="Сколько почти повторяющихся чанков удаляется при индексации",
+    )
+    dedup.add_argument("pdf", nargs="?", default=get_document_path())
+    dedup.add_argument("--threshold", type=float, default=get_dedup_threshold())
+    dedup.add_argument("--top", type=int, default=10)
+
+    parse = commands.add_parser(
+        "parse-stats",
+        help="Статистика разбора структуры документа из кэша разбора",
+    )
+    parse.add_argument("pdf", nargs="?", default=get_document_path())
+
+    bench = commands.add_parser(
+        "benchmark-flat",
+        help="Сравнить задержку поиска Chroma и плоского индекса NumPy",
+    )
+    bench.add_argument("--queries", type=int, default=200)
+    bench.add_argument("--k", type=int, default=get_search_k())
+    bench.add_argument("--batch", type=int, default=8)
+    bench.add_argument("--noise", type=float, default=0.3)
+
+    report = commands.add_parser(
+        "flat-report",
+        help="Recall@k и память вариантов сжатия плоского индекса",
+    )
+    report.add_argument("--questions", help="Файл с вопросами, по одному в строке")
+    report.add_argument("--queries", type=int, default=200)
+    report.add_argument("--k", type=int, default=get_search_k())
+    report.add_argument("--dims", type=int, nargs="+", default=[0, 512, 256, 128])
+    report.add_argument(
+        "--reduction", choices=REDUCTIONS, default=get_flat_index_reduction()
+    )
+    report.add_argument(
+        "--rescore",
+        type=int,
+        nargs="+",
+        default=[0, get_flat_rescore_candidates()],
+    )
+
+    args = parser.parse_args()
+    if args.command == "flat-report":
+        logging.basicConfig(level=logging.WARNING)
+        ok = flat_recall_report(
+            args.questions,
+            args.queries,
+            args.k,
+            args.dims,
+            args.reduction,
+            args.rescore,
+        )
+        sys.exit(0 if ok else 1)
+    if args.command == "benchmark-flat":
+        logging.basicConfig(level=logging.WARNING)
+        sys.exit(
+            0 if benchmark_flat(args.queries, args.k, args.batch, args.noise) else 1
+        )
+    if args.command == "dedup-report":
+        sys.exit(0 if dedup_report(args.pdf, args.threshold, args.top) else 1)
+    if args.command == "parse-stats":
+        sys.exit(0 if parse_stats_cli(args.pdf) else 1)
+    if args.command == "rebuild":
+        logging.basicConfig(level=logging.INFO)
+        sys.exit(0 if rebuild_cli(args.pdfs) else 1)
+    if args.command == "build":
+        logging.basicConfig(level=logging.INFO)
+        sys.exit(0 if build_snapshot_cli(args.pdfs, args.out) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -24,6 +24,9 @@ class Config:
 
     # Пути к документам (читаем из переменных окружения)
     DOCUMENT_FILENAME = os.getenv("DOCUMENT_FILENAME", "hipaa-combined.pdf")
+    # Директория корпуса: индексируются все PDF из нее (пусто - только
+    # DOCUMENT_FILENAME)
+    DOCUMENTS_DIR = os.getenv("DOCUMENTS_DIR", "")
 
     # Настройки базы данных PostgreSQL
     POSTGRES_DB = os.getenv("POSTGRES_DB", "chatdb")
@@ -39,7 +42,79 @@ class Config:
     )
     CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1200"))
     CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+    # Удаление почти повторяющихся чанков при индексации (MinHash + LSH):
+    # минимальное сходство Жаккара шинглов, при котором чанк считается повтором
+    DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+    DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+    # Размер пачки чанков при записи в векторную базу
+    INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "64"))
+    # Эмбеддинг чанков при индексации: запросов в работе, повторы, таймаут
+    EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+    EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "5"))
+    EMBED_RETRY_BACKOFF_SECONDS = float(os.getenv("EMBED_RETRY_BACKOFF_SECONDS", "1.0"))
+    EMBED_TIMEOUT_SECONDS = float(os.getenv("EMBED_TIMEOUT_SECONDS", "120"))
+    # Дисковый кэш эмбеддингов чанков (модель, sha256 текста) между сборками
+    EMBEDDING_CACHE_ENABLED = (
+        os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    )
+    EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "1024"))
+    # Дисковый кэш разбора PDF (блоки § по sha256 документа) между сборками
+    BLOCK_CACHE_ENABLED = os.getenv("BLOCK_CACHE_ENABLED", "true").lower() == "true"
+    # Версии индекса: сколько прежних хранить для отката и сколько ждать
+    # запросов по замененной версии перед ее освобождением
+    INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "1"))
+    INDEX_DRAIN_TIMEOUT_SECONDS = float(os.getenv("INDEX_DRAIN_TIMEOUT_SECONDS", "60"))
+    # Снимок индекса, поставляемый с образом: загружается при запуске, если
+    # версий индекса еще нет (пусто - не использовать)
+    INDEX_SNAPSHOT_PATH = os.getenv("INDEX_SNAPSHOT_PATH", "/app/snapshot")
+    # Токен административного API (пусто - API выключен)
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+    # Количество процессов извлечения текста PDF: для корпуса - сколько
+    # документов разбирается параллельно (1 - последовательно)
+    INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
     SEARCH_K = int(os.getenv("SEARCH_K", "7"))
+    # Бюджет токенов контекста RAG промпта (0 - без ограничения)
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+    # Small-to-big: раскрывать найденные чанки до полного блока § раздела
+    SMALL_TO_BIG_ENABLED = os.getenv("SMALL_TO_BIG_ENABLED", "false").lower() == "true"
+    SMALL_TO_BIG_MAX_TOKENS = int(os.getenv("SMALL_TO_BIG_MAX_TOKENS", "1500"))
+    # Бэкенд векторного поиска: chroma (HNSW) или flat (точный поиск NumPy)
+    VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma").lower()
+    # Сжатие векторов плоского индекса: тип (float32/float16/int8),
+    # размерность (0 - полная) и способ ее понижения (truncate/pca)
+    FLAT_INDEX_DTYPE = os.getenv("FLAT_INDEX_DTYPE", "float32").lower()
+    FLAT_INDEX_DIMENSIONS = int(os.getenv("FLAT_INDEX_DIMENSIONS", "0"))
+    FLAT_INDEX_REDUCTION = os.getenv("FLAT_INDEX_REDUCTION", "truncate").lower()
+    # Кандидатов грубого поиска для точной переоценки float32 (0 - без нее)
+    FLAT_RESCORE_CANDIDATES = int(os.getenv("FLAT_RESCORE_CANDIDATES", "100"))
+    # Размер пула потоков для синхронных запросов к Chroma
+    SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "4"))
+    # Бюджет ожидания переформулировок вопроса, мс (0 - ждать без ограничения)
+    REWRITE_BUDGET_MS = int(os.getenv("REWRITE_BUDGET_MS", "0"))
+    # Гибридный поиск: BM25 + векторный поиск с reciprocal rank fusion
+    HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "true").lower() == "true"
+    RRF_K = int(os.getenv("RRF_K", "60"))
+    # MMR переранжирование объединенных результатов мульти-запроса: вес
+    # релевантности, пул кандидатов и максимум выбранных чанков
+    MMR_ENABLED = os.getenv("MMR_ENABLED", "false").lower() == "true"
+    MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+    MMR_CANDIDATES = int(os.getenv("MMR_CANDIDATES", "40"))
+    MMR_TOP_N = int(os.getenv("MMR_TOP_N", "10"))
+    # Прямой поиск по ссылкам на разделы (§164.512, Part 160, Subpart C)
+    CITATION_FAST_PATH_ENABLED = (
+        os.getenv("CITATION_FAST_PATH_ENABLED", "true").lower() == "true"
+    )
+
+    # Семантический кэш ответов
+    ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+    ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+    ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+
+    # Кэш эмбеддингов запросов и результатов поиска
+    QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "true").lower() == "true"
+    QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "5000"))
+    QUERY_CACHE_DISK = os.getenv("QUERY_CACHE_DISK", "false").lower() == "true"
 
     # Настройки LLM
     LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4.1")
@@ -51,6 +126,11 @@ class Config:
         """Получить URL для подключения к базе данных."""
         return f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
 
+    @property
+    def async_database_url(self) -> str:
+        """Получить URL для асинхронного подключения к базе данных (asyncpg)."""
+        return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}"
+
     @classmethod
     def get_document_path(cls, base_path: Optional[str] = None) -> str:
         """
@@ -78,6 +158,38 @@ class Config:
 
         return document_path
 
+    @classmethod
+    def get_document_paths(cls, base_path: Optional[str] = None) -> list[str]:
+        """
+        Получить пути к PDF документам корпуса.
+
+        Args:
+            base_path: Базовый путь для относительного ``DOCUMENTS_DIR``
+                (если не указан, определяется автоматически)
+
+        Returns:
+            PDF файлы ``DOCUMENTS_DIR`` по имени или единственный документ
+            ``DOCUMENT_FILENAME``, если директория не задана
+        """
+        if not cls.DOCUMENTS_DIR:
+            return [cls.get_document_path(base_path)]
+        directory = cls.DOCUMENTS_DIR
+        if not os.path.isabs(directory):
+            if base_path is None:
+                base_path = (
+                    "/app"
+                    if cls._is_running_in_docker()
+                    else os.path.dirname(os.path.dirname(__file__))
+                )
+            directory = os.path.join(base_path, directory)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            os.path.join(directory, name)
+            for name in os.listdir(directory)
+            if name.lower().endswith(".pdf")
+        )
+
     @staticmethod
     def _is_running_in_docker() -> bool:
         """
@@ -99,12 +211,22 @@ def get_document_path() -> str:
     return config.get_document_path()
 
 
+def get_document_paths() -> list[str]:
+    """Получить пути к PDF документам корпуса."""
+    return config.get_document_paths()
+
+
 # Функции для доступа к настройкам базы данных
 def get_database_url() -> str:
     """Получить URL для подключения к базе данных."""
     return config.database_url
 
 
+def get_async_database_url() -> str:
+    """Получить URL для асинхронного подключения к базе данных."""
+    return config.async_database_url
+
+
 # Функции для доступа к RAG настройкам
 def get_embedding_model() -> str:
     """Получить модель для эмбеддингов."""
@@ -126,11 +248,208 @@ def get_chunk_overlap() -> int:
     return config.CHUNK_OVERLAP
 
 
+def is_dedup_enabled() -> bool:
+    """Проверить, удаляются ли почти повторяющиеся чанки при индексации."""
+    return config.DEDUP_ENABLED
+
+
+def get_dedup_threshold() -> float:
+    """Получить порог сходства почти повторяющихся чанков."""
+    return config.DEDUP_THRESHOLD
+
+
+def get_ingest_batch_size() -> int:
+    """Получить размер пачки чанков при записи в векторную базу."""
+    return config.INGEST_BATCH_SIZE
+
+
+def get_embed_concurrency() -> int:
+    """Получить количество одновременных запросов эмбеддингов при индексации."""
+    return config.EMBED_CONCURRENCY
+
+
+def get_embed_max_retries() -> int:
+    """Получить количество повторов пачки эмбеддингов после ошибки."""
+    return config.EMBED_MAX_RETRIES
+
+
+def get_embed_retry_backoff_seconds() -> float:
+    """Получить начальную задержку перед повтором пачки эмбеддингов."""
+    return config.EMBED_RETRY_BACKOFF_SECONDS
+
+
+def get_embed_timeout_seconds() -> float:
+    """Получить таймаут запроса эмбеддингов при индексации в секундах."""
+    return config.EMBED_TIMEOUT_SECONDS
+
+
+def is_embedding_cache_enabled() -> bool:
+    """Включен ли дисковый кэш эмбеддингов чанков при индексации."""
+    return config.EMBEDDING_CACHE_ENABLED
+
+
+def get_embedding_cache_max_mb() -> int:
+    """Получить максимальный размер кэша эмбеддингов чанков в мегабайтах."""
+    return config.EMBEDDING_CACHE_MAX_MB
+
+
+def is_block_cache_enabled() -> bool:
+    """Включен ли дисковый кэш разбора PDF (блоков § разделов)."""
+    return config.BLOCK_CACHE_ENABLED
+
+
+def get_index_keep_versions() -> int:
+    """Получить количество прежних версий индекса, сохраняемых для отката."""
+    return config.INDEX_KEEP_VERSIONS
+
+
+def get_index_drain_timeout_seconds() -> float:
+    """Получить таймаут ожидания запросов по замененной версии индекса."""
+    return config.INDEX_DRAIN_TIMEOUT_SECONDS
+
+
+def get_index_snapshot_path() -> str:
+    """Получить путь к снимку индекса (пусто - снимок не используется)."""
+    return config.INDEX_SNAPSHOT_PATH
+
+
+def get_admin_token() -> str:
+    """Получить токен административного API (пустая строка - API выключен)."""
+    return config.ADMIN_TOKEN
+
+
+def get_ingest_workers() -> int:
+    """Получить количество процессов извлечения текста PDF."""
+    return config.INGEST_WORKERS
+
+
 def get_search_k() -> int:
     """Получить количество документов для поиска."""
     return config.SEARCH_K
 
 
+def get_context_token_budget() -> int:
+    """Получить бюджет токенов контекста RAG промпта."""
+    return config.CONTEXT_TOKEN_BUDGET
+
+
+def is_small_to_big_enabled() -> bool:
+    """Включено ли раскрытие чанков до родительских блоков."""
+    return config.SMALL_TO_BIG_ENABLED
+
+
+def get_small_to_big_max_tokens() -> int:
+    """Получить максимальный размер раскрываемого блока в токенах."""
+    return config.SMALL_TO_BIG_MAX_TOKENS
+
+
+def get_vector_backend() -> str:
+    """Получить бэкенд векторного поиска (chroma или flat)."""
+    return config.VECTOR_BACKEND
+
+
+def get_flat_index_dtype() -> str:
+    """Получить тип хранения сжатых векторов плоского индекса."""
+    return config.FLAT_INDEX_DTYPE
+
+
+def get_flat_index_dimensions() -> int:
+    """Получить размерность сжатых векторов плоского индекса (0 - полная)."""
+    return config.FLAT_INDEX_DIMENSIONS
+
+
+def get_flat_index_reduction() -> str:
+    """Получить способ понижения размерности векторов (truncate или pca)."""
+    return config.FLAT_INDEX_REDUCTION
+
+
+def get_flat_rescore_candidates() -> int:
+    """Получить размер пула кандидатов для точной переоценки float32."""
+    return config.FLAT_RESCORE_CANDIDATES
+
+
+def get_search_workers() -> int:
+    """Получить размер пула потоков для запросов к векторной базе."""
+    return config.SEARCH_WORKERS
+
+
+def get_rewrite_budget_ms() -> int:
+    """Получить бюджет ожидания переформулировок вопроса в миллисекундах."""
+    return config.REWRITE_BUDGET_MS
+
+
+def is_hybrid_search_enabled() -> bool:
+    """Включен ли гибридный поиск (BM25 + векторный)."""
+    return config.HYBRID_SEARCH_ENABLED
+
+
+def get_rrf_k() -> int:
+    """Получить константу сглаживания reciprocal rank fusion."""
+    return config.RRF_K
+
+
+def is_mmr_enabled() -> bool:
+    """Проверить, включено ли MMR переранжирование результатов поиска."""
+    return config.MMR_ENABLED
+
+
+def get_mmr_lambda() -> float:
+    """Получить вес релевантности MMR (0..1)."""
+    return config.MMR_LAMBDA
+
+
+def get_mmr_candidates() -> int:
+    """Получить размер пула кандидатов MMR."""
+    return config.MMR_CANDIDATES
+
+
+def get_mmr_top_n() -> int:
+    """Получить максимальное количество чанков, выбираемых MMR."""
+    return config.MMR_TOP_N
+
+
+def is_citation_fast_path_enabled() -> bool:
+    """Включен ли прямой поиск по ссылкам на разделы документа."""
+    return config.CITATION_FAST_PATH_ENABLED
+
+
+# Функции для доступа к настройкам кэша ответов
+def is_answer_cache_enabled() -> bool:
+    """Включен ли семантический кэш ответов."""
+    return config.ANSWER_CACHE_ENABLED
+
+
+def get_answer_cache_threshold() -> float:
+    """Получить порог косинусной близости для попадания в кэш ответов."""
+    return config.ANSWER_CACHE_THRESHOLD
+
+
+def get_answer_cache_max_entries() -> int:
+    """Получить максимальное количество записей в кэше ответов."""
+    return config.ANSWER_CACHE_MAX_ENTRIES
+
+
+def get_answer_cache_ttl_seconds() -> float:
+    """Получить время жизни записи кэша ответов в секундах."""
+    return config.ANSWER_CACHE_TTL_SECONDS
+
+
+# Функции для доступа к настройкам кэша запросов
+def is_query_cache_enabled() -> bool:
+    """Включен ли кэш эмбеддингов запросов и результатов поиска."""
+    return config.QUERY_CACHE_ENABLED
+
+
+def get_query_cache_max_entries() -> int:
+    """Получить максимальное количество записей каждого уровня кэша запросов."""
+    return config.QUERY_CACHE_MAX_ENTRIES
+
+
+def is_query_cache_disk_enabled() -> bool:
+    """Включен ли дисковый (sqlite) уровень кэша запросов."""
+    return config.QUERY_CACHE_DISK
+
+
 # Функции для доступа к LLM настройкам
 def get_llm_model() -> str:
     """Получить модель для генерации ответов."""
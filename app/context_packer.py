@@ -0,0 +1,257 @@
+"""Сборка контекста RAG промпта с учетом бюджета токенов."""
+
+import logging
+import math
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Optional
+
+import tiktoken
+from langchain.schema import Document
+
+from app.config import get_llm_model
+from app.near_duplicates import duplicate_sources
+
+logger = logging.getLogger(__name__)
+
+# Минимальная длина совпадения конца чанка с началом следующего,
+# которая считается перекрытием сплиттера, а не случайным совпадением
+MIN_OVERLAP_CHARS = 20
+
+
+# Имя оценки размера текста, когда словарь токенизатора недоступен
+APPROX_TOKENIZER = "chars/4"
+
+
+@lru_cache(maxsize=1)
+def _get_encoding() -> Optional[tiktoken.Encoding]:
+    """
+    Токенизатор модели LLM (для неизвестных tiktoken моделей - o200k_base).
+
+    Словарь tiktoken скачивается при первом обращении; если он недоступен
+    (нет сети и локального кэша ``TIKTOKEN_CACHE_DIR``), возвращается None.
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(get_llm_model())
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logger.warning(
+            f"Tokenizer for {get_llm_model()} is unavailable, token counts are "
+            f"estimated as {APPROX_TOKENIZER}: {e}"
+        )
+        return None
+
+
+def tokenizer_name() -> str:
+    """
+    Имя токенизатора, которым считается ``token_count`` чанков.
+
+    Записывается в манифест индекса: после смены токенизатора (модели LLM
+    или доступности словаря) размеры чанков пересчитываются.
+    """
+    encoding = _get_encoding()
+    return APPROX_TOKENIZER if encoding is None else f"tiktoken:{encoding.name}"
+
+
+def count_tokens(text: str) -> int:
+    """
+    Количество токенов текста для модели LLM.
+
+    Без словаря токенизатора используется оценка ~4 символа на токен.
+
+    Args:
+        text: Текст
+
+    Returns:
+        int: Количество токенов
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def format_context_header(metadata: dict[str, Any]) -> str:
+    """
+    Заголовок чанка в контексте: цитата, название, часть, страницы и
+    документ корпуса (и где еще в документе встречается тот же текст).
+    """
+    header = (
+        f"[{metadata['citation']}]  "
+        f"title: {metadata.get('title', '').strip()}  |  "
+        f"part: {metadata.get('part')}{metadata.get('subpart', '') or ''}  |  "
+        f"pages: {metadata.get('page_start')}-{metadata.get('page_end')}"
+    )
+    if metadata.get("doc_id"):
+        header += f"  |  document: {metadata['doc_id']}"
+    duplicates: dict[str, list[str]] = {}
+    for citation, page_start, page_end in duplicate_sources(metadata):
+        pages = (
+            str(page_start) if page_start == page_end else f"{page_start}-{page_end}"
+        )
+        duplicates.setdefault(citation, []).append(pages)
+    if duplicates:
+        header += "  |  also: " + ", ".join(
+            f"{citation} (pages {', '.join(pages)})"
+            for citation, pages in duplicates.items()
+        )
+    return header
+
+
+def merge_overlapping(first: str, second: str) -> str:
+    """
+    Склеивает два соседних чанка одного блока, убирая перекрытие сплиттера.
+
+    Args:
+        first: Текст предыдущего чанка
+        second: Текст следующего чанка
+
+    Returns:
+        str: Объединенный текст
+    """
+    for size in range(min(len(first), len(second)), MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return f"{first}\n{second}"
+
+
+def _chunk_tokens(doc: Document) -> int:
+    """Токены чанка: из метаданных индекса или подсчетом."""
+    token_count = doc.metadata.get("token_count")
+    if isinstance(token_count, int):
+        return token_count
+    return count_tokens(doc.page_content)
+
+
+def context_tokens(doc: Document) -> int:
+    """Токены документа в контексте: заголовок и текст."""
+    return count_tokens(format_context_header(doc.metadata)) + _chunk_tokens(doc)
+
+
+@dataclass
+class PackedContext:
+    """Результат сборки контекста."""
+
+    documents: list[Document]
+    tokens: int
+    tokens_before: int
+    dropped: int = 0
+    merged: int = 0
+    duplicates: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens
+
+
+def _merge_segment(docs: list[Document]) -> Document:
+    """Объединяет подряд идущие чанки одного блока в один документ."""
+    text = docs[0].page_content
+    for doc in docs[1:]:
+        text = merge_overlapping(text, doc.page_content)
+    metadata = dict(docs[0].metadata)
+    metadata["page_end"] = max(int(d.metadata.get("page_end", 0)) for d in docs)
+    metadata["merged_chunk_ids"] = [d.metadata.get("chunk_id") for d in docs]
+    metadata["token_count"] = count_tokens(text)
+    return Document(page_content=text, metadata=metadata)
+
+
+def _finish_run(run: list[tuple[int, Document]]) -> tuple[int, Document]:
+    """Фрагмент из последовательных чанков: (лучший ранг, документ)."""
+    rank = min(r for r, _ in run)
+    if len(run) == 1:
+        return rank, run[0][1]
+    return rank, _merge_segment([doc for _, doc in run])
+
+
+def pack_context(docs: list[Document], token_budget: Optional[int]) -> PackedContext:
+    """
+    Собирает контекст из найденных чанков.
+
+    1. Повторы одного и того же чанка (из разных переформулировок) удаляются.
+    2. Соседние чанки одного блока склеиваются без перекрытия.
+    3. Фрагменты добавляются в порядке ранга, пока помещаются в бюджет.
+
+    Args:
+        docs: Найденные документы в порядке ранга
+        token_budget: Бюджет токенов контекста (None или 0 - без ограничения)
+
+    Returns:
+        PackedContext: документы для промпта и статистика токенов
+    """
+    tokens_before = sum(context_tokens(d) for d in docs)
+
+    # 1. Дедупликация: позиция чанка в индексе или его текст
+    unique: list[Document] = []
+    seen: set[Any] = set()
+    for doc in docs:
+        doc_id = doc.metadata.get("doc_id")
+        block_index = doc.metadata.get("block_index")
+        chunk_index = doc.metadata.get("chunk_index")
+        key: Any = (
+            (doc_id, block_index, chunk_index)
+            if block_index is not None and chunk_index is not None
+            else doc.page_content
+        )
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(doc)
+    duplicates = len(docs) - len(unique)
+
+    # 2. Группировка соседних чанков одного блока (номера блоков свои в
+    # каждом документе корпуса); фрагмент получает ранг своего лучшего чанка
+    by_block: dict[Any, list[tuple[int, Document]]] = {}
+    for rank, doc in enumerate(unique):
+        block_index = doc.metadata.get("block_index")
+        chunk_index = doc.metadata.get("chunk_index")
+        if block_index is None or chunk_index is None:
+            by_block[("rank", rank)] = [(rank, doc)]
+        else:
+            key = (doc.metadata.get("doc_id"), block_index)
+            by_block.setdefault(key, []).append((rank, doc))
+
+    segments: list[tuple[int, Document]] = []
+    merged = 0
+    for items in by_block.values():
+        items.sort(key=lambda item: int(item[1].metadata.get("chunk_index", 0)))
+        run: list[tuple[int, Document]] = [items[0]]
+        for item in items[1:]:
+            prev_index = int(run[-1][1].metadata.get("chunk_index", 0))
+            if int(item[1].metadata.get("chunk_index", 0)) == prev_index + 1:
+                run.append(item)
+                merged += 1
+                continue
+            segments.append(_finish_run(run))
+            run = [item]
+        segments.append(_finish_run(run))
+    segments.sort(key=lambda segment: segment[0])
+
+    # 3. Упаковка в бюджет в порядке ранга
+    packed: list[Document] = []
+    tokens = 0
+    dropped = 0
+    for _, doc in segments:
+        cost = context_tokens(doc)
+        if token_budget and tokens + cost > token_budget:
+            dropped += 1
+            continue
+        packed.append(doc)
+        tokens += cost
+
+    result = PackedContext(
+        documents=packed,
+        tokens=tokens,
+        tokens_before=tokens_before,
+        dropped=dropped,
+        merged=merged,
+        duplicates=duplicates,
+    )
+    logger.info(
+        f"Context packed: {len(docs)} chunks -> {len(packed)} fragments, "
+        f"{tokens_before} -> {tokens} tokens (saved {result.tokens_saved}; "
+        f"duplicates={duplicates}, merged={merged}, dropped={dropped})"
+    )
+    return result
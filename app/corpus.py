@@ -0,0 +1,120 @@
+"""Корпус документов: id документов и фильтры поиска по ним."""
+
+import os
+import re
+from collections.abc import Iterable, Mapping
+from typing import Any, Optional
+
+# Поле метаданных чанка с id документа
+DOC_ID_KEY = "doc_id"
+
+# Разделитель id документа и позиции чанка в id записи коллекции
+RECORD_ID_SEPARATOR = "/"
+
+_SLUG_RX = re.compile(r"[^a-z0-9._-]+")
+
+
+def document_id(pdf_path: str) -> str:
+    """
+    Id документа по имени файла: ``HIPAA Combined.pdf`` -> ``hipaa-combined``.
+
+    Args:
+        pdf_path: Путь к PDF файлу
+
+    Returns:
+        Id из строчных латинских букв, цифр, ``.``, ``_`` и ``-``
+    """
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    return _SLUG_RX.sub("-", stem.lower()).strip("-.") or "document"
+
+
+def record_doc_id(record_id: str) -> str:
+    """Id документа из id записи коллекции (пусто для записей без документа)."""
+    doc_id, separator, _ = record_id.partition(RECORD_ID_SEPARATOR)
+    return doc_id if separator else ""
+
+
+def doc_filter(doc_ids: Optional[Iterable[str]]) -> Optional[dict[str, Any]]:
+    """
+    Фильтр ``where`` по документам в синтаксисе Chroma.
+
+    Args:
+        doc_ids: Id документов (None или пусто - весь корпус)
+
+    Returns:
+        Фильтр или None, если поиск идет по всему корпусу
+    """
+    ids = sorted(set(doc_ids or []))
+    if not ids:
+        return None
+    if len(ids) == 1:
+        return {DOC_ID_KEY: ids[0]}
+    return {DOC_ID_KEY: {"$in": ids}}
+
+
+def scoped_where(
+    where: Optional[Mapping[str, Any]], scope: Optional[Mapping[str, Any]]
+) -> Optional[dict[str, Any]]:
+    """Фильтр метаданных, ограниченный документами ``scope``."""
+    if scope is None:
+        return dict(where) if where else None
+    if not where:
+        return dict(scope)
+    return {"$and": [dict(where), dict(scope)]}
+
+
+def split_doc_scope(
+    where: Optional[Mapping[str, Any]],
+) -> tuple[Optional[list[str]], Optional[dict[str, Any]]]:
+    """
+    Отделяет от фильтра ``where`` условие на документы (равенство или
+    ``$in`` по ``doc_id`` на верхнем уровне или внутри ``$and``), чтобы
+    поиск перебирал только записи этих документов.
+
+    Args:
+        where: Фильтр метаданных в синтаксисе Chroma
+
+    Returns:
+        (id документов или None, остаток фильтра или None)
+    """
+    if not where:
+        return None, None
+    conditions = (
+        list(where["$and"])
+        if set(where) == {"$and"}
+        else [{k: v} for k, v in where.items()]
+    )
+    scope: Optional[set[str]] = None
+    rest: list[dict[str, Any]] = []
+    for condition in conditions:
+        doc_ids = _doc_condition(condition)
+        if doc_ids is None:
+            rest.append(dict(condition))
+        else:
+            scope = doc_ids if scope is None else scope & doc_ids
+    if scope is None:
+        return None, dict(where)
+    if not rest:
+        return sorted(scope), None
+    return sorted(scope), rest[0] if len(rest) == 1 else {"$and": rest}
+
+
+def _doc_condition(condition: Mapping[str, Any]) -> Optional[set[str]]:
+    """Id документов условия ``{"doc_id": ...}`` или None для других условий."""
+    if set(condition) != {DOC_ID_KEY}:
+        return None
+    value = condition[DOC_ID_KEY]
+    if isinstance(value, str):
+        return {value}
+    if isinstance(value, Mapping) and len(value) == 1:
+        op, operand = next(iter(value.items()))
+        if op == "$eq" and isinstance(operand, str):
+            return {operand}
+        if op == "$in":
+            return {str(v) for v in operand}
+    return None
+
+
+def scope_key(doc_ids: Optional[Iterable[str]]) -> str:
+    """Ключ области поиска для кэшей (пусто - весь корпус)."""
+    return ",".join(sorted(set(doc_ids or [])))
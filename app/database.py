@@ -1,20 +1,28 @@
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
 from datetime import datetime
 
 from sqlalchemy import Column, DateTime, Integer, String, Text, create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session, sessionmaker
 
-from app.config import get_database_url
+from app.config import get_async_database_url, get_database_url
 
 # Получаем URL базы данных из конфигурации
 DATABASE_URL = get_database_url()
+ASYNC_DATABASE_URL = get_async_database_url()
 
 # Создаем движок SQLAlchemy
 engine = create_engine(DATABASE_URL)
 
+# Асинхронный движок для обработчиков FastAPI (не блокирует event loop)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_pre_ping=True)
+
 # Создаем фабрику сессий
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
 
 # Создаем базовый класс для моделей
 
@@ -43,6 +51,12 @@ def get_db() -> Generator[Session, None, None]:
         db.close()
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """Получить асинхронную сессию базы данных"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def init_db() -> None:
     """Инициализировать базу данных (создать таблицы)"""
     Base.metadata.create_all(bind=engine)
@@ -0,0 +1,87 @@
+"""Разнообразие результатов поиска: maximal marginal relevance (MMR)."""
+
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from app.vector_compression import normalize_rows
+
+
+@dataclass
+class MMRSettings:
+    """
+    Параметры MMR переранжирования кандидатов.
+
+    ``lambda_mult`` - вес релевантности: 1 - порядок по близости к вопросу,
+    0 - только непохожесть на уже выбранные документы.
+    """
+
+    lambda_mult: float = 0.7
+    candidates: int = 40
+    top_n: int = 10
+    token_budget: int = 0
+
+    def __post_init__(self) -> None:
+        if not 0 <= self.lambda_mult <= 1:
+            raise ValueError(f"Invalid MMR lambda: {self.lambda_mult}")
+
+
+def mmr_select(
+    query: np.ndarray,
+    candidates: np.ndarray,
+    top_n: int,
+    lambda_mult: float,
+    costs: Optional[np.ndarray] = None,
+    budget: int = 0,
+) -> list[int]:
+    """
+    Жадный выбор MMR по матрице векторов кандидатов.
+
+    Близости кандидатов к запросу и друг к другу считаются двумя матричными
+    умножениями; на каждом шаге оценка ``λ·rel - (1-λ)·max_sim`` пересчитывается
+    для всех кандидатов сразу, а максимум близости к выбранным обновляется
+    строкой матрицы близостей выбранного документа.
+
+    Args:
+        query: Вектор запроса
+        candidates: Векторы кандидатов (кандидаты x измерения)
+        top_n: Максимальное количество выбранных документов
+        lambda_mult: Вес релевантности (0..1)
+        costs: Стоимость кандидатов в токенах
+        budget: Бюджет токенов (0 - без ограничения)
+
+    Returns:
+        Номера выбранных кандидатов в порядке выбора
+    """
+    if not len(candidates) or top_n <= 0:
+        return []
+    vectors = normalize_rows(candidates)
+    relevance = vectors @ normalize_rows(query)[0]
+    similarity = vectors @ vectors.T
+
+    available = np.ones(len(vectors), dtype=bool)
+    # До первого выбора штрафа за похожесть нет: берется самый релевантный
+    max_similarity: Optional[np.ndarray] = None
+    remaining = budget
+    selected: list[int] = []
+    while len(selected) < top_n:
+        if costs is not None and budget > 0:
+            available &= costs <= remaining
+        if not available.any():
+            break
+        if max_similarity is None:
+            scores = relevance.copy()
+        else:
+            scores = lambda_mult * relevance - (1 - lambda_mult) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        if max_similarity is None:
+            max_similarity = similarity[best].copy()
+        else:
+            np.maximum(max_similarity, similarity[best], out=max_similarity)
+        if costs is not None:
+            remaining -= int(costs[best])
+    return selected
@@ -0,0 +1,130 @@
+"""Разбор структуры PDF (PART / SUBPART / §) в блоки разделов без Chroma и LangChain."""
+
+import re
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from typing import Optional, Union
+
+import fitz
+
+from app.block_cache import Block
+from app.pdf_extract import iter_page_texts
+
+# ── Регэкспы для структуры документа ──────────────────────
+PART_RX = re.compile(r"^PART\s+(\d{3})", re.I)
+SUBPART_RX = re.compile(
+    r"^SUBPART\s+([A-Z])(?:[\s—\-:]+(.+))?", re.I
+)  # ← ловим доп. заголовок после SUBPART X
+HEADER_RX = re.compile(r"^\s*§\s*(\d{3}\.\d+)\s{2,}", re.I)
+
+# Версия разбора структуры документа (извлечение текста, регэкспы,
+# ParserState, iter_blocks). Увеличивается при изменениях, от которых
+# зависят блоки, - кэш разбора тогда строится заново
+PARSER_VERSION = 1
+
+
+def is_header(line: str) -> bool:
+    """Является ли строка заголовком § раздела."""
+    return bool(HEADER_RX.match(line.strip()))
+
+
+@dataclass
+class ParserState:
+    """
+    Текущая позиция в структуре документа (PART / SUBPART / §).
+
+    Хранится одно состояние на весь проход; блок запоминает его снимок
+    только в момент своего начала.
+    """
+
+    part: Optional[str] = None
+    subpart: Optional[str] = None
+    section: Optional[str] = None
+    title: Optional[str] = None
+
+    def feed(self, line: str) -> None:
+        """Обновляет состояние по очередной строке текста."""
+        if m := PART_RX.match(line):
+            self.part, self.subpart = m.group(1), None
+        elif m := SUBPART_RX.match(line):
+            self.subpart = m.group(1)
+            title = m.group(2)
+            if title:
+                # Убираем лишние точки, пробелы
+                title = re.sub(r"[\.—\-:]+", " ", title).strip()
+                self.title = title
+            else:
+                self.title = None
+        elif m := HEADER_RX.match(line):
+            self.section = m.group(1)
+            # аккуратный заголовок после номера
+            title = line.split(None, 2)[-1]
+            title = re.sub(r"^[\s\.]+", "", title).strip()
+            self.title = title
+
+
+def new_block_meta(st: ParserState, pg: int) -> dict[str, Union[str, int]]:
+    """Метаданные нового блока § по текущему состоянию парсера."""
+    cite = f"§{st.section}" if st.section else "unknown"
+    suf = st.section.split(".")[1] if st.section else "xx"
+    cid = f"{st.part}-{suf}-00"
+    return {
+        "part": st.part or "unknown",
+        "subpart": st.subpart or "unknown",
+        "section": st.section or "unknown",
+        "title": st.title or "unknown",
+        "page_start": pg,
+        "page_end": pg,
+        "chunk_id": cid,
+        "citation": cite,
+    }
+
+
+def iter_blocks(
+    pages: Iterable[tuple[int, str]], state: Optional[ParserState] = None
+) -> Iterator[Block]:
+    """
+    Склеивает строки страниц в блоки § разделов.
+
+    Args:
+        pages: Поток (номер страницы, текст)
+        state: Начальное состояние парсера
+
+    Yields:
+        Метаданные блока с полным текстом блока в ключе ``text``
+    """
+    state = state if state is not None else ParserState()
+    cur_meta: Optional[dict[str, Union[str, int]]] = None
+    buf: list[str] = []
+    for pg, text in pages:
+        for line in text.splitlines():
+            state.feed(line)
+            if cur_meta is None:
+                cur_meta = new_block_meta(state, pg)
+            elif is_header(line) and state.section != cur_meta["section"]:
+                if any(s.strip() for s in buf):
+                    cur_meta["text"] = "\n".join(buf)
+                    yield cur_meta
+                cur_meta, buf = new_block_meta(state, pg), []
+            buf.append(line)
+            cur_meta["page_end"] = pg
+    if any(s.strip() for s in buf) and cur_meta is not None:
+        cur_meta["text"] = "\n".join(buf)
+        yield cur_meta
+
+
+def parse_document(pdf_path: str) -> tuple[int, list[Block]]:
+    """
+    Разбирает PDF целиком (задание процесса-воркера индексации корпуса).
+
+    Args:
+        pdf_path: Путь к PDF файлу
+
+    Returns:
+        (количество страниц, блоки с текстом в ключе ``text``)
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        return doc.page_count, list(iter_blocks(iter_page_texts(doc)))
+    finally:
+        doc.close()
@@ -0,0 +1,212 @@
+"""Дисковый кэш эмбеддингов чанков, адресуемый по содержимому."""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+import numpy as np
+
+from app.index_manifest import content_hash
+
+logger = logging.getLogger(__name__)
+
+# Максимальное количество параметров в одном запросе sqlite
+SQL_BATCH_SIZE = 500
+
+
+class EmbeddingCache:
+    """
+    Эмбеддинги чанков по ключу (модель эмбеддингов, sha256 текста).
+
+    Векторы хранятся в sqlite как float32 blob и переживают пересборки
+    индекса: при смене параметров чанкинга большинство текстов не меняется
+    и не отправляется в Ollama повторно. При превышении ``max_bytes``
+    вытесняются давно не использованные записи.
+    """
+
+    def __init__(self, path: str, max_bytes: int) -> None:
+        """
+        Args:
+            path: Файл sqlite
+            max_bytes: Максимальный суммарный размер векторов в байтах
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_embeddings ("
+                "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, "
+                "used REAL NOT NULL, PRIMARY KEY (model, hash))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS chunk_embeddings_used "
+                "ON chunk_embeddings (used)"
+            )
+        row = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM chunk_embeddings"
+        ).fetchone()
+        self.entries, self.size_bytes = int(row[0]), int(row[1])
+
+    def get_many(self, model: str, hashes: list[str]) -> dict[str, list[float]]:
+        """
+        Векторы для хешей текстов, найденных в кэше.
+
+        Args:
+            model: Модель эмбеддингов
+            hashes: Хеши текстов
+
+        Returns:
+            Хеш -> вектор для найденных записей
+        """
+        found: dict[str, list[float]] = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock, self._conn:
+            for start in range(0, len(unique), SQL_BATCH_SIZE):
+                batch = unique[start : start + SQL_BATCH_SIZE]
+                marks = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    "SELECT hash, vector FROM chunk_embeddings "
+                    f"WHERE model = ? AND hash IN ({marks})",
+                    (model, *batch),
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+                if rows:
+                    self._conn.execute(
+                        "UPDATE chunk_embeddings SET used = ? "
+                        f"WHERE model = ? AND hash IN ({marks})",
+                        (time.time(), model, *batch),
+                    )
+            self.hits += sum(1 for key in hashes if key in found)
+            self.misses += sum(1 for key in hashes if key not in found)
+        return found
+
+    def put_many(self, model: str, items: list[tuple[str, list[float]]]) -> None:
+        """
+        Сохраняет векторы и вытесняет старые записи сверх лимита размера.
+
+        Args:
+            model: Модель эмбеддингов
+            items: Пары (хеш текста, вектор)
+        """
+        now = time.time()
+        rows = [
+            (model, key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for key, vector in items
+        ]
+        with self._lock, self._conn:
+            for row in rows:
+                # Тот же текст мог быть записан другим потоком
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO chunk_embeddings VALUES (?, ?, ?, ?)", row
+                )
+                if cursor.rowcount:
+                    self.entries += 1
+                    self.size_bytes += len(row[2])
+            if self.size_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self) -> None:
+        """Удаляет давно не использованные записи до лимита размера."""
+        excess = self.size_bytes - self.max_bytes
+        rows = self._conn.execute(
+            "SELECT rowid, LENGTH(vector) FROM chunk_embeddings ORDER BY used"
+        )
+        victims: list[int] = []
+        freed = 0
+        for rowid, size in rows:
+            if freed >= excess:
+                break
+            victims.append(rowid)
+            freed += size
+        for start in range(0, len(victims), SQL_BATCH_SIZE):
+            batch = victims[start : start + SQL_BATCH_SIZE]
+            self._conn.execute(
+                "DELETE FROM chunk_embeddings "
+                f"WHERE rowid IN ({','.join('?' * len(batch))})",
+                batch,
+            )
+        self.entries -= len(victims)
+        self.size_bytes -= freed
+        self.evicted += len(victims)
+
+    def stats(self) -> dict[str, Any]:
+        """Счетчики попаданий/промахов и размер кэша."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evicted": self.evicted,
+                "entries": self.entries,
+                "size_bytes": self.size_bytes,
+            }
+
+    def log_stats(self) -> None:
+        """Логирует статистику кэша за сборку."""
+        stats = self.stats()
+        logger.info(
+            f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses "
+            f"({stats['hit_rate']:.0%} hit rate), {stats['evicted']} evicted, "
+            f"{stats['entries']} entries, {stats['size_bytes'] / 2**20:.1f} MB"
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @classmethod
+    def open(cls, path: str, max_bytes: int) -> Optional["EmbeddingCache"]:
+        """Открывает кэш или возвращает None, если файл недоступен."""
+        try:
+            return cls(path, max_bytes)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Embedding cache disabled: {e}")
+            return None
+
+
+class CachedEmbeddings:
+    """
+    Обертка клиента эмбеддингов: ``embed_documents`` берет векторы из
+    кэша и отправляет в модель только тексты, которых в кэше нет.
+    """
+
+    def __init__(self, embeddings: Any, cache: EmbeddingCache, model: str) -> None:
+        """
+        Args:
+            embeddings: Клиент эмбеддингов LangChain
+            cache: Кэш эмбеддингов
+            model: Модель эмбеддингов (часть ключа кэша)
+        """
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        hashes = [content_hash(text) for text in texts]
+        found = self.cache.get_many(self.model, hashes)
+        missing = [i for i, key in enumerate(hashes) if key not in found]
+        if missing:
+            computed: list[list[float]] = self.embeddings.embed_documents(
+                [texts[i] for i in missing]
+            )
+            items = [
+                (hashes[i], vector) for i, vector in zip(missing, computed, strict=True)
+            ]
+            self.cache.put_many(self.model, items)
+            found.update(items)
+        return [found[key] for key in hashes]
+
+    def embed_query(self, text: str) -> list[float]:
+        vector: list[float] = self.embeddings.embed_query(text)
+        return vector
@@ -0,0 +1,114 @@
+"""Пакетный конкурентный эмбеддинг чанков при индексации."""
+
+import logging
+import threading
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Generic, TypeVar
+
+logger = logging.getLogger(__name__)
+
+B = TypeVar("B")
+
+
+class EmbeddingExecutor(Generic[B]):
+    """
+    Эмбеддинг пачек текстов с ограниченным числом запросов в работе и
+    повторами с экспоненциальной задержкой.
+
+    Пачки отдаются строго в порядке поступления, поэтому запись в векторную
+    базу и чекпоинт продвигаются последовательно даже при конкурентных
+    запросах к Ollama.
+    """
+
+    def __init__(
+        self,
+        embeddings: Any,
+        max_in_flight: int = 4,
+        max_retries: int = 5,
+        backoff_seconds: float = 1.0,
+    ) -> None:
+        """
+        Args:
+            embeddings: Клиент эмбеддингов LangChain (embed_documents)
+            max_in_flight: Максимальное количество одновременных запросов
+            max_retries: Количество повторов пачки после ошибки
+            backoff_seconds: Начальная задержка перед повтором (удваивается)
+        """
+        self.embeddings = embeddings
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.retries = 0
+        # Останавливает повторы остальных пачек, когда поток прерван
+        self._stopped = threading.Event()
+
+    def embed_with_retry(self, texts: list[str]) -> list[list[float]]:
+        """
+        Эмбеддинг одной пачки с повторами.
+
+        Args:
+            texts: Тексты пачки
+
+        Returns:
+            Векторы в том же порядке
+
+        Raises:
+            Exception: Ошибка последней попытки, если все повторы исчерпаны
+        """
+        attempt = 0
+        while True:
+            try:
+                vectors: list[list[float]] = self.embeddings.embed_documents(texts)
+                return vectors
+            except Exception as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff_seconds * 2**attempt
+                attempt += 1
+                self.retries += 1
+                logger.warning(
+                    f"Embedding batch of {len(texts)} failed ({e}), "
+                    f"retry {attempt}/{self.max_retries} in {delay:.1f}s"
+                )
+                if self._stopped.wait(delay):
+                    raise
+
+    def map(
+        self, batches: Iterable[tuple[B, list[str]]]
+    ) -> Iterator[tuple[B, list[list[float]]]]:
+        """
+        Эмбеддинг потока пачек.
+
+        Args:
+            batches: Поток (пачка, тексты пачки); пачка возвращается как есть
+
+        Yields:
+            (пачка, векторы) в порядке поступления
+        """
+        source = iter(batches)
+        self._stopped.clear()
+        with ThreadPoolExecutor(
+            max_workers=self.max_in_flight, thread_name_prefix="ingest-embed"
+        ) as pool:
+            pending: deque[tuple[B, Future[list[list[float]]]]] = deque()
+
+            def submit_next() -> None:
+                item = next(source, None)
+                if item is not None:
+                    batch, texts = item
+                    pending.append((batch, pool.submit(self.embed_with_retry, texts)))
+
+            for _ in range(self.max_in_flight):
+                submit_next()
+            try:
+                while pending:
+                    batch, future = pending.popleft()
+                    vectors = future.result()
+                    submit_next()
+                    yield batch, vectors
+            finally:
+                self._stopped.set()
+                for _, future in pending:
+                    future.cancel()
@@ -0,0 +1,167 @@
+"""Клиент эмбеддингов Ollama с постоянным HTTP-соединением и батчингом."""
+
+import logging
+import math
+from typing import Any, Optional
+
+import requests
+from langchain_community.embeddings import OllamaEmbeddings
+from pydantic import PrivateAttr
+
+from app.config import get_embedding_model, get_ollama_embedding_base_url
+
+logger = logging.getLogger(__name__)
+
+# Формат векторов клиента эмбеддингов. Хранится в метаданных коллекции и
+# манифесте индекса: индекс с векторами другого формата (например,
+# ненормированными до перехода на L2-нормализацию) пересобирается, иначе
+# нормированные векторы запросов сравнивались бы с ненормированными
+EMBEDDING_FORMAT = "l2-normalized"
+
+
+def _normalize(vector: list[float]) -> list[float]:
+    """L2-нормализация вектора (как в батчевом /api/embed Ollama)."""
+    norm = math.sqrt(sum(x * x for x in vector))
+    if norm == 0:
+        return vector
+    return [x / norm for x in vector]
+
+
+class KeepAliveOllamaEmbeddings(OllamaEmbeddings):
+    """
+    OllamaEmbeddings, который переиспользует одну HTTP-сессию (keep-alive)
+    вместо нового соединения на каждый запрос эмбеддинга и отправляет
+    несколько текстов одним батчевым запросом /api/embed.
+
+    Векторы всегда L2-нормализованы, независимо от того, доступен ли на
+    сервере батчевый эндпоинт или используется старый /api/embeddings.
+    """
+
+    batch_size: int = 64
+    """Максимальное количество текстов в одном запросе /api/embed"""
+
+    timeout: Optional[float] = None
+    """Таймаут HTTP-запроса к Ollama в секундах (None - без ограничения)"""
+
+    _session: requests.Session = PrivateAttr(default_factory=requests.Session)
+    _batch_supported: bool = PrivateAttr(default=True)
+
+    def _headers(self) -> dict[str, str]:
+        return {
+            "Content-Type": "application/json",
+            **(self.headers or {}),
+        }
+
+    def _embed_batch(self, input: list[str]) -> list[list[float]]:
+        """Запрашивает эмбеддинги нескольких строк одним запросом /api/embed."""
+        try:
+            res = self._session.post(
+                f"{self.base_url}/api/embed",
+                headers=self._headers(),
+                json={"input": input, **self._default_params},
+                timeout=self.timeout,
+            )
+        except requests.exceptions.RequestException as e:
+            raise ValueError(f"Error raised by inference endpoint: {e}")
+
+        if res.status_code == 404:
+            # Старый сервер Ollama без батчевого эндпоинта
+            logger.warning("Ollama /api/embed is not available, using /api/embeddings")
+            self._batch_supported = False
+            return [_normalize(self._process_emb_response(text)) for text in input]
+
+        if res.status_code != 200:
+            raise ValueError(
+                "Error raised by inference API HTTP code: %s, %s"
+                % (res.status_code, res.text)
+            )
+        try:
+            embeddings: list[list[float]] = res.json()["embeddings"]
+        except requests.exceptions.JSONDecodeError as e:
+            raise ValueError(
+                f"Error raised by inference API: {e}.\nResponse: {res.text}"
+            )
+        return [_normalize(vector) for vector in embeddings]
+
+    def _embed(self, input: list[str]) -> list[list[float]]:
+        if not self._batch_supported:
+            return [_normalize(self._process_emb_response(text)) for text in input]
+
+        vectors: list[list[float]] = []
+        for start in range(0, len(input), self.batch_size):
+            vectors.extend(self._embed_batch(input[start : start + self.batch_size]))
+        return vectors
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """
+        Эмбеддинги нескольких поисковых запросов одним батчевым запросом.
+
+        Args:
+            texts: Тексты запросов
+
+        Returns:
+            Векторы в том же порядке
+        """
+        return self._embed([f"{self.query_instruction}{text}" for text in texts])
+
+    def _process_emb_response(self, input: str) -> list[float]:
+        """Запрашивает эмбеддинг одной строки через постоянную сессию."""
+        try:
+            res = self._session.post(
+                f"{self.base_url}/api/embeddings",
+                headers=self._headers(),
+                json={"model": self.model, "prompt": input, **self._default_params},
+                timeout=self.timeout,
+            )
+        except requests.exceptions.RequestException as e:
+            raise ValueError(f"Error raised by inference endpoint: {e}")
+
+        if res.status_code != 200:
+            raise ValueError(
+                "Error raised by inference API HTTP code: %s, %s"
+                % (res.status_code, res.text)
+            )
+        try:
+            embedding: list[float] = res.json()["embedding"]
+            return embedding
+        except requests.exceptions.JSONDecodeError as e:
+            raise ValueError(
+                f"Error raised by inference API: {e}.\nResponse: {res.text}"
+            )
+
+    def close(self) -> None:
+        """Закрывает HTTP-сессию."""
+        self._session.close()
+
+
+def embed_queries(embeddings: Any, texts: list[str]) -> list[list[float]]:
+    """
+    Эмбеддинги поисковых запросов, батчем, если клиент это поддерживает.
+
+    Args:
+        embeddings: Клиент эмбеддингов LangChain
+        texts: Тексты запросов
+
+    Returns:
+        Векторы в том же порядке
+    """
+    if isinstance(embeddings, KeepAliveOllamaEmbeddings):
+        return embeddings.embed_queries(texts)
+    return [embeddings.embed_query(text) for text in texts]
+
+
+def create_embeddings(**kwargs: Any) -> KeepAliveOllamaEmbeddings:
+    """
+    Создает клиент эмбеддингов с настройками из конфигурации.
+
+    Args:
+        **kwargs: Дополнительные параметры OllamaEmbeddings
+
+    Returns:
+        KeepAliveOllamaEmbeddings: клиент эмбеддингов
+    """
+    return KeepAliveOllamaEmbeddings(
+        model=get_embedding_model(),
+        base_url=get_ollama_embedding_base_url(),
+        **kwargs,
+    )
@@ -0,0 +1,664 @@
+"""Плоский векторный индекс на NumPy: точный косинусный поиск без Chroma."""
+
+import json
+import logging
+import os
+import time
+import uuid
+from collections.abc import Iterable, Mapping, Sequence
+from dataclasses import asdict
+from typing import Any, Optional
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from app.corpus import DOC_ID_KEY, split_doc_scope
+from app.vector_compression import (
+    CompressedVectors,
+    VectorCompression,
+    normalize_rows,
+    rescore,
+    take_rows,
+    top_k,
+)
+
+logger = logging.getLogger(__name__)
+
+# Версия формата файлов индекса
+FLAT_INDEX_FORMAT = 1
+
+# Файлы индекса в директории версии: матрица векторов и колонки метаданных
+FLAT_VECTORS_FILENAME = "flat_vectors.npy"
+FLAT_METADATA_FILENAME = "flat_metadata.json"
+# Сжатые векторы для грубого поиска (FLAT_INDEX_DTYPE / FLAT_INDEX_DIMENSIONS)
+FLAT_COARSE_FILENAME = "flat_coarse.npz"
+
+# Поля, которые можно запросить в query/get (как в коллекции Chroma)
+QUERY_INCLUDE = ("documents", "metadatas", "distances")
+GET_INCLUDE = ("documents", "metadatas")
+
+
+def _column_array(values: list[Any]) -> np.ndarray:
+    """Колонка метаданных как numpy-массив для векторной фильтрации."""
+    present = [v for v in values if v is not None]
+    if len(present) == len(values):
+        if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+            return np.asarray(values, dtype=np.int64)
+        if all(isinstance(v, float) for v in values):
+            return np.asarray(values, dtype=np.float64)
+    array = np.empty(len(values), dtype=object)
+    array[:] = values
+    return array
+
+
+class FlatIndex:
+    """
+    Плоский индекс эмбеддингов чанков одной версии.
+
+    Векторы хранятся нормированной матрицей float32 в ``.npy`` и открываются
+    через ``np.load(mmap_mode="r")``: страницы читаются с диска по мере
+    обращения и делятся между процессами. Тексты и метаданные хранятся
+    по колонкам в JSON, фильтр ``where`` вычисляется как маска по колонкам.
+
+    Поиск - одно матричное умножение на пачку запросов и ``argpartition``
+    для top-k, без HNSW: для тысяч чанков это быстрее и точнее.
+
+    Со сжатием (``coarse``) поиск двухэтапный: top-N по сжатым векторам в
+    памяти, затем точная переоценка N кандидатов по float32 из mmap - с
+    диска читаются только строки кандидатов.
+
+    Записи упорядочены по id, поэтому чанки одного документа корпуса
+    занимают непрерывный диапазон строк. Фильтр по ``doc_id`` не
+    вычисляется маской по всему корпусу: поиск умножает запрос только на
+    строки выбранных документов, и его время зависит от их размера, а не
+    от размера корпуса.
+
+    Методы ``query``, ``get``, ``count`` повторяют подмножество API
+    коллекции Chroma, которым пользуется поиск.
+    """
+
+    def __init__(
+        self,
+        ids: list[str],
+        documents: list[str],
+        columns: dict[str, list[Any]],
+        vectors: np.ndarray,
+        index_version: str,
+        coarse: Optional[CompressedVectors] = None,
+        compression: Optional[VectorCompression] = None,
+        rescore_candidates: int = 0,
+    ) -> None:
+        """
+        Args:
+            ids: Id записей коллекции Chroma
+            documents: Тексты чанков
+            columns: Поле метаданных -> значения по записям (None - нет поля)
+            vectors: Нормированная матрица эмбеддингов (записи x размерность)
+            index_version: Версия векторного индекса, по которой построен
+            coarse: Сжатые векторы для грубого поиска
+            compression: Параметры сжатия ``coarse``
+            rescore_candidates: Размер пула точной переоценки (0 - без нее)
+        """
+        self.ids = ids
+        self.documents = documents
+        self.columns = columns
+        self.vectors = vectors
+        self.index_version = index_version
+        self.coarse = coarse
+        self.compression = compression or VectorCompression()
+        self.rescore_candidates = rescore_candidates
+        self.positions = {record_id: i for i, record_id in enumerate(ids)}
+        self._arrays: dict[str, np.ndarray] = {}
+        self._doc_rows: Optional[dict[str, np.ndarray]] = None
+
+    @property
+    def id(self) -> str:
+        return self.index_version
+
+    @property
+    def metadata(self) -> dict[str, Any]:
+        return {"index_version": self.index_version}
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_records(
+        cls,
+        ids: list[str],
+        documents: list[str],
+        metadatas: Sequence[Optional[Mapping[str, Any]]],
+        embeddings: Any,
+        index_version: str,
+        compression: Optional[VectorCompression] = None,
+    ) -> "FlatIndex":
+        """
+        Строит индекс по записям коллекции.
+
+        Args:
+            ids: Id записей
+            documents: Тексты чанков
+            metadatas: Метаданные записей
+            embeddings: Эмбеддинги записей
+            index_version: Версия векторного индекса
+            compression: Параметры сжатия векторов для грубого поиска
+
+        Returns:
+            FlatIndex
+        """
+        # Записи по id: чанки одного документа корпуса идут подряд
+        order = sorted(range(len(ids)), key=ids.__getitem__)
+        ids = [ids[i] for i in order]
+        documents = [documents[i] for i in order]
+        metadatas = [metadatas[i] for i in order]
+        if len(ids):
+            embeddings = np.asarray(embeddings, dtype=np.float32)[order]
+        names: list[str] = []
+        for metadata in metadatas:
+            names += [name for name in metadata or {} if name not in names]
+        columns = {
+            name: [(metadata or {}).get(name) for metadata in metadatas]
+            for name in names
+        }
+        vectors = normalize_rows(embeddings) if len(ids) else np.zeros((0, 0))
+        compression = compression or VectorCompression()
+        coarse = (
+            CompressedVectors.encode(vectors, compression)
+            if compression.enabled and len(ids)
+            else None
+        )
+        return cls(ids, documents, columns, vectors, index_version, coarse, compression)
+
+    def save(self, directory: str) -> None:
+        """Сохраняет матрицу векторов и колонки метаданных."""
+        vectors_path = os.path.join(directory, FLAT_VECTORS_FILENAME)
+        with open(f"{vectors_path}.tmp", "wb") as f:
+            np.save(f, np.asarray(self.vectors, dtype=np.float32))
+        os.replace(f"{vectors_path}.tmp", vectors_path)
+
+        coarse_path = os.path.join(directory, FLAT_COARSE_FILENAME)
+        if self.coarse is not None:
+            self.coarse.save(f"{coarse_path}.tmp")
+            os.replace(f"{coarse_path}.tmp", coarse_path)
+        elif os.path.exists(coarse_path):
+            os.remove(coarse_path)
+
+        metadata_path = os.path.join(directory, FLAT_METADATA_FILENAME)
+        data = {
+            "format": FLAT_INDEX_FORMAT,
+            "index_version": self.index_version,
+            "ids": self.ids,
+            "documents": self.documents,
+            "columns": self.columns,
+            "compression": asdict(self.compression) if self.coarse else None,
+        }
+        with open(f"{metadata_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(f"{metadata_path}.tmp", metadata_path)
+
+    @classmethod
+    def load(cls, directory: str, rescore_candidates: int = 0) -> "FlatIndex":
+        """
+        Загружает индекс; матрица векторов отображается в память, сжатые
+        векторы читаются целиком.
+
+        Args:
+            directory: Директория версии индекса
+            rescore_candidates: Размер пула точной переоценки (0 - без нее)
+
+        Raises:
+            ValueError: Если формат файла не поддерживается или файлы
+                не соответствуют друг другу
+        """
+        with open(
+            os.path.join(directory, FLAT_METADATA_FILENAME), encoding="utf-8"
+        ) as f:
+            data = json.load(f)
+        if data.get("format") != FLAT_INDEX_FORMAT:
+            raise ValueError(f"Unsupported flat index format: {data.get('format')}")
+        vectors = np.load(os.path.join(directory, FLAT_VECTORS_FILENAME), mmap_mode="r")
+        if vectors.shape[0] != len(data["ids"]):
+            raise ValueError(
+                f"Flat index has {vectors.shape[0]} vectors for "
+                f"{len(data['ids'])} records"
+            )
+        coarse = None
+        compression = None
+        if data.get("compression"):
+            compression = VectorCompression(**data["compression"])
+            coarse = CompressedVectors.load(
+                os.path.join(directory, FLAT_COARSE_FILENAME)
+            )
+        return cls(
+            data["ids"],
+            data["documents"],
+            data["columns"],
+            vectors,
+            data["index_version"],
+            coarse,
+            compression,
+            rescore_candidates,
+        )
+
+    def _column(self, name: str) -> Optional[np.ndarray]:
+        if name not in self.columns:
+            return None
+        if name not in self._arrays:
+            self._arrays[name] = _column_array(self.columns[name])
+        return self._arrays[name]
+
+    def doc_rows(self, doc_ids: Iterable[str]) -> np.ndarray:
+        """
+        Номера записей документов корпуса по возрастанию.
+
+        Args:
+            doc_ids: Id документов
+
+        Returns:
+            Массив номеров записей (пустой, если документов нет в индексе)
+        """
+        if self._doc_rows is None:
+            groups: dict[str, list[int]] = {}
+            for i, doc_id in enumerate(self.columns.get(DOC_ID_KEY, [])):
+                if doc_id is not None:
+                    groups.setdefault(str(doc_id), []).append(i)
+            self._doc_rows = {
+                doc_id: np.asarray(rows, dtype=np.int64)
+                for doc_id, rows in groups.items()
+            }
+        found = [self._doc_rows[d] for d in set(doc_ids) if d in self._doc_rows]
+        if not found:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate(found))
+
+    def where_mask(
+        self, where: Mapping[str, Any], rows: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Маска записей, подходящих под фильтр метаданных в синтаксисе Chroma
+        (равенство, ``$eq``/``$ne``/``$gt``/``$gte``/``$lt``/``$lte``/
+        ``$in``/``$nin``, ``$and``/``$or``).
+
+        Args:
+            where: Фильтр метаданных
+            rows: Номера проверяемых записей (None - все записи)
+
+        Returns:
+            Маска по записям ``rows``
+
+        Raises:
+            ValueError: Если оператор не поддерживается
+        """
+        size = len(self.ids) if rows is None else len(rows)
+        mask = np.ones(size, dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for sub in condition:
+                    mask &= self.where_mask(sub, rows)
+            elif key == "$or":
+                any_mask = np.zeros(size, dtype=bool)
+                for sub in condition:
+                    any_mask |= self.where_mask(sub, rows)
+                mask &= any_mask
+            else:
+                mask &= self._field_mask(key, condition, rows)
+        return mask
+
+    def _field_mask(
+        self, name: str, condition: Any, rows: Optional[np.ndarray]
+    ) -> np.ndarray:
+        column = self._column(name)
+        size = len(self.ids) if rows is None else len(rows)
+        if column is None:
+            return np.zeros(size, dtype=bool)
+        if rows is not None:
+            column = column[rows]
+        if not isinstance(condition, Mapping):
+            condition = {"$eq": condition}
+        mask = np.ones(size, dtype=bool)
+        for op, value in condition.items():
+            if op == "$eq":
+                mask &= column == value
+            elif op == "$ne":
+                mask &= column != value
+            elif op == "$in":
+                mask &= np.isin(column, list(value))
+            elif op == "$nin":
+                mask &= ~np.isin(column, list(value))
+            elif op in ("$gt", "$gte", "$lt", "$lte") and column.dtype == object:
+                raise ValueError(f"Field {name} is not numeric, {op} unsupported")
+            elif op == "$gt":
+                mask &= column > value
+            elif op == "$gte":
+                mask &= column >= value
+            elif op == "$lt":
+                mask &= column < value
+            elif op == "$lte":
+                mask &= column <= value
+            else:
+                raise ValueError(f"Unsupported where operator: {op}")
+        return mask
+
+    def search(
+        self,
+        vectors: Any,
+        k: int,
+        mask: Optional[np.ndarray] = None,
+        rows: Optional[np.ndarray] = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k по косинусной близости для пачки запросов.
+
+        Args:
+            vectors: Векторы запросов (запросы x размерность)
+            k: Количество результатов на запрос
+            mask: Допустимые записи (фильтр метаданных) среди ``rows``
+            rows: Номера записей, среди которых идет поиск, по возрастанию
+                (None - все записи)
+
+        Returns:
+            Номера записей и косинусные близости, отсортированные по убыванию
+            (запросы x min(k, число допустимых записей)); без переоценки
+            близости сжатого индекса приближенные
+        """
+        queries = normalize_rows(vectors)
+        if self.coarse is None:
+            matrix = self.vectors if rows is None else take_rows(self.vectors, rows)
+            top, scores = top_k(queries @ matrix.T, k, mask)
+            return (top if rows is None else rows[top]), scores
+        scores = self.coarse.scores(queries, rows)
+        if self.rescore_candidates <= 0:
+            top, scores = top_k(scores, k, mask)
+            return (top if rows is None else rows[top]), scores
+        candidates, _ = top_k(scores, max(self.rescore_candidates, k), mask)
+        if rows is not None:
+            candidates = rows[candidates]
+        return rescore(queries, self.vectors, candidates, k)
+
+    def metadata_at(self, position: int) -> dict[str, Any]:
+        """Метаданные записи (без отсутствующих полей)."""
+        return {
+            name: values[position]
+            for name, values in self.columns.items()
+            if values[position] is not None
+        }
+
+    def _records(
+        self, positions: Iterable[int], include: Iterable[str]
+    ) -> dict[str, list[Any]]:
+        positions = list(positions)
+        records: dict[str, list[Any]] = {"ids": [self.ids[i] for i in positions]}
+        if "documents" in include:
+            records["documents"] = [self.documents[i] for i in positions]
+        if "metadatas" in include:
+            records["metadatas"] = [self.metadata_at(i) for i in positions]
+        if "embeddings" in include:
+            records["embeddings"] = [self.vectors[i].tolist() for i in positions]
+        return records
+
+    def query(
+        self,
+        query_embeddings: Any,
+        n_results: int = 10,
+        where: Optional[Mapping[str, Any]] = None,
+        include: Iterable[str] = QUERY_INCLUDE,
+    ) -> dict[str, Any]:
+        """
+        k-NN поиск в формате ``Collection.query`` Chroma.
+
+        Args:
+            query_embeddings: Векторы запросов
+            n_results: Количество результатов на запрос
+            where: Фильтр метаданных
+            include: Поля результата (documents, metadatas, distances,
+                embeddings)
+
+        Returns:
+            Словарь ids/documents/metadatas/distances со списком на запрос;
+            расстояние - косинусное (1 - близость)
+        """
+        include = list(include)
+        # Условие на документы ограничивает перебираемые строки, остальной
+        # фильтр - маска по этим строкам
+        doc_ids, rest = split_doc_scope(where)
+        rows = self.doc_rows(doc_ids) if doc_ids is not None else None
+        mask = self.where_mask(rest, rows) if rest else None
+        top, scores = self.search(query_embeddings, n_results, mask, rows)
+        results: dict[str, Any] = {"ids": [], "documents": [], "metadatas": []}
+        results["distances"] = []
+        results["embeddings"] = []
+        for positions, similarities in zip(top, scores, strict=True):
+            records = self._records(positions.tolist(), include)
+            for name, values in records.items():
+                results[name].append(values)
+            if "distances" in include:
+                results["distances"].append((1.0 - similarities).tolist())
+        return {
+            name: values
+            for name, values in results.items()
+            if name == "ids" or name in include
+        }
+
+    def get(
+        self,
+        ids: Optional[list[str]] = None,
+        where: Optional[Mapping[str, Any]] = None,
+        include: Iterable[str] = GET_INCLUDE,
+    ) -> dict[str, Any]:
+        """
+        Записи по id и/или фильтру в формате ``Collection.get`` Chroma.
+
+        Args:
+            ids: Id записей (отсутствующие пропускаются)
+            where: Фильтр метаданных
+            include: Поля результата (documents, metadatas, embeddings)
+
+        Returns:
+            Словарь ids/documents/metadatas
+        """
+        if ids is not None:
+            positions = [self.positions[i] for i in ids if i in self.positions]
+        else:
+            doc_ids, _ = split_doc_scope(where)
+            positions = (
+                list(range(len(self.ids)))
+                if doc_ids is None
+                else self.doc_rows(doc_ids).tolist()
+            )
+        if where:
+            rows = np.asarray(positions, dtype=np.int64)
+            positions = rows[self.where_mask(where, rows)].tolist()
+        return self._records(positions, list(include))
+
+
+class FlatVectorStore(VectorStore):
+    """
+    Векторное хранилище LangChain поверх ``FlatIndex``.
+
+    Подменяет Chroma на пути запроса: ``_collection`` отдает тот же API
+    ``query``/``get``, ``as_retriever`` - стандартный ретривер LangChain.
+    Индекс экспортируется из Chroma или строится целиком ``from_texts``;
+    добавлять записи в готовый индекс нельзя.
+    """
+
+    def __init__(
+        self,
+        index: FlatIndex,
+        embedding_function: Optional[Embeddings],
+        directory: str,
+    ) -> None:
+        """
+        Args:
+            index: Плоский индекс
+            embedding_function: Клиент эмбеддингов для запросов
+            directory: Директория версии индекса
+        """
+        self._collection = index
+        self._embedding_function = embedding_function
+        self._persist_directory = directory
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self._embedding_function
+
+    def similarity_search_by_vector_with_score(
+        self,
+        embedding: list[float],
+        k: int = 4,
+        filter: Optional[dict[str, Any]] = None,
+    ) -> list[tuple[Document, float]]:
+        """Документы и косинусные расстояния для вектора запроса."""
+        results = self._collection.query([embedding], k, where=filter)
+        return [
+            (Document(page_content=text, metadata=metadata), distance)
+            for text, metadata, distance in zip(
+                results["documents"][0],
+                results["metadatas"][0],
+                results["distances"][0],
+                strict=True,
+            )
+        ]
+
+    def similarity_search_by_vector(
+        self,
+        embedding: list[float],
+        k: int = 4,
+        filter: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> list[Document]:
+        return [
+            doc
+            for doc, _ in self.similarity_search_by_vector_with_score(
+                embedding, k, filter
+            )
+        ]
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> list[tuple[Document, float]]:
+        if self._embedding_function is None:
+            raise ValueError("FlatVectorStore has no embedding function")
+        return self.similarity_search_by_vector_with_score(
+            self._embedding_function.embed_query(query), k, filter
+        )
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self) -> Any:
+        return self._cosine_relevance_score_fn
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: Optional[list[dict[Any, Any]]] = None,
+        *,
+        ids: Optional[list[str]] = None,
+        directory: Optional[str] = None,
+        compression: Optional[VectorCompression] = None,
+        **kwargs: Any,
+    ) -> "FlatVectorStore":
+        """
+        Строит плоский индекс по текстам, эмбеддингам которых нет в Chroma.
+
+        Args:
+            texts: Тексты
+            embedding: Клиент эмбеддингов (и для текстов, и для запросов)
+            metadatas: Метаданные текстов
+            ids: Id записей (по умолчанию - случайные)
+            directory: Директория, в которую сохраняется индекс (None - только
+                в памяти)
+            compression: Параметры сжатия векторов для грубого поиска
+
+        Returns:
+            FlatVectorStore
+        """
+        ids = ids or [uuid.uuid4().hex for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        if not len(ids) == len(metadatas) == len(texts):
+            raise ValueError("texts, metadatas and ids must have the same length")
+        index = FlatIndex.from_records(
+            ids,
+            texts,
+            metadatas,
+            embedding.embed_documents(texts) if texts else [],
+            uuid.uuid4().hex,
+            compression,
+        )
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            index.save(directory)
+        return cls(index, embedding, directory or "")
+
+
+def benchmark_search(
+    collection: Any,
+    index: FlatIndex,
+    queries: np.ndarray,
+    k: int,
+    batch_size: int,
+) -> dict[str, Any]:
+    """
+    Сравнивает задержку поиска коллекции Chroma и плоского индекса.
+
+    Args:
+        collection: Коллекция Chroma той же версии
+        index: Плоский индекс
+        queries: Векторы запросов
+        k: Количество результатов на запрос
+        batch_size: Размер пачки запросов для батчевого режима
+
+    Returns:
+        Задержки (мс на запрос) для одиночных и батчевых запросов обоих
+        бэкендов и средняя доля совпадающих top-k
+    """
+
+    def per_query_ms(search: Any, batch: int) -> float:
+        started = time.perf_counter()
+        for start in range(0, len(queries), batch):
+            search(queries[start : start + batch].tolist())
+        return (time.perf_counter() - started) * 1000 / len(queries)
+
+    def chroma(vectors: list[list[float]]) -> Any:
+        return collection.query(
+            query_embeddings=vectors,
+            n_results=k,
+            include=["documents", "metadatas", "distances"],
+        )
+
+    def flat(vectors: list[list[float]]) -> Any:
+        return index.query(vectors, k)
+
+    # Прогрев: загрузка сегментов Chroma и страниц mmap
+    chroma(queries[:1].tolist())
+    flat(queries[:1].tolist())
+
+    expected = chroma(queries.tolist())["ids"]
+    actual = flat(queries.tolist())["ids"]
+    overlap = [
+        len(set(a) & set(e)) / max(len(e), 1)
+        for a, e in zip(actual, expected, strict=True)
+    ]
+    return {
+        "queries": len(queries),
+        "k": k,
+        "chroma_ms": per_query_ms(chroma, 1),
+        "chroma_batch_ms": per_query_ms(chroma, batch_size),
+        "flat_ms": per_query_ms(flat, 1),
+        "flat_batch_ms": per_query_ms(flat, batch_size),
+        "overlap": float(np.mean(overlap)) if overlap else 0.0,
+    }
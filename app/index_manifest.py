@@ -0,0 +1,151 @@
+"""Манифест векторного индекса: из чего и с какими параметрами он собран."""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass, field
+from typing import Optional, Union
+
+from app.corpus import document_id
+
+logger = logging.getLogger(__name__)
+
+# Версия схемы записей индекса (id, метаданные чанков). Увеличивается при
+# несовместимых изменениях - такой индекс пересобирается целиком
+# (2 - id записей и метаданные чанков содержат doc_id документа корпуса,
+# 3 - формат векторов эмбеддингов записывается в манифест и коллекцию)
+INDEX_SCHEMA_VERSION = 3
+
+# Поля манифеста, от которых зависит содержимое индекса
+BUILD_FIELDS = (
+    "schema_version",
+    "document_sha256",
+    "chunk_size",
+    "chunk_overlap",
+    "embedding_model",
+    "embedding_format",
+    "tokenizer",
+    "dedup_threshold",
+)
+
+# Размер блока чтения при хешировании файла
+HASH_READ_SIZE = 1 << 20
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 содержимого файла (читается блоками)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(HASH_READ_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_hash(text: str) -> str:
+    """Хеш текста чанка: совпадает, только если эмбеддинг можно не пересчитывать."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class IndexManifest:
+    """
+    Параметры готового индекса, сохраняемые рядом с коллекцией Chroma.
+
+    Пишется только после успешной сборки. При запуске сравнивается с
+    текущим документом и конфигурацией, чтобы не отдавать устаревший индекс.
+
+    Для корпуса из нескольких документов ``document_sha256`` - хеш пар
+    (id документа, SHA-256 файла), а ``documents`` хранит хеши по документам.
+    """
+
+    source: str
+    document_sha256: str
+    chunk_size: int
+    chunk_overlap: int
+    embedding_model: str
+    # Формат векторов (пусто - индекс собран до того, как формат записывался)
+    embedding_format: str = ""
+    # Токенизатор, которым посчитан token_count чанков (пусто - не записан)
+    tokenizer: str = ""
+    # Порог удаления почти повторяющихся чанков (0 - повторы не удалялись)
+    dedup_threshold: float = 0.0
+    schema_version: int = INDEX_SCHEMA_VERSION
+    index_version: str = ""
+    chunk_count: int = 0
+    duplicates_removed: int = 0
+    built_at: float = field(default_factory=time.time)
+    # Id документа -> SHA-256 файла
+    documents: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def for_source(
+        cls,
+        source: Union[str, Sequence[str]],
+        chunk_size: int,
+        chunk_overlap: int,
+        embedding_model: str,
+        dedup_threshold: float = 0.0,
+        embedding_format: str = "",
+        tokenizer: str = "",
+    ) -> "IndexManifest":
+        """Ожидаемый манифест для файла или корпуса и текущих параметров индексации."""
+        sources = [source] if isinstance(source, str) else list(source)
+        documents = {document_id(path): file_sha256(path) for path in sources}
+        if len(sources) == 1:
+            name = os.path.basename(sources[0])
+            document_sha256 = documents[document_id(sources[0])]
+        else:
+            name = os.path.basename(os.path.dirname(os.path.abspath(sources[0])))
+            document_sha256 = hashlib.sha256(
+                "".join(f"{d}:{documents[d]}\n" for d in sorted(documents)).encode()
+            ).hexdigest()
+        return cls(
+            source=name,
+            document_sha256=document_sha256,
+            documents=documents,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            embedding_model=embedding_model,
+            embedding_format=embedding_format,
+            tokenizer=tokenizer,
+            dedup_threshold=dedup_threshold,
+        )
+
+    def mismatches(self, expected: "IndexManifest") -> list[str]:
+        """
+        Расхождения с ожидаемым манифестом.
+
+        Args:
+            expected: Манифест для текущего документа и конфигурации
+
+        Returns:
+            Описания отличающихся полей вида ``поле: было -> стало``
+        """
+        stored, wanted = asdict(self), asdict(expected)
+        return [
+            f"{name}: {stored[name]} -> {wanted[name]}"
+            for name in BUILD_FIELDS
+            if stored[name] != wanted[name]
+        ]
+
+    def save(self, path: str) -> None:
+        """Атомарно сохраняет манифест."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f, indent=2)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["IndexManifest"]:
+        """Загружает манифест или None, если его нет или он поврежден."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls(**json.load(f))
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable index manifest: {e}")
+            return None
@@ -0,0 +1,105 @@
+"""Снимок индекса для поставки с образом: файлы версии и их манифест."""
+
+import json
+import logging
+import os
+import shutil
+import time
+from collections.abc import Iterable
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Версия формата снимка
+SNAPSHOT_FORMAT = 1
+
+# Манифест снимка: пишется последним, без него снимок считается неполным
+SNAPSHOT_MANIFEST_FILENAME = "snapshot.json"
+
+# Нормы исходных эмбеддингов: плоский индекс хранит нормированные векторы,
+# а коллекция Chroma (расстояние l2) - исходные
+SNAPSHOT_NORMS_FILENAME = "vector_norms.npy"
+
+
+@dataclass
+class SnapshotManifest:
+    """
+    Описание снимка: версия индекса, модель эмбеддингов, размеры векторов
+    и файлы с их размерами (по ним проверяется, что снимок скопирован
+    целиком).
+    """
+
+    index_version: str
+    embedding_model: str
+    count: int
+    dimensions: int
+    files: dict[str, int]
+    format: int = SNAPSHOT_FORMAT
+    created_at: float = field(default_factory=time.time)
+
+    def save(self, directory: str) -> None:
+        """Атомарно сохраняет манифест в директорию снимка."""
+        path = os.path.join(directory, SNAPSHOT_MANIFEST_FILENAME)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f, indent=2)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["SnapshotManifest"]:
+        """Загружает манифест или None, если его нет или он поврежден."""
+        path = os.path.join(directory, SNAPSHOT_MANIFEST_FILENAME)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls(**json.load(f))
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable snapshot manifest: {e}")
+            return None
+
+    def problems(self, directory: str) -> list[str]:
+        """
+        Расхождения файлов снимка с манифестом.
+
+        Args:
+            directory: Директория снимка
+
+        Returns:
+            Описания отсутствующих и обрезанных файлов (пусто - снимок цел)
+        """
+        if self.format != SNAPSHOT_FORMAT:
+            return [f"unsupported snapshot format {self.format}"]
+        problems = []
+        for name, size in self.files.items():
+            path = os.path.join(directory, name)
+            if not os.path.exists(path):
+                problems.append(f"{name} is missing")
+            elif os.path.getsize(path) != size:
+                problems.append(
+                    f"{name}: {os.path.getsize(path)} bytes, {size} expected"
+                )
+        return problems
+
+
+def copy_files(source: str, target: str, names: Iterable[str]) -> dict[str, int]:
+    """
+    Копирует файлы между директориями версии и снимка.
+
+    Args:
+        source: Исходная директория
+        target: Директория назначения (создается)
+        names: Имена файлов
+
+    Returns:
+        Имя файла -> размер в байтах
+    """
+    os.makedirs(target, exist_ok=True)
+    sizes = {}
+    for name in names:
+        path = os.path.join(target, name)
+        shutil.copyfile(os.path.join(source, name), f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        sizes[name] = os.path.getsize(path)
+    return sizes
@@ -0,0 +1,205 @@
+"""Прогресс и состояние сборки векторного индекса."""
+
+import logging
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Граница Retry-After для запросов, пришедших до готовности индекса, секунды
+MIN_RETRY_AFTER_SECONDS = 2
+MAX_RETRY_AFTER_SECONDS = 60
+
+
+@dataclass
+class IngestStats:
+    """
+    Счетчики и пропускная способность индексации.
+
+    Разбор страниц и нарезка на чанки идут одним потоковым проходом, поэтому
+    фаза ``parse`` включает и нарезку; ``embed`` начинается с первой пачки,
+    отправленной на эмбеддинг, ``persist`` - запись базы и производных
+    индексов.
+    """
+
+    total_pages: int
+    pages: int = 0
+    blocks: int = 0
+    chunks: int = 0
+    unchanged: int = 0
+    updated: int = 0
+    # Чанки со сместившимся текстом, записанные с сохраненными векторами
+    moved: int = 0
+    deleted: int = 0
+    duplicates: int = 0
+    phase: str = "parse"
+    started: float = field(default_factory=time.monotonic)
+
+    def count_pages(
+        self, pages: Iterable[tuple[int, str]]
+    ) -> Iterator[tuple[int, str]]:
+        """Пропускает страницы через себя, считая их."""
+        for page in pages:
+            self.pages += 1
+            yield page
+
+    def count_block_pages(
+        self, blocks: Iterable[dict[str, Any]], page_offset: int = 0
+    ) -> Iterator[dict[str, Any]]:
+        """
+        Пропускает уже разобранные блоки (из кэша разбора или процесса-воркера),
+        считая их страницы прочитанными; ``page_offset`` - страницы
+        предыдущих документов корпуса.
+        """
+        for block in blocks:
+            self.pages = max(self.pages, page_offset + int(block["page_end"]))
+            yield block
+
+    def log(self, final: bool = False) -> None:
+        """Логирует прогресс: страницы/с и чанки/с."""
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        kept = f", {self.unchanged} unchanged" if self.unchanged else ""
+        if self.updated:
+            kept += f", {self.updated} with new metadata"
+        if self.moved:
+            kept += f", {self.moved} moved"
+        if self.deleted:
+            kept += f", {self.deleted} deleted"
+        if self.duplicates:
+            kept += f", {self.duplicates} near-duplicates merged"
+        logger.info(
+            f"{'Ingested' if final else 'Ingesting'}: "
+            f"{self.pages}/{self.total_pages} pages, {self.blocks} blocks, "
+            f"{self.chunks} chunks embedded{kept} in {elapsed:.1f}s "
+            f"({self.pages / elapsed:.1f} pages/s, {self.chunks / elapsed:.1f} chunks/s)"
+        )
+
+
+class IndexStatus:
+    """
+    Состояние фоновой сборки индекса для ``/index/status``.
+
+    Состояния: ``pending`` -> ``building`` -> ``ready`` | ``failed``.
+    Во время сборки счетчики читаются из текущего ``IngestStats`` без
+    дополнительной синхронизации в цикле индексации.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.state = "pending"
+        self.phase = "pending"
+        self.error: Optional[str] = None
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.ingest: Optional[IngestStats] = None
+
+    def start(self) -> None:
+        """Начало инициализации: загрузка или проверка существующего индекса."""
+        with self._lock:
+            self.state, self.phase, self.error = "building", "load", None
+            self.started, self.finished = time.monotonic(), None
+            self.ingest = None
+
+    def track(self, stats: IngestStats) -> None:
+        """Начало индексации документа с прогрессом из ``stats``."""
+        with self._lock:
+            self.ingest = stats
+
+    def ready(self) -> None:
+        """Индекс готов к поиску."""
+        with self._lock:
+            self.state = self.phase = "ready"
+            self.finished = time.monotonic()
+
+    def fail(self, error: str) -> None:
+        """Сборка индекса завершилась ошибкой."""
+        with self._lock:
+            self.state = self.phase = "failed"
+            self.error = error
+            self.finished = time.monotonic()
+
+    def is_ready(self) -> bool:
+        """Готов ли индекс к поиску."""
+        return self.state == "ready"
+
+    def snapshot(self) -> dict[str, Any]:
+        """
+        Текущее состояние сборки.
+
+        Returns:
+            state, phase, percent, страницы и чанки (в том числе удаленные
+            как почти повторы), chunks_per_second,
+            eta_seconds (None, если оценить нельзя), elapsed_seconds, error
+        """
+        with self._lock:
+            state, phase, ingest = self.state, self.phase, self.ingest
+            started, finished, error = self.started, self.finished, self.error
+
+        now = time.monotonic()
+        elapsed = ((finished or now) - started) if started is not None else 0.0
+        percent = 100.0 if state == "ready" else 0.0
+        chunks_per_second = 0.0
+        eta: Optional[float] = None
+        if ingest is not None:
+            if state == "building":
+                phase = ingest.phase
+            ingest_elapsed = max((finished or now) - ingest.started, 1e-9)
+            chunks_per_second = ingest.chunks / ingest_elapsed
+            if state == "building":
+                # Индексация потоковая: доля прочитанных страниц - доля работы;
+                # последний процент оставлен на запись базы и индексов
+                percent = 99.0 * ingest.pages / max(ingest.total_pages, 1)
+                if 0 < percent < 99:
+                    eta = ingest_elapsed * (99.0 - percent) / percent
+        return {
+            "state": state,
+            "phase": phase,
+            "percent": round(percent, 1),
+            "pages": ingest.pages if ingest else 0,
+            "total_pages": ingest.total_pages if ingest else 0,
+            "chunks_embedded": ingest.chunks if ingest else 0,
+            "chunks_unchanged": ingest.unchanged if ingest else 0,
+            "chunks_deduplicated": ingest.duplicates if ingest else 0,
+            "chunks_per_second": round(chunks_per_second, 1),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "elapsed_seconds": round(elapsed, 1),
+            "error": error,
+        }
+
+    def retry_after(self) -> int:
+        """Рекомендуемая пауза перед повтором запроса, секунды."""
+        eta = self.snapshot()["eta_seconds"]
+        if eta is None:
+            return MIN_RETRY_AFTER_SECONDS * 5
+        return int(min(max(eta, MIN_RETRY_AFTER_SECONDS), MAX_RETRY_AFTER_SECONDS))
+
+
+# Состояние сборки индекса процесса
+index_status = IndexStatus()
+
+
+def get_index_status() -> IndexStatus:
+    """
+    Получить состояние сборки векторного индекса
+
+    Returns:
+        IndexStatus процесса
+    """
+    return index_status
+
+
+# Состояние пересборки индекса через административный API
+rebuild_status = IndexStatus()
+
+
+def get_rebuild_status() -> IndexStatus:
+    """
+    Получить состояние пересборки векторного индекса
+
+    Returns:
+        IndexStatus последней пересборки
+    """
+    return rebuild_status
@@ -0,0 +1,127 @@
+"""Версии векторного индекса в отдельных директориях (blue/green)."""
+
+import logging
+import os
+import re
+import shutil
+import time
+import uuid
+from collections.abc import Iterable
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Поддиректория с версиями индекса внутри корня векторной базы
+VERSIONS_DIRNAME = "versions"
+
+# Файл с именем активной версии (меняется атомарно через os.replace)
+CURRENT_FILENAME = "CURRENT"
+
+# Файл базы Chroma (по нему распознается индекс старой раскладки в корне)
+CHROMA_DB_FILENAME = "chroma.sqlite3"
+
+# Директории сегментов Chroma называются по UUID
+_SEGMENT_DIR_RX = re.compile(
+    r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$"
+)
+
+
+def new_version_name() -> str:
+    """Имя новой версии: время сборки (сортируется по возрастанию) и суффикс."""
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+def version_directory(root: str, name: str) -> str:
+    """Директория версии индекса."""
+    return os.path.join(root, VERSIONS_DIRNAME, name)
+
+
+def read_current_version(root: str) -> Optional[str]:
+    """Имя активной версии или None (версий еще нет)."""
+    path = os.path.join(root, CURRENT_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        name = f.read().strip()
+    return name or None
+
+
+def write_current_version(root: str, name: str) -> None:
+    """Атомарно делает версию активной."""
+    path = os.path.join(root, CURRENT_FILENAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(name + "\n")
+    os.replace(tmp_path, path)
+
+
+def list_versions(root: str) -> list[str]:
+    """Имена версий в порядке сборки."""
+    versions_root = os.path.join(root, VERSIONS_DIRNAME)
+    if not os.path.isdir(versions_root):
+        return []
+    return sorted(
+        name
+        for name in os.listdir(versions_root)
+        if os.path.isdir(os.path.join(versions_root, name))
+    )
+
+
+def collect_garbage(
+    root: str,
+    keep: Iterable[str],
+    keep_previous: int,
+    incomplete_marker: str,
+) -> list[str]:
+    """
+    Удаляет старые версии индекса.
+
+    Args:
+        root: Корень векторной базы
+        keep: Версии, которые удалять нельзя (активная, собираемая)
+        keep_previous: Сколько последних завершенных версий сохранить для отката
+        incomplete_marker: Имя файла, наличие которого означает незавершенную
+            сборку (такие версии не сохраняются для отката)
+
+    Returns:
+        Имена удаленных версий
+    """
+    protected = set(keep)
+    candidates = [name for name in list_versions(root) if name not in protected]
+    complete = [
+        name
+        for name in candidates
+        if not os.path.exists(
+            os.path.join(version_directory(root, name), incomplete_marker)
+        )
+    ]
+    retained = set(complete[-keep_previous:]) if keep_previous > 0 else set()
+    removed = []
+    for name in candidates:
+        if name in retained:
+            continue
+        shutil.rmtree(version_directory(root, name), ignore_errors=True)
+        removed.append(name)
+    if removed:
+        logger.info(f"Removed old index versions: {', '.join(removed)}")
+    return removed
+
+
+def remove_legacy_index(root: str, filenames: Iterable[str]) -> None:
+    """
+    Удаляет индекс старой раскладки (Chroma и файлы индексов прямо в корне),
+    не трогая версии и общие кэши.
+
+    Args:
+        root: Корень векторной базы
+        filenames: Имена файлов производных индексов
+    """
+    for name in [CHROMA_DB_FILENAME, *filenames]:
+        path = os.path.join(root, name)
+        if os.path.exists(path):
+            os.remove(path)
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if _SEGMENT_DIR_RX.match(name) and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+    logger.info(f"Removed legacy index files from: {root}")
@@ -0,0 +1,79 @@
+"""Чекпоинт индексации для продолжения прерванной сборки."""
+
+import json
+import logging
+import os
+from collections.abc import Sequence
+from dataclasses import asdict, dataclass
+from typing import Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class IngestCheckpoint:
+    """
+    Состояние незавершенной индексации.
+
+    Пока файл чекпоинта существует, векторная база считается неполной.
+    При продолжении уже записанные чанки с тем же текстом не эмбеддятся
+    повторно (сравнение по хешу содержимого).
+    """
+
+    source: str
+    source_size: int
+    source_mtime: float
+    chunk_size: int
+    chunk_overlap: int
+    embedding_model: str
+    chunks_done: int = 0
+
+    @classmethod
+    def for_source(
+        cls,
+        source: Union[str, Sequence[str]],
+        chunk_size: int,
+        chunk_overlap: int,
+        embedding_model: str,
+    ) -> "IngestCheckpoint":
+        """
+        Новый чекпоинт для файла или корпуса и параметров индексации
+        (для корпуса - директория, суммарный размер и последнее изменение).
+        """
+        sources = [source] if isinstance(source, str) else list(source)
+        stats = [os.stat(path) for path in sources]
+        return cls(
+            source=os.path.abspath(
+                sources[0] if len(sources) == 1 else os.path.dirname(sources[0])
+            ),
+            source_size=sum(stat.st_size for stat in stats),
+            source_mtime=max(stat.st_mtime for stat in stats),
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            embedding_model=embedding_model,
+        )
+
+    def save(self, path: str) -> None:
+        """Атомарно сохраняет чекпоинт."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["IngestCheckpoint"]:
+        """Загружает чекпоинт или None, если его нет или он поврежден."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as f:
+                return cls(**json.load(f))
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable ingest checkpoint: {e}")
+            return None
+
+    @staticmethod
+    def clear(path: str) -> None:
+        """Удаляет чекпоинт после успешной сборки."""
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,233 @@
+"""Лексический индекс BM25 по чанкам документа."""
+
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from collections.abc import Iterable
+from typing import Any, Optional
+
+import numpy as np
+
+from app.corpus import record_doc_id
+
+logger = logging.getLogger(__name__)
+
+# Версия формата файла индекса
+LEXICAL_INDEX_FORMAT = 1
+
+# Номера разделов (164.502) сохраняются одним токеном
+TOKEN_RX = re.compile(r"\d+(?:\.\d+)*|[a-z]+")
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the "
+    "this to was were which with".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Разбивает текст на токены для BM25.
+
+    Args:
+        text: Исходный текст
+
+    Returns:
+        Список токенов в нижнем регистре без стоп-слов
+    """
+    return [t for t in TOKEN_RX.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Компактный инвертированный индекс BM25 (Okapi).
+
+    Для каждого термина хранятся номера документов и частоты в numpy-массивах,
+    скоринг запроса - векторное накопление по постинг-листам.
+
+    Записи одного документа корпуса идут подряд (``build_lexical_index``
+    сортирует их по id), а постинг-листы отсортированы по номеру записи,
+    поэтому поиск по части документов берет из постинг-листа только
+    диапазоны этих документов (``searchsorted``).
+    """
+
+    def __init__(
+        self,
+        ids: list[str],
+        doc_len: np.ndarray,
+        postings: dict[str, tuple[np.ndarray, np.ndarray]],
+        index_version: str,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ) -> None:
+        """
+        Args:
+            ids: Id записей коллекции Chroma в порядке номеров документов
+            doc_len: Длина каждого документа в токенах
+            postings: Термин -> (номера документов, частоты)
+            index_version: Версия векторного индекса, по которому построен
+            k1: Параметр насыщения частоты BM25
+            b: Параметр нормализации по длине BM25
+        """
+        self.ids = ids
+        self.doc_len = doc_len
+        self.postings = postings
+        self.index_version = index_version
+        self.k1 = k1
+        self.b = b
+        self.avg_len = float(doc_len.mean()) if len(doc_len) else 0.0
+        # Нормировка BM25 по длине записи, одна на все запросы
+        self.norm = k1 * (1 - b + b * doc_len / (self.avg_len or 1.0))
+        self._spans: Optional[dict[str, list[tuple[int, int]]]] = None
+        n = len(ids)
+        self.idf = {
+            term: math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for term, (docs, _) in postings.items()
+        }
+
+    @classmethod
+    def from_texts(
+        cls, ids: list[str], texts: list[str], index_version: str
+    ) -> "BM25Index":
+        """
+        Строит индекс по текстам чанков.
+
+        Args:
+            ids: Id записей коллекции
+            texts: Тексты чанков
+            index_version: Версия векторного индекса
+
+        Returns:
+            BM25Index
+        """
+        raw: dict[str, tuple[list[int], list[int]]] = defaultdict(lambda: ([], []))
+        doc_len = np.zeros(len(texts), dtype=np.float32)
+        for doc_no, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_len[doc_no] = sum(counts.values())
+            for term, tf in counts.items():
+                raw[term][0].append(doc_no)
+                raw[term][1].append(tf)
+        postings = {
+            term: (np.asarray(docs, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            for term, (docs, tfs) in raw.items()
+        }
+        return cls(ids, doc_len, postings, index_version)
+
+    def doc_spans(self, doc_ids: Iterable[str]) -> list[tuple[int, int]]:
+        """
+        Диапазоны номеров записей документов корпуса.
+
+        Args:
+            doc_ids: Id документов
+
+        Returns:
+            Диапазоны [start, stop) по возрастанию
+        """
+        if self._spans is None:
+            spans: dict[str, list[tuple[int, int]]] = {}
+            record_docs = [record_doc_id(record_id) for record_id in self.ids]
+            start = 0
+            for i in range(1, len(record_docs) + 1):
+                if i == len(record_docs) or record_docs[i] != record_docs[start]:
+                    spans.setdefault(record_docs[start], []).append((start, i))
+                    start = i
+            self._spans = spans
+        return sorted(span for d in set(doc_ids) for span in self._spans.get(d, []))
+
+    def search(
+        self, query: str, k: int, doc_ids: Optional[Iterable[str]] = None
+    ) -> list[tuple[str, float]]:
+        """
+        Поиск top-k документов по BM25.
+
+        Args:
+            query: Текст запроса
+            k: Количество результатов
+            doc_ids: Документы корпуса, которыми ограничен поиск (None -
+                весь корпус)
+
+        Returns:
+            Список (id записи, score) по убыванию score
+        """
+        spans = [(0, len(self.ids))] if doc_ids is None else self.doc_spans(doc_ids)
+        size = sum(stop - start for start, stop in spans)
+        if size == 0:
+            return []
+        # Оценки только записей области поиска: номер записи -> позиция
+        # в ``scores`` через смещения диапазонов
+        offsets = np.cumsum([0] + [stop - start for start, stop in spans])
+        scores = np.zeros(size, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            docs, tfs = posting
+            for (start, stop), offset in zip(spans, offsets, strict=False):
+                lo, hi = np.searchsorted(docs, (start, stop))
+                span_docs, span_tfs = docs[lo:hi], tfs[lo:hi]
+                scores[offset + span_docs - start] += (
+                    self.idf[term]
+                    * span_tfs
+                    * (self.k1 + 1)
+                    / (span_tfs + self.norm[span_docs])
+                )
+
+        matched = int(np.count_nonzero(scores))
+        if matched == 0:
+            return []
+        k = min(k, matched)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        # Позиции в ``scores`` -> номера записей
+        span = np.searchsorted(offsets, top, side="right") - 1
+        rows = np.asarray([start for start, _ in spans])[span] + top - offsets[span]
+        return [
+            (self.ids[row], float(scores[i])) for row, i in zip(rows, top, strict=True)
+        ]
+
+    def save(self, path: str) -> None:
+        """Сохраняет индекс в JSON-файл."""
+        data: dict[str, Any] = {
+            "format": LEXICAL_INDEX_FORMAT,
+            "index_version": self.index_version,
+            "k1": self.k1,
+            "b": self.b,
+            "ids": self.ids,
+            "doc_len": self.doc_len.astype(int).tolist(),
+            "postings": {
+                term: [docs.tolist(), tfs.astype(int).tolist()]
+                for term, (docs, tfs) in self.postings.items()
+            },
+        }
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        """
+        Загружает индекс из JSON-файла.
+
+        Raises:
+            ValueError: Если формат файла не поддерживается
+        """
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("format") != LEXICAL_INDEX_FORMAT:
+            raise ValueError(f"Unsupported lexical index format: {data.get('format')}")
+        postings = {
+            term: (np.asarray(docs, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            for term, (docs, tfs) in data["postings"].items()
+        }
+        return cls(
+            data["ids"],
+            np.asarray(data["doc_len"], dtype=np.float32),
+            postings,
+            data["index_version"],
+            k1=data["k1"],
+            b=data["b"],
+        )
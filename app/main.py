@@ -1,16 +1,45 @@
+import asyncio
+import json
 import logging
+import os
+import secrets
+import threading
+from collections.abc import AsyncIterator, Iterator
 from datetime import datetime
+from typing import Any, Optional
 
-from fastapi import Depends, FastAPI, HTTPException
+from fastapi import BackgroundTasks, Depends, FastAPI, Header, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.config import get_document_path
+from app.config import get_admin_token, get_document_paths
+from app.corpus import document_id
+from app.database import AsyncSessionLocal, get_async_db, init_db
 from app.database import Message as DBMessage
-from app.database import get_db, init_db
 from app.document_utils import get_pdf_info
-from app.process_question import process_question
-from app.vector_store import get_vector_db, initialize_vector_db
+from app.index_status import get_index_status, get_rebuild_status
+from app.process_question import (
+    aprocess_question,
+    astream_question,
+    get_rag_pipeline,
+    release_rag_pipeline,
+)
+from app.query_cache import get_query_cache
+from app.vector_store import (
+    IndexHandle,
+    VectorDB,
+    acquire_vector_db,
+    get_index_manifest,
+    get_index_version,
+    get_vector_db,
+    initialize_vector_db,
+    is_rebuild_running,
+    rebuild_vector_db,
+    reload_vector_db,
+    retire_index,
+)
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -23,6 +52,8 @@ class Message(BaseModel):
     text: str
     timestamp: datetime
     user_id: str = "user"
+    # Документы корпуса, по которым ищется ответ (None - весь корпус)
+    doc_ids: Optional[list[str]] = None
 
 
 class ChatResponse(BaseModel):
@@ -40,8 +71,27 @@ class ChatHistoryItem(BaseModel):
 
 
 class DocumentInfo(BaseModel):
+    doc_id: str
     name: str
     filename: str
+    pages: int = 0
+    size: str = "Unknown"
+    indexed: bool = False
+
+
+class IndexStatusResponse(BaseModel):
+    state: str
+    phase: str
+    percent: float
+    pages: int
+    total_pages: int
+    chunks_embedded: int
+    chunks_unchanged: int
+    chunks_deduplicated: int
+    chunks_per_second: float
+    eta_seconds: Optional[float]
+    elapsed_seconds: float
+    error: Optional[str]
 
 
 class HealthResponse(BaseModel):
@@ -52,24 +102,147 @@ class HealthResponse(BaseModel):
     vector_db_status: str
 
 
+def build_index() -> None:
+    """
+    Загрузка или сборка векторной базы в фоновом потоке
+    """
+    try:
+        vector_db = initialize_vector_db()
+        # Создаем RAG пайплайн один раз на процесс
+        get_rag_pipeline(vector_db)
+        logger.info("Vector DB is ready, chat is available")
+    except Exception as e:
+        logger.error(f"Failed to initialize vector database: {e}")
+
+
 @app.on_event("startup")
 async def startup_event() -> None:
     """
     Инициализация при запуске приложения
+
+    Векторная база строится в фоне: /health и /index/status отвечают сразу,
+    /chat возвращает 503 с Retry-After, пока индекс не готов.
     """
     try:
         logger.info("Starting application initialization...")
         # Инициализируем базу данных
         init_db()
         logger.info("Database initialized successfully")
-        # Инициализируем векторную базу
-        initialize_vector_db()
-        logger.info("Application initialization completed successfully")
+        # Фоновый поток не задерживает остановку сервера: прерванная сборка
+        # продолжится с чекпоинта при следующем запуске
+        threading.Thread(target=build_index, name="index-build", daemon=True).start()
+        logger.info("Application initialization completed, index build started")
     except Exception as e:
         logger.error(f"Failed to initialize application: {e}")
         raise
 
 
+def require_vector_db() -> Iterator[VectorDB]:
+    """
+    Векторная база для обработки запроса
+
+    База удерживается до конца ответа (включая потоковый): при замене
+    версии индекса старая освобождается только после таких запросов.
+
+    Raises:
+        HTTPException: 503 (с Retry-After), пока индекс строится или если
+            сборка завершилась ошибкой
+    """
+    status = get_index_status()
+    with acquire_vector_db() as vector_db:
+        if vector_db is not None and status.is_ready():
+            yield vector_db
+            return
+    if status.state == "failed":
+        raise HTTPException(
+            status_code=503, detail=f"Vector index build failed: {status.error}"
+        )
+    raise HTTPException(
+        status_code=503,
+        detail="Vector index is being built, retry later",
+        headers={"Retry-After": str(status.retry_after())},
+    )
+
+
+def check_doc_ids(
+    doc_ids: Optional[list[str]], vector_db: VectorDB
+) -> Optional[list[str]]:
+    """
+    Проверка области поиска запроса: документы должны быть в индексе
+
+    Returns:
+        Id документов без повторов или None для поиска по всему корпусу
+
+    Raises:
+        HTTPException: 400, если каких-то документов нет в индексе
+    """
+    if not doc_ids:
+        return None
+    manifest = get_index_manifest(vector_db)
+    if manifest is None or not manifest.documents:
+        return sorted(set(doc_ids))
+    unknown = sorted(set(doc_ids) - manifest.documents.keys())
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown document ids: {', '.join(unknown)}"
+        )
+    return sorted(set(doc_ids))
+
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)) -> None:
+    """
+    Проверка токена административного API (заголовок X-Admin-Token)
+
+    Raises:
+        HTTPException: 404, если ADMIN_TOKEN не задан; 401 при неверном токене
+    """
+    token = get_admin_token()
+    if not token:
+        raise HTTPException(status_code=404, detail="Admin API is disabled")
+    if x_admin_token is None or not secrets.compare_digest(
+        x_admin_token.encode("utf-8"), token.encode("utf-8")
+    ):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+async def release_index(previous: Optional[IndexHandle]) -> None:
+    """
+    Освобождение замененной версии индекса после завершения начатых по ней
+    запросов и закрытие ее RAG пайплайна
+    """
+    if previous is None:
+        return
+    await asyncio.to_thread(retire_index, previous)
+    pipeline = release_rag_pipeline(previous.vector_db)
+    if pipeline is not None:
+        await pipeline.aclose()
+
+
+async def run_index_rebuild() -> None:
+    """
+    Сборка новой версии индекса и замена активной (фоновая задача)
+    """
+    try:
+        # Пайплайн новой версии создается до замены, а не первым запросом
+        previous = await asyncio.to_thread(rebuild_vector_db, None, get_rag_pipeline)
+    except Exception as e:
+        logger.error(f"Failed to rebuild vector index: {e}")
+        return
+    await release_index(previous)
+
+
+@app.on_event("shutdown")
+async def shutdown_event() -> None:
+    """
+    Освобождение ресурсов при остановке приложения
+    """
+    vector_db = get_vector_db()
+    if vector_db is not None:
+        pipeline = release_rag_pipeline(vector_db)
+        if pipeline is not None:
+            await pipeline.aclose()
+
+
 @app.get("/", response_model=dict[str, str])
 async def root() -> dict[str, str]:
     return {"message": "Чат с документом API работает!"}
@@ -77,26 +250,23 @@ async def root() -> dict[str, str]:
 
 @app.post("/chat", response_model=ChatResponse)
 async def chat_with_document(
-    message: Message, db: Session = Depends(get_db)
+    message: Message,
+    db: AsyncSession = Depends(get_async_db),
+    vector_db: VectorDB = Depends(require_vector_db),
 ) -> ChatResponse:
     """
     Обработать сообщение пользователя с использованием RAG
 
     Использует векторную базу для поиска релевантной информации
-    и формирует ответ на основе найденных документов
+    и формирует ответ на основе найденных документов. ``doc_ids``
+    ограничивает поиск документами корпуса (см. /document-info)
     """
+    doc_ids = check_doc_ids(message.doc_ids, vector_db)
     try:
         logger.info(f"[{message.timestamp}] {message.user_id}: {message.text}")
 
-        # Получаем векторную базу
-        vector_db = get_vector_db()
-        if vector_db is None:
-            raise HTTPException(
-                status_code=500, detail="Vector database not initialized"
-            )
-
         # Используем новую логику обработки вопросов
-        response_text = process_question(message.text, vector_db)
+        response_text = await aprocess_question(message.text, vector_db, doc_ids)
 
         # Создаем ответ
         response = ChatResponse(
@@ -114,7 +284,7 @@ async def chat_with_document(
             user_id=message.user_id,
         )
         db.add(db_message)
-        db.commit()
+        await db.commit()
 
         return response
 
@@ -125,12 +295,77 @@ async def chat_with_document(
         )
 
 
+def _sse(event: str, data: dict[str, Any]) -> str:
+    """Сформировать событие Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_with_document_stream(
+    message: Message, vector_db: VectorDB = Depends(require_vector_db)
+) -> StreamingResponse:
+    """
+    Потоковая версия /chat (Server-Sent Events)
+
+    Сначала отправляет событие metadata с цитатами и chunk_ids,
+    затем события token по мере генерации ответа и финальное событие done.
+    Ответ сохраняется в базу данных после завершения потока.
+    """
+    doc_ids = check_doc_ids(message.doc_ids, vector_db)
+    logger.info(f"[{message.timestamp}] {message.user_id} (stream): {message.text}")
+
+    async def event_stream() -> AsyncIterator[str]:
+        parts: list[str] = []
+        try:
+            async for event in astream_question(message.text, vector_db, doc_ids):
+                if event["event"] == "token":
+                    parts.append(event["data"]["text"])
+                yield _sse(event["event"], event["data"])
+        except Exception as e:
+            logger.error(f"Error streaming message: {e}")
+            yield _sse("error", {"detail": f"Ошибка при обработке сообщения: {e}"})
+            return
+
+        response_text = "".join(parts)
+
+        # Сохраняем в базу данных после завершения потока
+        async with AsyncSessionLocal() as db:
+            db.add(
+                DBMessage(
+                    user_message=message.text,
+                    bot_response=response_text,
+                    timestamp=message.timestamp,
+                    user_id=message.user_id,
+                )
+            )
+            await db.commit()
+
+        yield _sse(
+            "done",
+            {
+                "text": response_text,
+                "timestamp": message.timestamp.isoformat(),
+                "user_id": message.user_id,
+                "source": "document",
+            },
+        )
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/history", response_model=list[ChatHistoryItem])
-async def get_chat_history(db: Session = Depends(get_db)) -> list[ChatHistoryItem]:
+async def get_chat_history(
+    db: AsyncSession = Depends(get_async_db),
+) -> list[ChatHistoryItem]:
     """
     Получить историю чата из базы данных
     """
-    db_messages = db.query(DBMessage).order_by(DBMessage.timestamp.asc()).all()
+    result = await db.execute(select(DBMessage).order_by(DBMessage.timestamp.asc()))
+    db_messages = result.scalars().all()
 
     history_items = []
     for db_msg in db_messages:
@@ -146,43 +381,154 @@ async def get_chat_history(db: Session = Depends(get_db)) -> list[ChatHistoryIte
 
 
 @app.delete("/history", response_model=dict[str, str])
-async def clear_chat_history(db: Session = Depends(get_db)) -> dict[str, str]:
+async def clear_chat_history(
+    db: AsyncSession = Depends(get_async_db),
+) -> dict[str, str]:
     """
     Очистить историю чата из базы данных
     """
-    db.query(DBMessage).delete()
-    db.commit()
+    await db.execute(delete(DBMessage))
+    await db.commit()
     return {"message": "История чата очищена"}
 
 
-@app.get("/document-info", response_model=DocumentInfo)
-async def get_document_info() -> DocumentInfo:
+@app.get("/document-info", response_model=list[DocumentInfo])
+async def get_document_info() -> list[DocumentInfo]:
     """
-    Получить информацию о загруженном документе
+    Получить список документов корпуса
+
+    ``doc_id`` документа передается в ``doc_ids`` запроса /chat; ``indexed``
+    показывает, есть ли документ в активном индексе
     """
-    try:
-        # Путь к PDF документу
-        pdf_path = get_document_path()
+    manifest = get_index_manifest()
+    indexed = set(manifest.documents) if manifest is not None else set()
+    # Каждый PDF открывается PyMuPDF - не на event loop, иначе запрос к
+    # корпусу из многих документов задерживал бы потоковые ответы
+    return await asyncio.to_thread(list_documents, indexed)
 
-        # Получаем реальную информацию о PDF
-        pdf_info = get_pdf_info(pdf_path)
 
-        # Возвращаем только нужные поля
-        return DocumentInfo(
-            name=pdf_info.get("name", "Unknown Document"),
-            filename=pdf_info.get("filename", "unknown.pdf"),
+def list_documents(indexed: set[str]) -> list[DocumentInfo]:
+    """
+    Сведения о документах корпуса (открывает каждый PDF).
+
+    Args:
+        indexed: Id документов активного индекса
+
+    Returns:
+        Документы корпуса в порядке ``get_document_paths``
+    """
+    documents = []
+    for pdf_path in get_document_paths():
+        doc_id = document_id(pdf_path)
+        try:
+            # Получаем реальную информацию о PDF
+            pdf_info = get_pdf_info(pdf_path)
+        except Exception as e:
+            logger.error(f"Failed to get document info for {pdf_path}: {e}")
+            pdf_info = {}
+        documents.append(
+            DocumentInfo(
+                doc_id=doc_id,
+                name=pdf_info.get("name", "Unknown Document"),
+                filename=pdf_info.get("filename", os.path.basename(pdf_path)),
+                pages=int(pdf_info.get("pages", 0) or 0),
+                size=str(pdf_info.get("size", "Unknown")),
+                indexed=doc_id in indexed,
+            )
         )
-    except Exception as e:
-        logger.error(f"Failed to get document info: {e}")
-        return DocumentInfo(name="Unknown Document", filename="unknown.pdf")
+    return documents
+
+
+@app.get("/cache/stats", response_model=dict[str, Any])
+async def get_cache_stats() -> dict[str, Any]:
+    """
+    Получить статистику кэшей (попадания/промахи)
+    """
+    query_cache = get_query_cache()
+    stats: dict[str, Any] = {
+        "answer_cache": None,
+        "query_cache": query_cache.stats() if query_cache else None,
+    }
+    vector_db = get_vector_db()
+    if vector_db is not None:
+        answer_cache = get_rag_pipeline(vector_db).answer_cache
+        stats["answer_cache"] = answer_cache.stats() if answer_cache else None
+    return stats
+
+
+@app.get("/index/status", response_model=IndexStatusResponse)
+async def get_index_build_status() -> IndexStatusResponse:
+    """
+    Получить состояние сборки векторного индекса
+
+    Фаза (load/parse/embed/persist), процент готовности, скорость
+    эмбеддинга и оценка оставшегося времени.
+    """
+    return IndexStatusResponse(**get_index_status().snapshot())
+
+
+@app.post(
+    "/admin/index/rebuild",
+    response_model=IndexStatusResponse,
+    status_code=202,
+    dependencies=[Depends(require_admin)],
+)
+async def start_index_rebuild(background_tasks: BackgroundTasks) -> IndexStatusResponse:
+    """
+    Запустить пересборку векторного индекса в новую версию
+
+    Пока версия собирается, запросы обслуживает текущий индекс; затем он
+    атомарно заменяется. Прогресс - ``GET /admin/index/rebuild``.
+    """
+    if not get_index_status().is_ready():
+        raise HTTPException(status_code=409, detail="Vector index is not ready yet")
+    if is_rebuild_running():
+        raise HTTPException(status_code=409, detail="Index rebuild is already running")
+    background_tasks.add_task(run_index_rebuild)
+    return IndexStatusResponse(**get_rebuild_status().snapshot())
+
+
+@app.get(
+    "/admin/index/rebuild",
+    response_model=IndexStatusResponse,
+    dependencies=[Depends(require_admin)],
+)
+async def get_index_rebuild_status() -> IndexStatusResponse:
+    """
+    Получить состояние последней пересборки векторного индекса
+    """
+    return IndexStatusResponse(**get_rebuild_status().snapshot())
+
+
+@app.post(
+    "/admin/index/reload",
+    response_model=dict[str, str],
+    dependencies=[Depends(require_admin)],
+)
+async def reload_index(background_tasks: BackgroundTasks) -> dict[str, str]:
+    """
+    Переключиться на версию индекса из файла CURRENT (собранную CLI)
+    """
+    if not get_index_status().is_ready():
+        raise HTTPException(status_code=409, detail="Vector index is not ready yet")
+    try:
+        previous = await asyncio.to_thread(reload_vector_db, get_rag_pipeline)
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e)) from e
+    background_tasks.add_task(release_index, previous)
+    vector_db = get_vector_db()
+    assert vector_db is not None
+    return {
+        "message": "Индекс переключен" if previous else "Индекс уже актуален",
+        "index_version": get_index_version(vector_db),
+    }
 
 
 @app.get("/health", response_model=HealthResponse)
-async def health_check(db: Session = Depends(get_db)) -> HealthResponse:
-    vector_db_status = (
-        "initialized" if get_vector_db() is not None else "not_initialized"
-    )
-    history_count = db.query(DBMessage).count()
+async def health_check(db: AsyncSession = Depends(get_async_db)) -> HealthResponse:
+    status = get_index_status()
+    vector_db_status = "initialized" if status.is_ready() else status.state
+    history_count = await db.scalar(select(func.count()).select_from(DBMessage))
     logger.info(
         f"Health check: vector_db_status={vector_db_status}, history_count={history_count}"
     )
@@ -0,0 +1,280 @@
+"""Удаление почти повторяющихся чанков при индексации (MinHash + LSH)."""
+
+import hashlib
+import logging
+import re
+from collections.abc import Mapping
+from typing import Any, Optional, Union
+
+import numpy as np
+from langchain.schema import Document
+
+logger = logging.getLogger(__name__)
+
+# Количество хеш-функций MinHash (длина сигнатуры)
+MINHASH_PERMUTATIONS = 128
+
+# Полосы LSH: сигнатура делится на LSH_BANDS полос по 8 значений, чанки с
+# совпавшей полосой сравниваются по оценке сходства Жаккара. Порог
+# попадания в кандидаты ~ (1 / 16) ** (1 / 8) ≈ 0.71
+LSH_BANDS = 16
+
+# Длина шингла в словах
+SHINGLE_WORDS = 3
+
+# Метаданные канонического чанка о слитых с ним повторах: списки через
+# "; " в порядке документа (Chroma хранит в метаданных только скаляры)
+DUPLICATE_CITATIONS_KEY = "duplicate_citations"
+DUPLICATE_PAGES_KEY = "duplicate_pages"
+DUPLICATE_COUNT_KEY = "duplicate_count"
+DUPLICATE_KEYS = (DUPLICATE_CITATIONS_KEY, DUPLICATE_PAGES_KEY, DUPLICATE_COUNT_KEY)
+# Значения у чанка без повторов (удалить ключ метаданных в Chroma нельзя)
+NO_DUPLICATES: dict[str, Union[str, int]] = {
+    DUPLICATE_CITATIONS_KEY: "",
+    DUPLICATE_PAGES_KEY: "",
+    DUPLICATE_COUNT_KEY: 0,
+}
+
+_LIST_SEPARATOR = "; "
+
+# Простое число Мерсенна 2^61 - 1 для хеш-функций (a * x + b) mod p
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+_WORD_RX = re.compile(r"\w+")
+
+
+def shingle_hashes(text: str, size: int = SHINGLE_WORDS) -> np.ndarray:
+    """
+    32-битные хеши словесных шинглов текста.
+
+    Текст приводится к нижнему регистру, пунктуация и пробелы не
+    учитываются, поэтому различия в переносах строк не мешают сравнению.
+
+    Args:
+        text: Текст чанка
+        size: Длина шингла в словах
+
+    Returns:
+        Уникальные хеши (пустой массив, если в тексте нет слов)
+    """
+    words = _WORD_RX.findall(text.lower())
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+    shingles = {
+        " ".join(words[i : i + size]) for i in range(max(len(words) - size + 1, 1))
+    }
+    return np.array(
+        [
+            int.from_bytes(
+                hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little"
+            )
+            for s in shingles
+        ],
+        dtype=np.uint64,
+    )
+
+
+class NearDuplicateIndex:
+    """
+    LSH-индекс MinHash сигнатур для поиска почти повторяющихся текстов.
+
+    Сходство Жаккара множеств шинглов оценивается долей совпавших значений
+    сигнатур. Кандидаты берутся из корзин LSH, поэтому новый текст
+    сравнивается не со всеми, а только с похожими.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        permutations: int = MINHASH_PERMUTATIONS,
+        bands: int = LSH_BANDS,
+        seed: int = 1,
+    ) -> None:
+        """
+        Args:
+            threshold: Минимальное сходство Жаккара повтора (0..1]
+            permutations: Длина сигнатуры
+            bands: Количество полос LSH (делитель ``permutations``)
+            seed: Зерно коэффициентов хеш-функций
+
+        Raises:
+            ValueError: Если параметры некорректны
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError(f"Invalid near-duplicate threshold: {threshold}")
+        if permutations % bands:
+            raise ValueError(f"{bands} LSH bands do not divide {permutations}")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = permutations // bands
+        rng = np.random.default_rng(seed)
+        prime = int(_MERSENNE_PRIME)
+        self._a = rng.integers(1, prime, size=permutations, dtype=np.uint64)
+        self._b = rng.integers(0, prime, size=permutations, dtype=np.uint64)
+        self.signatures: dict[str, np.ndarray] = {}
+        self._buckets: dict[tuple[int, bytes], list[str]] = {}
+
+    def signature(self, text: str) -> Optional[np.ndarray]:
+        """MinHash сигнатура текста или None, если в нем нет слов."""
+        hashes = shingle_hashes(text)
+        if not len(hashes):
+            return None
+        # Переполнение uint64 в a * x допустимо: это по-прежнему хеш-функция
+        values = (hashes[:, None] * self._a + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        signature: np.ndarray = values.min(axis=0)
+        return signature
+
+    def _bucket_keys(self, signature: np.ndarray) -> list[tuple[int, bytes]]:
+        return [
+            (band, signature[band * self.rows : (band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    def find(self, signature: np.ndarray) -> Optional[str]:
+        """
+        Самый похожий сохраненный текст со сходством не ниже порога.
+
+        Args:
+            signature: MinHash сигнатура
+
+        Returns:
+            Ключ найденного текста или None
+        """
+        candidates: dict[str, None] = {}
+        for bucket in self._bucket_keys(signature):
+            candidates.update(dict.fromkeys(self._buckets.get(bucket, [])))
+        best, best_similarity = None, self.threshold
+        for key in candidates:
+            similarity = float(np.mean(self.signatures[key] == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = key, similarity
+        return best
+
+    def add(self, key: str, signature: np.ndarray) -> None:
+        """Сохраняет сигнатуру текста под ключом."""
+        self.signatures[key] = signature
+        for bucket in self._bucket_keys(signature):
+            self._buckets.setdefault(bucket, []).append(key)
+
+
+def _page_range(metadata: Mapping[str, Any]) -> str:
+    start, end = metadata.get("page_start"), metadata.get("page_end")
+    return str(start) if start == end else f"{start}-{end}"
+
+
+class ChunkDeduplicator:
+    """
+    Оставляет из почти повторяющихся чанков первый (канонический).
+
+    Цитаты и страницы удаленных повторов переносятся в метаданные
+    канонического чанка (``DUPLICATE_KEYS``). Хранятся только сигнатуры
+    канонических чанков и списки их повторов.
+
+    Повторы ищутся в пределах области (документа корпуса): чанк другого
+    документа не сливается с каноническим, иначе поиск, ограниченный его
+    документом, не нашел бы этот текст.
+    """
+
+    def __init__(self, threshold: float) -> None:
+        """
+        Args:
+            threshold: Минимальное сходство Жаккара повтора (0..1]
+        """
+        self.threshold = threshold
+        self.indexes: dict[str, NearDuplicateIndex] = {
+            "": NearDuplicateIndex(threshold)
+        }
+        self.duplicates: dict[str, list[Mapping[str, Any]]] = {}
+        self.chunks = 0
+        self.removed = 0
+        self.chars = 0
+        self.removed_chars = 0
+
+    def check(self, key: str, chunk: Document, scope: str = "") -> Optional[str]:
+        """
+        Проверяет очередной чанк потока.
+
+        Args:
+            key: Id записи чанка
+            chunk: Чанк
+            scope: Область поиска повторов (id документа)
+
+        Returns:
+            Id канонического чанка, если это повтор (тогда чанк
+            индексировать не нужно), иначе None
+        """
+        self.chunks += 1
+        self.chars += len(chunk.page_content)
+        index = self.indexes.get(scope)
+        if index is None:
+            index = self.indexes[scope] = NearDuplicateIndex(self.threshold)
+        signature = index.signature(chunk.page_content)
+        if signature is None:
+            return None
+        canonical = index.find(signature)
+        if canonical is None:
+            index.add(key, signature)
+            return None
+        self.duplicates.setdefault(canonical, []).append(chunk.metadata)
+        self.removed += 1
+        self.removed_chars += len(chunk.page_content)
+        return canonical
+
+    def duplicate_metadata(self, key: str) -> dict[str, Union[str, int]]:
+        """
+        Метаданные о повторах канонического чанка.
+
+        Returns:
+            Значения ``DUPLICATE_KEYS`` (``NO_DUPLICATES``, если повторов нет)
+        """
+        duplicates = self.duplicates.get(key)
+        if not duplicates:
+            return dict(NO_DUPLICATES)
+        return {
+            DUPLICATE_CITATIONS_KEY: _LIST_SEPARATOR.join(
+                str(m.get("citation", "unknown")) for m in duplicates
+            ),
+            DUPLICATE_PAGES_KEY: _LIST_SEPARATOR.join(
+                _page_range(m) for m in duplicates
+            ),
+            DUPLICATE_COUNT_KEY: len(duplicates),
+        }
+
+    def log(self) -> None:
+        """Логирует, сколько чанков и текста удалено как повторы."""
+        logger.info(
+            f"Near-duplicate chunks removed: {self.removed}/{self.chunks} "
+            f"({100 * self.removed / max(self.chunks, 1):.1f}% of chunks, "
+            f"{100 * self.removed_chars / max(self.chars, 1):.1f}% of text), "
+            f"merged into {len(self.duplicates)} canonical chunks"
+        )
+
+
+def strip_duplicate_metadata(metadata: Mapping[str, Any]) -> dict[str, Any]:
+    """Метаданные чанка без сведений о слитых повторах."""
+    return {k: v for k, v in metadata.items() if k not in DUPLICATE_KEYS}
+
+
+def duplicate_sources(metadata: Mapping[str, Any]) -> list[tuple[str, int, int]]:
+    """
+    Цитаты и диапазоны страниц повторов, слитых с чанком.
+
+    Args:
+        metadata: Метаданные канонического чанка
+
+    Returns:
+        Тройки (цитата, первая страница, последняя страница) в порядке
+        документа
+    """
+    citations = metadata.get(DUPLICATE_CITATIONS_KEY)
+    if not citations:
+        return []
+    pages = str(metadata.get(DUPLICATE_PAGES_KEY) or "").split(_LIST_SEPARATOR)
+    sources = []
+    for i, citation in enumerate(str(citations).split(_LIST_SEPARATOR)):
+        start, _, end = (pages[i] if i < len(pages) else "").partition("-")
+        page_start = int(start) if start.isdigit() else 0
+        page_end = int(end) if end.isdigit() else page_start
+        sources.append((citation, page_start, page_end))
+    return sources
@@ -0,0 +1,174 @@
+"""Хранилище родительских блоков (§ разделов) для чанков индекса."""
+
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass
+from typing import Any, Optional
+
+from langchain.schema import Document
+
+logger = logging.getLogger(__name__)
+
+# Версия формата файла хранилища
+PARENT_STORE_FORMAT = 2
+
+
+@dataclass
+class ParentBlock:
+    """Полный текст блока § раздела, из которого нарезаны чанки."""
+
+    block_index: int
+    section: str
+    citation: str
+    title: str
+    page_start: int
+    page_end: int
+    text: str
+    token_count: int
+    # Документ корпуса (пусто у индексов, собранных до корпуса документов)
+    doc_id: str = ""
+
+
+class ParentBlockStore:
+    """
+    Родительские блоки, сохраненные один раз (а не в метаданных каждого чанка).
+
+    Доступ по документу и номеру блока (``doc_id`` и ``block_index`` в
+    метаданных чанка) и по разделу.
+    """
+
+    def __init__(self, blocks: list[ParentBlock], index_version: str) -> None:
+        """
+        Args:
+            blocks: Родительские блоки
+            index_version: Версия векторного индекса, по которому построено
+        """
+        self.blocks = {(block.doc_id, block.block_index): block for block in blocks}
+        self.sections: dict[str, list[tuple[str, int]]] = {}
+        for block in blocks:
+            self.sections.setdefault(block.section, []).append(
+                (block.doc_id, block.block_index)
+            )
+        self.index_version = index_version
+
+    def get(self, block_index: Any, doc_id: Any = "") -> Optional[ParentBlock]:
+        """Блок документа по номеру или None."""
+        if not isinstance(block_index, int):
+            return None
+        return self.blocks.get((str(doc_id or ""), block_index))
+
+    def for_section(
+        self, section: str, doc_id: Optional[str] = None
+    ) -> list[ParentBlock]:
+        """Все блоки раздела (во всех документах или в одном) в порядке корпуса."""
+        return [
+            self.blocks[key]
+            for key in self.sections.get(section, [])
+            if doc_id is None or key[0] == doc_id
+        ]
+
+    def save(self, path: str) -> None:
+        """Сохраняет хранилище в JSONL-файл."""
+        with ParentBlockWriter(path, self.index_version) as writer:
+            for block in self.blocks.values():
+                writer.write(block)
+
+    @classmethod
+    def load(cls, path: str) -> "ParentBlockStore":
+        """
+        Загружает хранилище из JSONL-файла.
+
+        Raises:
+            ValueError: Если формат файла не поддерживается
+        """
+        with open(path, encoding="utf-8") as f:
+            header = json.loads(f.readline() or "{}")
+            if header.get("format") != PARENT_STORE_FORMAT:
+                raise ValueError(
+                    f"Unsupported parent store format: {header.get('format')}"
+                )
+            blocks = [ParentBlock(**json.loads(line)) for line in f if line.strip()]
+        return cls(blocks, header["index_version"])
+
+
+class ParentBlockWriter:
+    """
+    Потоковая запись родительских блоков в JSONL-файл: заголовок с версией
+    индекса и по одной строке на блок. Файл появляется под своим именем
+    только после успешного закрытия.
+    """
+
+    def __init__(self, path: str, index_version: str) -> None:
+        self.path = path
+        self._tmp_path = f"{path}.tmp"
+        self._file = open(self._tmp_path, "w", encoding="utf-8")
+        header = {"format": PARENT_STORE_FORMAT, "index_version": index_version}
+        self._file.write(json.dumps(header) + "\n")
+
+    def write(self, block: ParentBlock) -> None:
+        """Дописывает блок в файл."""
+        self._file.write(json.dumps(asdict(block), ensure_ascii=False) + "\n")
+
+    def close(self) -> None:
+        """Завершает запись и атомарно публикует файл."""
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self) -> None:
+        """Прерывает запись и удаляет временный файл."""
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self) -> "ParentBlockWriter":
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def expand_to_parents(
+    docs: list[Document], store: ParentBlockStore, max_tokens: int
+) -> list[Document]:
+    """
+    Режим small-to-big: заменяет найденные чанки их родительскими блоками.
+
+    Несколько чанков одного блока дают один блок на месте лучшего из них.
+    Блоки длиннее ``max_tokens`` не раскрываются - остается сам чанк.
+
+    Args:
+        docs: Найденные документы в порядке ранга
+        store: Хранилище родительских блоков
+        max_tokens: Максимальный размер раскрываемого блока в токенах
+
+    Returns:
+        Документы для контекста в порядке ранга
+    """
+    expanded: list[Document] = []
+    parents: dict[tuple[str, int], Document] = {}
+    for doc in docs:
+        block = store.get(doc.metadata.get("block_index"), doc.metadata.get("doc_id"))
+        if block is None or block.token_count > max_tokens:
+            expanded.append(doc)
+            continue
+        key = (block.doc_id, block.block_index)
+        if key in parents:
+            parents[key].metadata["merged_chunk_ids"].append(
+                doc.metadata.get("chunk_id")
+            )
+            continue
+        metadata = {k: v for k, v in doc.metadata.items() if k != "chunk_index"}
+        metadata.update(
+            page_start=block.page_start,
+            page_end=block.page_end,
+            token_count=block.token_count,
+            merged_chunk_ids=[doc.metadata.get("chunk_id")],
+        )
+        parent = Document(page_content=block.text, metadata=metadata)
+        parents[key] = parent
+        expanded.append(parent)
+    return expanded
@@ -0,0 +1,93 @@
+"""Извлечение текста страниц PDF: последовательно или пулом процессов."""
+
+import multiprocessing
+from collections import deque
+from collections.abc import Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Optional
+
+import fitz
+
+# Количество страниц в одном задании воркера
+PAGE_RANGE_SIZE = 16
+
+# Документ, открытый в процессе-воркере (один handle PyMuPDF на воркер)
+_worker_doc: Optional[Any] = None
+
+
+def iter_page_texts(
+    doc: Any, start: int = 0, stop: Optional[int] = None
+) -> Iterator[tuple[int, str]]:
+    """
+    Текст страниц PDF по одной (номера страниц с 1).
+
+    Args:
+        doc: Открытый документ PyMuPDF
+        start: Первая страница диапазона (с 0)
+        stop: Конец диапазона (не включая), по умолчанию - конец документа
+
+    Yields:
+        (номер страницы, текст страницы)
+    """
+    for page_index in range(start, doc.page_count if stop is None else stop):
+        yield page_index + 1, doc.load_page(page_index).get_text("text")
+
+
+def _init_worker(pdf_path: str) -> None:
+    """Открывает PDF один раз на процесс-воркер."""
+    global _worker_doc
+    _worker_doc = fitz.open(pdf_path)
+
+
+def _extract_range(start: int, stop: int) -> list[tuple[int, str]]:
+    """Извлекает текст диапазона страниц в процессе-воркере."""
+    assert _worker_doc is not None
+    return list(iter_page_texts(_worker_doc, start, stop))
+
+
+def iter_page_texts_parallel(
+    pdf_path: str,
+    page_count: int,
+    workers: int,
+    range_size: int = PAGE_RANGE_SIZE,
+) -> Iterator[tuple[int, str]]:
+    """
+    Текст страниц PDF, извлекаемый пулом процессов по диапазонам страниц.
+
+    Страницы отдаются строго по порядку, поэтому разбор структуры документа
+    (PART / SUBPART / §) идет тем же проходом, что и в последовательном
+    режиме, и состояние парсера переносится через границы диапазонов без
+    изменений. В работе не больше ``2 * workers`` диапазонов, так что память
+    не зависит от длины документа.
+
+    Args:
+        pdf_path: Путь к PDF файлу
+        page_count: Количество страниц документа
+        workers: Количество процессов
+        range_size: Количество страниц в одном задании
+
+    Yields:
+        (номер страницы, текст страницы)
+    """
+    ranges = iter(range(0, page_count, range_size))
+    # spawn: родительский процесс уже держит потоки (Chroma, пулы поиска)
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(pdf_path,),
+    ) as pool:
+        pending: deque[Future[list[tuple[int, str]]]] = deque()
+
+        def submit_next() -> None:
+            start = next(ranges, None)
+            if start is not None:
+                stop = min(start + range_size, page_count)
+                pending.append(pool.submit(_extract_range, start, stop))
+
+        for _ in range(2 * workers):
+            submit_next()
+        while pending:
+            pages = pending.popleft().result()
+            submit_next()
+            yield from pages
@@ -1,16 +1,68 @@
+import asyncio
+import hashlib
 import logging
+import re
+import threading
+import time
+from collections.abc import AsyncIterator, Iterator
+from dataclasses import dataclass, field
+from typing import Any, Optional
 
+import httpx
+import numpy as np
+import openai
+from langchain.callbacks.manager import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
 from langchain.prompts import ChatPromptTemplate, PromptTemplate
-from langchain.retrievers import MultiQueryRetriever
+from langchain.retrievers.multi_query import LineListOutputParser
+from langchain.schema import BaseMessage, BaseRetriever, Document
 from langchain.schema.output_parser import StrOutputParser
+from langchain.schema.runnable import Runnable
 from langchain_community.chat_models import ChatOpenAI
-from langchain_community.vectorstores import Chroma
+from pydantic import ConfigDict
 
+from app.answer_cache import CachedAnswer, SemanticAnswerCache
 from app.callbacks import MultiQueryLoggingCallback, QuestionLoggingCallback
+from app.citation_index import SectionIndex
 from app.config import (
+    get_answer_cache_max_entries,
+    get_answer_cache_threshold,
+    get_answer_cache_ttl_seconds,
+    get_context_token_budget,
     get_llm_model,
     get_llm_temperature,
+    get_mmr_candidates,
+    get_mmr_lambda,
+    get_mmr_top_n,
+    get_openai_api_key,
+    get_rewrite_budget_ms,
+    get_rrf_k,
     get_search_k,
+    get_small_to_big_max_tokens,
+    is_answer_cache_enabled,
+    is_citation_fast_path_enabled,
+    is_hybrid_search_enabled,
+    is_mmr_enabled,
+    is_small_to_big_enabled,
+)
+from app.context_packer import context_tokens, format_context_header, pack_context
+from app.corpus import DOC_ID_KEY, doc_filter, record_doc_id, scope_key, scoped_where
+from app.diversity import MMRSettings, mmr_select
+from app.embeddings import embed_queries
+from app.lexical_index import BM25Index
+from app.near_duplicates import duplicate_sources
+from app.parent_store import expand_to_parents
+from app.query_cache import QueryCache, get_query_cache
+from app.vector_store import (
+    VectorDB,
+    get_index_version,
+    get_lexical_index,
+    get_parent_store,
+    get_section_index,
+    run_in_search_pool,
+    submit_search,
 )
 
 from .prompts import get_prompt
@@ -18,63 +70,588 @@ from .prompts import get_prompt
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
+# Пул keep-alive соединений к OpenAI API, общий для всех запросов процесса
+OPENAI_HTTP_LIMITS = httpx.Limits(
+    max_connections=20, max_keepalive_connections=10, keepalive_expiry=120.0
+)
+OPENAI_HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+
+# Ранжированный список результатов одного запроса: (id записи, документ)
+RankedResults = list[tuple[str, Document]]
 
-def process_question(question: str, vector_db: Chroma) -> str:
+
+def results_to_ranked(results: Any) -> list[RankedResults]:
     """
-    Обрабатывает вопрос пользователя с использованием RAG (Retrieval Augmented Generation).
+    Преобразует результат collection.query в ранжированные списки по запросам.
 
     Args:
-        question: Вопрос пользователя
-        vector_db: Векторная база данных Chroma
+        results: Результат collection.query для нескольких запросов
 
     Returns:
-        str: Ответ на вопрос на основе найденных документов
+        Для каждого запроса список (id записи, документ) в порядке ранга
     """
-    logger.info("=== Starting RAG processing ===")
-    logger.info(f"Original question: {question}")
+    ranked: list[RankedResults] = []
+    for qi, ids in enumerate(results["ids"]):
+        ranked.append(
+            [
+                (
+                    record_id,
+                    Document(
+                        page_content=results["documents"][qi][rank],
+                        metadata=results["metadatas"][qi][rank] or {},
+                    ),
+                )
+                for rank, record_id in enumerate(ids)
+            ]
+        )
+    return ranked
+
+
+def merge_ranked_records(ranked: list[RankedResults]) -> RankedResults:
+    """
+    Объединяет результаты нескольких запросов с сохранением рангов.
+
+    Документы берутся по рангам (сначала первые места всех запросов, затем
+    вторые и т.д.), дубликаты отбрасываются по id записи в коллекции
+    (chunk_id в индексе не уникален: оглавление дает повторяющиеся id).
+
+    Args:
+        ranked: Ранжированные списки результатов по запросам
+
+    Returns:
+        Уникальные (id записи, документ) в порядке рангов
+    """
+    seen: set[str] = set()
+    merged: RankedResults = []
+    depth = max((len(results) for results in ranked), default=0)
+    for rank in range(depth):
+        for results in ranked:
+            if rank >= len(results) or results[rank][0] in seen:
+                continue
+            seen.add(results[rank][0])
+            merged.append(results[rank])
+    return merged
+
+
+def merge_ranked_results(ranked: list[RankedResults]) -> list[Document]:
+    """Объединенные результаты запросов (см. ``merge_ranked_records``)."""
+    return [doc for _, doc in merge_ranked_records(ranked)]
+
+
+# Ссылки на структуру документа в тексте вопроса
+SECTION_REF_RX = re.compile(r"(?<![\d.])(\d{3}\.\d{1,4})(?![\d.]*\d)")
+PART_REF_RX = re.compile(r"\bpart\s+(\d{3})\b", re.I)
+SUBPART_REF_RX = re.compile(r"\bsubpart\s+([a-z])\b", re.I)
+
+
+@dataclass
+class CitationQuery:
+    """Явные ссылки на разделы, части и подчасти, найденные в вопросе."""
+
+    sections: list[str] = field(default_factory=list)
+    parts: list[str] = field(default_factory=list)
+    subparts: list[str] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.sections or self.parts or self.subparts)
+
+
+def parse_citation_query(question: str) -> CitationQuery:
+    """
+    Находит в вопросе ссылки вида "§164.512", "Part 160", "Subpart C".
+
+    Args:
+        question: Текст вопроса
+
+    Returns:
+        CitationQuery с уникальными ссылками в порядке появления
+    """
+    citation = CitationQuery()
+    for section in SECTION_REF_RX.findall(question):
+        if section not in citation.sections:
+            citation.sections.append(section)
+    for part in PART_REF_RX.findall(question):
+        if part not in citation.parts:
+            citation.parts.append(part)
+    for subpart in SUBPART_REF_RX.findall(question):
+        if subpart.upper() not in citation.subparts:
+            citation.subparts.append(subpart.upper())
+    return citation
+
+
+def fuse_ranked_results(
+    ranked: list[RankedResults], rrf_k: int, limit: int
+) -> RankedResults:
+    """
+    Reciprocal rank fusion нескольких ранжированных списков.
+
+    Score документа - сумма 1 / (rrf_k + rank) по всем спискам, где он есть.
+
+    Args:
+        ranked: Ранжированные списки (например, векторный и BM25)
+        rrf_k: Константа сглаживания RRF
+        limit: Максимальное количество документов в результате
+
+    Returns:
+        Объединенный список (id записи, документ) по убыванию score
+    """
+    scores: dict[str, float] = {}
+    documents: dict[str, Document] = {}
+    for results in ranked:
+        for rank, (record_id, doc) in enumerate(results, 1):
+            scores[record_id] = scores.get(record_id, 0.0) + 1.0 / (rrf_k + rank)
+            documents.setdefault(record_id, doc)
+    order = sorted(scores, key=lambda record_id: scores[record_id], reverse=True)
+    return [(record_id, documents[record_id]) for record_id in order[:limit]]
+
+
+class FanoutMultiQueryRetriever(BaseRetriever):
+    """
+    Мульти-запросный ретривер с параллельным и спекулятивным поиском.
+
+    Поиск по исходному вопросу запускается сразу, параллельно с генерацией
+    переформулировок. Затем эмбеддинги всех переформулировок считаются одним
+    батчевым запросом к Ollama, а k-NN поиск выполняется одним вызовом Chroma.
+    Результаты объединяются без дубликатов с сохранением рангов.
+
+    Если задан ``rewrite_budget_ms`` и переформулировки не пришли вовремя,
+    в async-режиме ответ строится только по результатам исходного вопроса.
+
+    С ``query_cache`` повторные запросы не пересчитывают эмбеддинги и не
+    выполняют k-NN поиск: по id из кэша документы читаются одним ``get``.
 
-    # Получаем настройки LLM из конфигурации
-    selected_model = get_llm_model()
+    С ``lexical_index`` поиск гибридный: для каждого запроса векторные
+    результаты и результаты BM25 объединяются через reciprocal rank fusion.
 
-    logger.info(f"Model: {selected_model}")
+    С ``section_index`` вопросы с явными ссылками (§164.512, Part 160,
+    Subpart C) обслуживаются без переформулировки: чанки раздела читаются
+    напрямую, а для больших разделов и частей поиск идет с фильтром ``where``.
+
+    С ``mmr`` объединенные результаты переранжируются по maximal marginal
+    relevance на сохраненных эмбеддингах кандидатов, чтобы почти одинаковые
+    чанки разных переформулировок не занимали весь контекст.
+
+    С ``doc_ids`` поиск ограничен документами корпуса: фильтр ``doc_id``
+    передается в векторный поиск (Chroma или плоский индекс), BM25 и прямое
+    чтение разделов, а не применяется к готовым результатам.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vector_db: VectorDB
+    query_chain: Runnable
+    k: int
+    include_original: bool = True
+    rewrite_budget_ms: int = 0
+    query_cache: Optional[QueryCache] = None
+    lexical_index: Optional[BM25Index] = None
+    rrf_k: int = 60
+    section_index: Optional[SectionIndex] = None
+    mmr: Optional[MMRSettings] = None
+
+    def _build_queries(self, question: str, generated: list[str]) -> list[str]:
+        """Уникальные переформулировки, отличные от исходного вопроса."""
+        queries: list[str] = []
+        for q in generated:
+            q = q.strip()
+            if q and q != question and q not in queries:
+                queries.append(q)
+        logger.info(f"Generated queries: {queries}")
+        return queries
+
+    def search_ranked(
+        self,
+        queries: list[str],
+        vectors: Optional[list[list[float]]] = None,
+        doc_ids: Optional[list[str]] = None,
+    ) -> list[RankedResults]:
+        """
+        Батчевый эмбеддинг запросов и один мульти-запрос к Chroma,
+        при наличии лексического индекса - гибридный поиск с BM25.
+
+        Args:
+            queries: Поисковые запросы
+            vectors: Готовые эмбеддинги запросов (если уже посчитаны)
+            doc_ids: Документы корпуса, которыми ограничен поиск (None -
+                весь корпус)
+
+        Returns:
+            Ранжированные результаты по каждому запросу
+        """
+        if not queries:
+            return []
+        ranked = self._dense_ranked(queries, vectors, doc_ids)
+        if self.lexical_index is None:
+            return ranked
+
+        lexical = [
+            self.lexical_index.search(query, self.k, doc_ids) for query in queries
+        ]
+        documents = {rid: doc for results in ranked for rid, doc in results}
+        missing = {rid for hits in lexical for rid, _ in hits} - documents.keys()
+        if missing:
+            documents.update(self._get_documents(list(missing)))
+        return [
+            fuse_ranked_results(
+                [dense, [(rid, documents[rid]) for rid, _ in hits if rid in documents]],
+                self.rrf_k,
+                self.k,
+            )
+            for dense, hits in zip(ranked, lexical, strict=True)
+        ]
+
+    def _dense_ranked(
+        self,
+        queries: list[str],
+        vectors: Optional[list[list[float]]],
+        doc_ids: Optional[list[str]] = None,
+    ) -> list[RankedResults]:
+        """Векторный поиск по запросам (через кэш запросов, если он включен)."""
+        if vectors is None:
+            vectors = self.embed(queries)
+        if self.query_cache is None:
+            return self._query(vectors, doc_ids)
+
+        index_version = get_index_version(self.vector_db)
+        scope = scope_key(doc_ids)
+        cached_ids = [
+            self.query_cache.get_results(index_version, vector, self.k, scope)
+            for vector in vectors
+        ]
+        ranked: list[RankedResults] = [[] for _ in vectors]
+
+        missing = [i for i, ids in enumerate(cached_ids) if ids is None]
+        if missing:
+            fresh = self._query([vectors[i] for i in missing], doc_ids)
+            for i, results in zip(missing, fresh, strict=True):
+                ranked[i] = results
+                self.query_cache.put_results(
+                    index_version,
+                    vectors[i],
+                    self.k,
+                    [record_id for record_id, _ in results],
+                    scope,
+                )
+
+        hit_ids = {rid for ids in cached_ids if ids is not None for rid in ids}
+        if hit_ids:
+            documents = self._get_documents(list(hit_ids))
+            for i, ids in enumerate(cached_ids):
+                if ids is not None:
+                    ranked[i] = [
+                        (rid, documents[rid]) for rid in ids if rid in documents
+                    ]
+        return ranked
+
+    def embed(self, queries: list[str]) -> list[list[float]]:
+        """Эмбеддинги запросов (через кэш запросов, если он включен)."""
+        if self.query_cache is not None:
+            return self.query_cache.embed(self.vector_db.embeddings, queries)
+        return embed_queries(self.vector_db.embeddings, queries)
+
+    def _query(
+        self, vectors: list[list[float]], doc_ids: Optional[list[str]] = None
+    ) -> list[RankedResults]:
+        """Один мульти-запрос k-NN к векторной базе."""
+        where = doc_filter(doc_ids)
+        results = self.vector_db._collection.query(
+            query_embeddings=vectors,
+            n_results=self.k,
+            include=["documents", "metadatas", "distances"],
+            **({"where": where} if where is not None else {}),
+        )
+        return results_to_ranked(results)
 
-    # Инициализируем колбэки
+    def _get_documents(self, ids: list[str]) -> dict[str, Document]:
+        """Документы по id записей коллекции одним запросом."""
+        results = self.vector_db._collection.get(
+            ids=ids, include=["documents", "metadatas"]
+        )
+        return {
+            record_id: Document(
+                page_content=results["documents"][i],
+                metadata=results["metadatas"][i] or {},
+            )
+            for i, record_id in enumerate(results["ids"])
+        }
+
+    def _filtered_query(
+        self,
+        vector: list[float],
+        where: dict[str, Any],
+        doc_ids: Optional[list[str]] = None,
+    ) -> RankedResults:
+        """k-NN поиск с фильтром по метаданным."""
+        results = self.vector_db._collection.query(
+            query_embeddings=[vector],
+            n_results=self.k,
+            where=scoped_where(where, doc_filter(doc_ids)),
+            include=["documents", "metadatas", "distances"],
+        )
+        return results_to_ranked(results)[0]
+
+    def citation_search(
+        self,
+        question: str,
+        query_vector: Optional[list[float]] = None,
+        doc_ids: Optional[list[str]] = None,
+    ) -> Optional[list[Document]]:
+        """
+        Быстрый путь для вопросов с явными ссылками на структуру документа.
+
+        Разделы, в которых не больше k чанков, читаются целиком по id;
+        в больших разделах, частях и подчастях выполняется векторный поиск
+        с фильтром по метаданным.
+
+        Args:
+            question: Текст вопроса
+            query_vector: Готовый эмбеддинг вопроса
+            doc_ids: Документы корпуса, которыми ограничен поиск
+
+        Returns:
+            Найденные документы или None, если ссылок на известные разделы нет
+        """
+        if self.section_index is None:
+            return None
+        citation = parse_citation_query(question)
+        if not citation:
+            return None
+
+        index = self.section_index
+        sections = [s for s in citation.sections if s in index.sections]
+        parts = [p for p in citation.parts if p in index.subparts]
+        subparts = [
+            sp
+            for sp in citation.subparts
+            if any(sp in known for known in index.subparts.values())
+        ]
+
+        filters: list[dict[str, Any]] = []
+        direct_ids: list[list[str]] = []
+        scope = set(doc_ids) if doc_ids else None
+        for section in sections:
+            ids = index.sections[section]
+            if scope is not None:
+                ids = [rid for rid in ids if record_doc_id(rid) in scope]
+                if not ids:
+                    continue
+            if len(ids) <= self.k:
+                direct_ids.append(ids)
+            else:
+                filters.append({"section": section})
+        if not sections:
+            if parts and subparts:
+                filters += [
+                    {"$and": [{"part": p}, {"subpart": sp}]}
+                    for p in parts
+                    for sp in subparts
+                    if sp in index.subparts[p]
+                ]
+            elif parts:
+                filters += [{"part": p} for p in parts]
+            else:
+                filters += [{"subpart": sp} for sp in subparts]
+        if not direct_ids and not filters:
+            return None
+
+        logger.info(
+            f"Citation fast path: sections={sections}, parts={parts}, "
+            f"subparts={subparts}"
+        )
+        ranked: list[RankedResults] = []
+        if direct_ids:
+            documents = self._get_documents([rid for ids in direct_ids for rid in ids])
+            ranked += [[(rid, documents[rid]) for rid in ids] for ids in direct_ids]
+        if filters:
+            vector = (
+                query_vector if query_vector is not None else self.embed([question])[0]
+            )
+            ranked += [
+                self._filtered_query(vector, where, doc_ids) for where in filters
+            ]
+        return merge_ranked_results(ranked)
+
+    def search_original(
+        self,
+        query: str,
+        query_vector: Optional[list[float]] = None,
+        doc_ids: Optional[list[str]] = None,
+    ) -> tuple[list[float], list[RankedResults]]:
+        """Поиск по исходному вопросу вместе с его эмбеддингом (нужен MMR)."""
+        vector = query_vector if query_vector is not None else self.embed([query])[0]
+        return vector, self.search_ranked([query], [vector], doc_ids)
+
+    def diversify(
+        self,
+        query: str,
+        query_vector: Optional[list[float]],
+        records: RankedResults,
+    ) -> list[Document]:
+        """
+        MMR переранжирование объединенных результатов.
+
+        Эмбеддинги первых ``mmr.candidates`` кандидатов читаются из
+        коллекции одним ``get``, выбор выполняется матричными операциями
+        NumPy (``mmr_select``) в пределах ``mmr.top_n`` и бюджета токенов.
+
+        Args:
+            query: Исходный вопрос
+            query_vector: Эмбеддинг вопроса (если уже посчитан)
+            records: Объединенные результаты в порядке ранга
+
+        Returns:
+            Выбранные документы в порядке выбора (без MMR - все результаты)
+        """
+        if self.mmr is None or len(records) <= 1:
+            return [doc for _, doc in records]
+        if query_vector is None:
+            query_vector = self.embed([query])[0]
+
+        started = time.perf_counter()
+        pool = records[: self.mmr.candidates]
+        stored = self.vector_db._collection.get(
+            ids=[record_id for record_id, _ in pool], include=["embeddings"]
+        )
+        embeddings = dict(zip(stored["ids"], stored["embeddings"], strict=True))
+        pool = [(rid, doc) for rid, doc in pool if rid in embeddings]
+        vectors = np.asarray([embeddings[rid] for rid, _ in pool], dtype=np.float32)
+        fetched = time.perf_counter()
+
+        costs = np.array([context_tokens(doc) for _, doc in pool])
+        selection_started = time.perf_counter()
+        selected = mmr_select(
+            np.asarray(query_vector, dtype=np.float32),
+            vectors,
+            self.mmr.top_n,
+            self.mmr.lambda_mult,
+            costs=costs,
+            budget=self.mmr.token_budget,
+        )
+        finished = time.perf_counter()
+        logger.info(
+            f"MMR selected {len(selected)} of {len(pool)} candidates "
+            f"(lambda={self.mmr.lambda_mult}) in "
+            f"{(finished - selection_started) * 1000:.3f} ms, embeddings fetched "
+            f"in {(fetched - started) * 1000:.2f} ms, token counts in "
+            f"{(selection_started - fetched) * 1000:.2f} ms"
+        )
+        return [pool[i][1] for i in selected]
+
+    def search(
+        self, queries: list[str], doc_ids: Optional[list[str]] = None
+    ) -> list[Document]:
+        """Поиск по нескольким запросам с объединением результатов."""
+        return merge_ranked_results(self.search_ranked(queries, doc_ids=doc_ids))
+
+    def _get_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: CallbackManagerForRetrieverRun,
+        query_vector: Optional[list[float]] = None,
+        doc_ids: Optional[list[str]] = None,
+    ) -> list[Document]:
+        # Явные ссылки на разделы - без переформулировки
+        direct = self.citation_search(query, query_vector, doc_ids)
+        if direct is not None:
+            return direct
+
+        # Спекулятивно ищем по исходному вопросу, пока LLM переформулирует
+        original_future = (
+            submit_search(self.search_original, query, query_vector, doc_ids)
+            if self.include_original
+            else None
+        )
+        try:
+            generated: list[str] = self.query_chain.invoke(
+                {"question": query}, config={"callbacks": run_manager.get_child()}
+            )
+        except BaseException:
+            # Поиск по исходному вопросу не должен занимать слот пула после
+            # ошибки переформулировки: отменяем его, а начатый дожидаемся,
+            # чтобы его ошибка не потерялась
+            if original_future is not None and not original_future.cancel():
+                try:
+                    original_future.result()
+                except Exception as e:
+                    logger.warning(f"Original question search failed: {e}")
+            raise
+        ranked: list[RankedResults] = []
+        if original_future is not None:
+            query_vector, ranked = original_future.result()
+        ranked += self.search_ranked(
+            self._build_queries(query, generated), doc_ids=doc_ids
+        )
+        return self.diversify(query, query_vector, merge_ranked_records(ranked))
+
+    async def _aget_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: AsyncCallbackManagerForRetrieverRun,
+        query_vector: Optional[list[float]] = None,
+        doc_ids: Optional[list[str]] = None,
+    ) -> list[Document]:
+        # Явные ссылки на разделы - без переформулировки
+        direct = await run_in_search_pool(
+            self.citation_search, query, query_vector, doc_ids
+        )
+        if direct is not None:
+            return direct
+
+        # Спекулятивно ищем по исходному вопросу, пока LLM переформулирует
+        original_task = (
+            asyncio.ensure_future(
+                run_in_search_pool(self.search_original, query, query_vector, doc_ids)
+            )
+            if self.include_original
+            else None
+        )
+        rewrite = self.query_chain.ainvoke(
+            {"question": query}, config={"callbacks": run_manager.get_child()}
+        )
+        generated: list[str] = []
+        try:
+            if self.rewrite_budget_ms > 0 and original_task is not None:
+                generated = await asyncio.wait_for(
+                    rewrite, timeout=self.rewrite_budget_ms / 1000
+                )
+            else:
+                generated = await rewrite
+        except asyncio.TimeoutError:
+            logger.warning(
+                f"Query rewrites exceeded {self.rewrite_budget_ms} ms budget, "
+                "using original question results only"
+            )
+        except BaseException:
+            if original_task is not None:
+                original_task.cancel()
+            raise
+
+        ranked: list[RankedResults] = []
+        if original_task is not None:
+            query_vector, ranked = await original_task
+        ranked += await run_in_search_pool(
+            self.search_ranked, self._build_queries(query, generated), doc_ids=doc_ids
+        )
+        return await run_in_search_pool(
+            self.diversify, query, query_vector, merge_ranked_records(ranked)
+        )
+
+
+def _create_callbacks(
+    question: str,
+) -> tuple[list[Any], MultiQueryLoggingCallback]:
+    """Создает колбэки логирования для одного вопроса."""
     question_callback = QuestionLoggingCallback()
     mqr_callback = MultiQueryLoggingCallback()
     mqr_callback.original_question = question
+    return [question_callback, mqr_callback], mqr_callback
 
-    callbacks = [question_callback, mqr_callback]
-
-    # 1) LLM для MQR и финального ответа
-    llm = ChatOpenAI(
-        model=selected_model,
-        temperature=get_llm_temperature(),
-        callbacks=callbacks,
-    )
-
-    # 2) Промпт для мульти-запросов
-    query_prompt_text = get_prompt("multi_query_retriever")
-    if query_prompt_text is None:
-        raise ValueError("Не удалось загрузить промпт multi_query_retriever")
-
-    QUERY_PROMPT = PromptTemplate(
-        input_variables=["question"],
-        template=query_prompt_text,
-    )
-
-    # 3) Ретривер с MQR
-    retriever = MultiQueryRetriever.from_llm(
-        vector_db.as_retriever(search_kwargs={"k": get_search_k()}),
-        llm,
-        prompt=QUERY_PROMPT,
-        include_original=True,
-    )
-
-    # -------- НОВОЕ: сначала запускаем ретривер → логируем чанки -----------------
-    docs = retriever.invoke(
-        question, config={"callbacks": callbacks}
-    )  # список документов
 
+def _log_documents(docs: list[Document]) -> None:
+    """Логирует выбранные чанки."""
     logger.info("Top-K chunks selected:")
     for d in docs:
         cid = d.metadata.get("chunk_id")
@@ -82,51 +659,630 @@ def process_question(question: str, vector_db: Chroma) -> str:
         preview = d.page_content.replace("\n", " ")[:60] + "…"
         logger.info(f"  {cid:<12} {cite:<10} {preview}")
 
-    # Строим строку контекста так же, как это делает format_docs()
+
+def _log_summary(question: str, mqr_callback: MultiQueryLoggingCallback) -> None:
+    """Финальное логирование всех вопросов."""
+    logger.info("=== Question Summary ===")
+    logger.info(f"Original question: {question}")
+    if mqr_callback.reformulated_questions:
+        logger.info("Reformulated questions:")
+        for i, q in enumerate(mqr_callback.reformulated_questions, 1):
+            logger.info(f"  {i}. {q}")
+    logger.info("=== End RAG processing ===")
+
+
+def format_context(docs: list[Document]) -> str:
+    """
+    Строит строку контекста из найденных чанков.
+
+    Args:
+        docs: Найденные документы
+
+    Returns:
+        str: Контекст для RAG промпта
+    """
     context_parts = []
+    for d in docs:
+        context_part = f"{format_context_header(d.metadata)}\n{d.page_content.strip()}"
+        context_parts.append(context_part)
+
+    return "\n\n".join(context_parts)
+
+
+def get_sources(docs: list[Document]) -> dict[str, Any]:
+    """
+    Собирает метаданные источников для клиента (цитаты и chunk_id).
+
+    Args:
+        docs: Найденные документы
+
+    Returns:
+        Словарь со списками citations и chunk_ids
+    """
+    citations: list[dict[str, Any]] = []
+    # Одинаковые ссылки (§) разных документов корпуса - разные источники
+    seen: set[tuple[str, str]] = set()
     for d in docs:
         m = d.metadata
-        context_part = (
-            f"[{m['citation']}]  "
-            f"title: {m.get('title', '').strip()}  |  "
-            f"part: {m.get('part')}{m.get('subpart', '') or ''}  |  "
-            f"pages: {m.get('page_start')}-{m.get('page_end')}\n"
-            f"{d.page_content.strip()}"
+        doc_id = str(m.get(DOC_ID_KEY, ""))
+        cite = str(m.get("citation", "unknown"))
+        if (doc_id, cite) not in seen:
+            seen.add((doc_id, cite))
+            citations.append(
+                {
+                    "citation": cite,
+                    "title": m.get("title"),
+                    "page_start": m.get("page_start"),
+                    "page_end": m.get("page_end"),
+                    "doc_id": doc_id,
+                }
+            )
+        # Тот же текст в других разделах (почти повторы, слитые при индексации)
+        for duplicate, page_start, page_end in duplicate_sources(m):
+            if (doc_id, duplicate) in seen:
+                continue
+            seen.add((doc_id, duplicate))
+            citations.append(
+                {
+                    "citation": duplicate,
+                    "title": None,
+                    "page_start": page_start,
+                    "page_end": page_end,
+                    "doc_id": doc_id,
+                }
+            )
+    return {
+        "citations": citations,
+        "chunk_ids": [
+            chunk_id
+            for d in docs
+            for chunk_id in d.metadata.get("merged_chunk_ids")
+            or [d.metadata.get("chunk_id")]
+        ],
+    }
+
+
+class RagPipeline:
+    """
+    Долгоживущий RAG пайплайн, создаваемый один раз на процесс.
+
+    Клиенты OpenAI (с keep-alive пулом соединений), ретривер и шаблоны
+    промптов создаются при инициализации. На пути запроса остается только
+    работа, зависящая от вопроса; колбэки передаются через ``config``.
+
+    Перед генерацией ответа проверяется семантический кэш ответов: эмбеддинг
+    вопроса считается один раз и переиспользуется для поиска в индексе.
+    """
+
+    def __init__(self, vector_db: VectorDB) -> None:
+        """
+        Args:
+            vector_db: Векторная база данных
+        """
+        self.vector_db = vector_db
+
+        selected_model = get_llm_model()
+        logger.info(f"Creating RAG pipeline, model: {selected_model}")
+
+        # Постоянные HTTP-клиенты OpenAI (sync и async)
+        self._http_client = httpx.Client(
+            limits=OPENAI_HTTP_LIMITS, timeout=OPENAI_HTTP_TIMEOUT
+        )
+        self._async_http_client = httpx.AsyncClient(
+            limits=OPENAI_HTTP_LIMITS, timeout=OPENAI_HTTP_TIMEOUT
+        )
+        api_key = get_openai_api_key()
+        self.llm = ChatOpenAI(
+            model=selected_model,
+            temperature=get_llm_temperature(),
+            client=openai.OpenAI(
+                api_key=api_key, http_client=self._http_client
+            ).chat.completions,
+            async_client=openai.AsyncOpenAI(
+                api_key=api_key, http_client=self._async_http_client
+            ).chat.completions,
         )
-        context_parts.append(context_part)
 
-    context_str = "\n\n".join(context_parts)
-    logger.info(f"Context: {context_str}")
+        self.answer_cache: Optional[SemanticAnswerCache] = (
+            SemanticAnswerCache(
+                threshold=get_answer_cache_threshold(),
+                max_entries=get_answer_cache_max_entries(),
+                ttl_seconds=get_answer_cache_ttl_seconds(),
+            )
+            if is_answer_cache_enabled()
+            else None
+        )
 
-    # 4) RAG промпт
-    rag_prompt_text = get_prompt("rag_prompt")
-    if rag_prompt_text is None:
-        raise ValueError("Не удалось загрузить промпт rag_prompt")
+        self._query_prompt_text: Optional[str] = None
+        self._rag_prompt_text: Optional[str] = None
+        self._retriever: Optional[FanoutMultiQueryRetriever] = None
+        self._rag_prompt: Optional[ChatPromptTemplate] = None
+        self._refresh_templates()
 
-    RAG_PROMPT = ChatPromptTemplate.from_template(rag_prompt_text)
+    def _refresh_templates(self) -> None:
+        """
+        Пересобирает шаблоны, только если текст промпта изменился на диске.
+        """
+        query_prompt_text = get_prompt("multi_query_retriever")
+        if query_prompt_text is None:
+            raise ValueError("Не удалось загрузить промпт multi_query_retriever")
 
-    messages = RAG_PROMPT.format_messages(context=context_str, question=question)
+        if query_prompt_text != self._query_prompt_text or self._retriever is None:
+            if self._query_prompt_text is not None:
+                logger.info("Prompt multi_query_retriever changed, rebuilding")
+            QUERY_PROMPT = PromptTemplate(
+                input_variables=["question"],
+                template=query_prompt_text,
+            )
+            self._retriever = FanoutMultiQueryRetriever(
+                vector_db=self.vector_db,
+                query_chain=QUERY_PROMPT | self.llm | LineListOutputParser(),
+                k=get_search_k(),
+                include_original=True,
+                rewrite_budget_ms=get_rewrite_budget_ms(),
+                query_cache=get_query_cache(),
+                lexical_index=get_lexical_index(self.vector_db)
+                if is_hybrid_search_enabled()
+                else None,
+                rrf_k=get_rrf_k(),
+                section_index=(
+                    get_section_index(self.vector_db)
+                    if is_citation_fast_path_enabled()
+                    else None
+                ),
+                mmr=(
+                    MMRSettings(
+                        lambda_mult=get_mmr_lambda(),
+                        candidates=get_mmr_candidates(),
+                        top_n=get_mmr_top_n(),
+                        token_budget=get_context_token_budget(),
+                    )
+                    if is_mmr_enabled()
+                    else None
+                ),
+            )
+            self._query_prompt_text = query_prompt_text
 
-    # Логируем финальный промпт
-    logger.info("Final RAG prompt:")
-    for i, message in enumerate(messages):
-        logger.info(f"Message {i + 1} ({message.type}): {message.content}")
+        rag_prompt_text = get_prompt("rag_prompt")
+        if rag_prompt_text is None:
+            raise ValueError("Не удалось загрузить промпт rag_prompt")
 
-    # 5) Запрашиваем LLM и парсим ответ
-    raw_response = llm.invoke(messages, config={"callbacks": callbacks})
-    response: str = StrOutputParser().invoke(raw_response)
+        if rag_prompt_text != self._rag_prompt_text or self._rag_prompt is None:
+            if self._rag_prompt_text is not None:
+                logger.info("Prompt rag_prompt changed, rebuilding")
+            self._rag_prompt = ChatPromptTemplate.from_template(rag_prompt_text)
+            self._rag_prompt_text = rag_prompt_text
 
-    logger.info("LLM raw response:")
-    logger.info(f"Content: {raw_response.content}")
-    logger.info("Final parsed response generated")
+    @property
+    def retriever(self) -> FanoutMultiQueryRetriever:
+        """Ретривер с переформулировкой вопроса (актуальный промпт)."""
+        self._refresh_templates()
+        assert self._retriever is not None
+        return self._retriever
 
-    # Финальное логирование всех вопросов
-    logger.info("=== Question Summary ===")
-    logger.info(f"Original question: {question}")
-    if mqr_callback.reformulated_questions:
-        logger.info("Reformulated questions:")
-        for i, q in enumerate(mqr_callback.reformulated_questions, 1):
-            logger.info(f"  {i}. {q}")
-    logger.info("=== End RAG processing ===")
+    def cache_fingerprint(self) -> str:
+        """
+        Fingerprint состояния, от которого зависят ответы: версия индекса,
+        тексты промптов и модель LLM. При его смене кэш ответов сбрасывается.
+        """
+        self._refresh_templates()
+        parts = [
+            get_index_version(self.vector_db),
+            get_llm_model(),
+            self._query_prompt_text or "",
+            self._rag_prompt_text or "",
+        ]
+        return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+    def embed_question(self, question: str) -> list[float]:
+        """Эмбеддинг исходного вопроса (для кэша ответов и поиска)."""
+        return self.retriever.embed([question])[0]
+
+    def _cache_lookup(
+        self, vector: Optional[list[float]], doc_ids: Optional[list[str]] = None
+    ) -> Optional[CachedAnswer]:
+        if self.answer_cache is None or vector is None:
+            return None
+        return self.answer_cache.lookup(
+            vector, self.cache_fingerprint(), scope_key(doc_ids)
+        )
+
+    def _cache_store(
+        self,
+        vector: Optional[list[float]],
+        question: str,
+        answer: str,
+        sources: dict[str, Any],
+        doc_ids: Optional[list[str]] = None,
+    ) -> None:
+        if self.answer_cache is None or vector is None:
+            return
+        self.answer_cache.store(
+            vector,
+            question,
+            answer,
+            sources,
+            self.cache_fingerprint(),
+            scope_key(doc_ids),
+        )
+
+    def expand(self, docs: list[Document]) -> list[Document]:
+        """Раскрывает чанки до родительских блоков (режим small-to-big)."""
+        if not is_small_to_big_enabled():
+            return docs
+        store = get_parent_store(self.vector_db)
+        if store is None:
+            return docs
+        return expand_to_parents(docs, store, get_small_to_big_max_tokens())
+
+    def retrieve(
+        self,
+        question: str,
+        callbacks: list[Any],
+        query_vector: Optional[list[float]] = None,
+        doc_ids: Optional[list[str]] = None,
+    ) -> list[Document]:
+        """
+        Находит релевантные чанки через мульти-запросный ретривер и собирает
+        из них контекст в пределах бюджета токенов.
+
+        Args:
+            question: Вопрос пользователя
+            callbacks: Колбэки логирования
+            query_vector: Готовый эмбеддинг вопроса (если уже посчитан)
+            doc_ids: Документы корпуса, которыми ограничен поиск (None -
+                весь корпус)
+
+        Returns:
+            Список документов для контекста (соседние чанки склеены)
+        """
+        docs: list[Document] = self.retriever.invoke(
+            question,
+            config={"callbacks": callbacks},
+            query_vector=query_vector,
+            doc_ids=doc_ids,
+        )
+        return self.pack(docs)
+
+    def pack(self, docs: list[Document]) -> list[Document]:
+        """
+        Раскрывает чанки до родительских блоков и упаковывает контекст в
+        бюджет токенов (чтение хранилища блоков и подсчет токенов).
+        """
+        docs = pack_context(self.expand(docs), get_context_token_budget()).documents
+        _log_documents(docs)
+        return docs
+
+    async def aretrieve(
+        self,
+        question: str,
+        callbacks: list[Any],
+        query_vector: Optional[list[float]] = None,
+        doc_ids: Optional[list[str]] = None,
+    ) -> list[Document]:
+        """
+        Асинхронная версия retrieve: проверка промптов на диске, раскрытие
+        до родительских блоков и упаковка контекста выполняются в пуле
+        потоков поиска, а не в event loop.
+        """
+        await run_in_search_pool(self._refresh_templates)
+        assert self._retriever is not None
+        docs: list[Document] = await self._retriever.ainvoke(
+            question,
+            config={"callbacks": callbacks},
+            query_vector=query_vector,
+            doc_ids=doc_ids,
+        )
+        return await run_in_search_pool(self.pack, docs)
+
+    def build_messages(self, question: str, docs: list[Document]) -> list[BaseMessage]:
+        """Формирует сообщения финального RAG промпта."""
+        context_str = format_context(docs)
+        logger.info(f"Context: {context_str}")
+
+        self._refresh_templates()
+        assert self._rag_prompt is not None
+        messages: list[BaseMessage] = self._rag_prompt.format_messages(
+            context=context_str, question=question
+        )
+
+        # Логируем финальный промпт
+        logger.info("Final RAG prompt:")
+        for i, message in enumerate(messages):
+            logger.info(f"Message {i + 1} ({message.type}): {message.content}")
+
+        return messages
+
+    def invoke(self, question: str, doc_ids: Optional[list[str]] = None) -> str:
+        """
+        Отвечает на вопрос пользователя.
+
+        Args:
+            question: Вопрос пользователя
+            doc_ids: Документы корпуса, по которым ищется ответ (None - весь
+                корпус)
+
+        Returns:
+            str: Ответ на вопрос на основе найденных документов
+        """
+        logger.info("=== Starting RAG processing ===")
+        logger.info(f"Original question: {question}")
+        if doc_ids:
+            logger.info(f"Document scope: {doc_ids}")
+
+        vector = self.embed_question(question) if self.answer_cache else None
+        cached = self._cache_lookup(vector, doc_ids)
+        if cached is not None:
+            return cached.answer
+
+        callbacks, mqr_callback = _create_callbacks(question)
+
+        docs = self.retrieve(question, callbacks, query_vector=vector, doc_ids=doc_ids)
+        messages = self.build_messages(question, docs)
+
+        # Запрашиваем LLM и парсим ответ
+        raw_response = self.llm.invoke(messages, config={"callbacks": callbacks})
+        response: str = StrOutputParser().invoke(raw_response)
+
+        logger.info("LLM raw response:")
+        logger.info(f"Content: {raw_response.content}")
+        logger.info("Final parsed response generated")
+
+        _log_summary(question, mqr_callback)
+
+        self._cache_store(vector, question, response, get_sources(docs), doc_ids)
+        return response
+
+    async def ainvoke(self, question: str, doc_ids: Optional[list[str]] = None) -> str:
+        """
+        Асинхронная версия invoke.
+
+        Запросы к OpenAI выполняются через ainvoke, а синхронные запросы к
+        Chroma и Ollama, чтение промптов и хранилища блоков, кэш ответов и
+        сборка промпта уходят в ограниченный пул потоков.
+        """
+        logger.info("=== Starting RAG processing ===")
+        logger.info(f"Original question: {question}")
+        if doc_ids:
+            logger.info(f"Document scope: {doc_ids}")
+
+        vector = (
+            await run_in_search_pool(self.embed_question, question)
+            if self.answer_cache
+            else None
+        )
+        cached = await run_in_search_pool(self._cache_lookup, vector, doc_ids)
+        if cached is not None:
+            return cached.answer
+
+        callbacks, mqr_callback = _create_callbacks(question)
+
+        docs = await self.aretrieve(
+            question, callbacks, query_vector=vector, doc_ids=doc_ids
+        )
+        messages = await run_in_search_pool(self.build_messages, question, docs)
+
+        raw_response = await self.llm.ainvoke(messages, config={"callbacks": callbacks})
+        response: str = StrOutputParser().invoke(raw_response)
+
+        logger.info("LLM raw response:")
+        logger.info(f"Content: {raw_response.content}")
+        logger.info("Final parsed response generated")
+
+        _log_summary(question, mqr_callback)
+
+        await run_in_search_pool(
+            self._cache_store, vector, question, response, get_sources(docs), doc_ids
+        )
+        return response
+
+    def stream(
+        self, question: str, doc_ids: Optional[list[str]] = None
+    ) -> Iterator[dict[str, Any]]:
+        """
+        Потоковая версия invoke.
+
+        Сначала отдает событие ``metadata`` с источниками сразу после ретривера,
+        затем события ``token`` по мере генерации ответа LLM. Ответ из кэша
+        отдается одним событием ``token``.
+
+        Yields:
+            dict: Событие вида {"event": ..., "data": {...}}
+        """
+        logger.info("=== Starting RAG streaming ===")
+        logger.info(f"Original question: {question}")
+        if doc_ids:
+            logger.info(f"Document scope: {doc_ids}")
+
+        vector = self.embed_question(question) if self.answer_cache else None
+        cached = self._cache_lookup(vector, doc_ids)
+        if cached is not None:
+            yield {"event": "metadata", "data": {**cached.sources, "cached": True}}
+            yield {"event": "token", "data": {"text": cached.answer}}
+            return
+
+        callbacks, mqr_callback = _create_callbacks(question)
+
+        docs = self.retrieve(question, callbacks, query_vector=vector, doc_ids=doc_ids)
+        sources = get_sources(docs)
+        yield {"event": "metadata", "data": {**sources, "cached": False}}
+
+        messages = self.build_messages(question, docs)
+
+        parts: list[str] = []
+        for chunk in self.llm.stream(messages, config={"callbacks": callbacks}):
+            token = chunk.content if isinstance(chunk.content, str) else ""
+            if not token:
+                continue
+            parts.append(token)
+            yield {"event": "token", "data": {"text": token}}
+
+        response = "".join(parts)
+        logger.info("LLM streamed response:")
+        logger.info(f"Content: {response}")
+
+        _log_summary(question, mqr_callback)
+
+        self._cache_store(vector, question, response, sources, doc_ids)
 
-    return response
+    async def astream(
+        self, question: str, doc_ids: Optional[list[str]] = None
+    ) -> AsyncIterator[dict[str, Any]]:
+        """Асинхронная версия stream."""
+        logger.info("=== Starting RAG streaming ===")
+        logger.info(f"Original question: {question}")
+        if doc_ids:
+            logger.info(f"Document scope: {doc_ids}")
+
+        vector = (
+            await run_in_search_pool(self.embed_question, question)
+            if self.answer_cache
+            else None
+        )
+        cached = await run_in_search_pool(self._cache_lookup, vector, doc_ids)
+        if cached is not None:
+            yield {"event": "metadata", "data": {**cached.sources, "cached": True}}
+            yield {"event": "token", "data": {"text": cached.answer}}
+            return
+
+        callbacks, mqr_callback = _create_callbacks(question)
+
+        docs = await self.aretrieve(
+            question, callbacks, query_vector=vector, doc_ids=doc_ids
+        )
+        sources = get_sources(docs)
+        yield {"event": "metadata", "data": {**sources, "cached": False}}
+
+        messages = await run_in_search_pool(self.build_messages, question, docs)
+
+        parts: list[str] = []
+        async for chunk in self.llm.astream(messages, config={"callbacks": callbacks}):
+            token = chunk.content if isinstance(chunk.content, str) else ""
+            if not token:
+                continue
+            parts.append(token)
+            yield {"event": "token", "data": {"text": token}}
+
+        response = "".join(parts)
+        logger.info("LLM streamed response:")
+        logger.info(f"Content: {response}")
+
+        _log_summary(question, mqr_callback)
+
+        await run_in_search_pool(
+            self._cache_store, vector, question, response, sources, doc_ids
+        )
+
+    async def aclose(self) -> None:
+        """Закрывает HTTP-клиенты пайплайна."""
+        self._http_client.close()
+        await self._async_http_client.aclose()
+
+
+# Пайплайны процесса по векторным базам: во время замены версии индекса
+# запросы по старой и новой версиям выполняются одновременно
+rag_pipelines: dict[int, RagPipeline] = {}
+_rag_pipelines_lock = threading.Lock()
+
+
+def get_rag_pipeline(vector_db: VectorDB) -> RagPipeline:
+    """
+    Получить пайплайн для векторной базы, создав его при первом обращении.
+
+    Args:
+        vector_db: Векторная база данных
+
+    Returns:
+        RagPipeline: пайплайн, привязанный к vector_db
+    """
+    with _rag_pipelines_lock:
+        pipeline = rag_pipelines.get(id(vector_db))
+        if pipeline is None or pipeline.vector_db is not vector_db:
+            pipeline = RagPipeline(vector_db)
+            rag_pipelines[id(vector_db)] = pipeline
+        return pipeline
+
+
+def release_rag_pipeline(vector_db: VectorDB) -> Optional[RagPipeline]:
+    """
+    Убирает пайплайн освобожденной векторной базы.
+
+    Args:
+        vector_db: Векторная база данных
+
+    Returns:
+        RagPipeline, который нужно закрыть (``aclose``), или None
+    """
+    with _rag_pipelines_lock:
+        pipeline = rag_pipelines.get(id(vector_db))
+        if pipeline is None or pipeline.vector_db is not vector_db:
+            return None
+        return rag_pipelines.pop(id(vector_db))
+
+
+def process_question(
+    question: str, vector_db: VectorDB, doc_ids: Optional[list[str]] = None
+) -> str:
+    """
+    Обрабатывает вопрос пользователя с использованием RAG (Retrieval Augmented Generation).
+
+    Args:
+        question: Вопрос пользователя
+        vector_db: Векторная база данных
+        doc_ids: Документы корпуса, по которым ищется ответ (None - весь корпус)
+
+    Returns:
+        str: Ответ на вопрос на основе найденных документов
+    """
+    return get_rag_pipeline(vector_db).invoke(question, doc_ids)
+
+
+def stream_question(
+    question: str, vector_db: VectorDB, doc_ids: Optional[list[str]] = None
+) -> Iterator[dict[str, Any]]:
+    """
+    Потоковая версия process_question.
+
+    Args:
+        question: Вопрос пользователя
+        vector_db: Векторная база данных
+        doc_ids: Документы корпуса, по которым ищется ответ (None - весь корпус)
+
+    Yields:
+        dict: Событие вида {"event": ..., "data": {...}}
+    """
+    return get_rag_pipeline(vector_db).stream(question, doc_ids)
+
+
+async def aprocess_question(
+    question: str, vector_db: VectorDB, doc_ids: Optional[list[str]] = None
+) -> str:
+    """
+    Асинхронная версия process_question.
+
+    Args:
+        question: Вопрос пользователя
+        vector_db: Векторная база данных
+        doc_ids: Документы корпуса, по которым ищется ответ (None - весь корпус)
+
+    Returns:
+        str: Ответ на вопрос на основе найденных документов
+    """
+    return await get_rag_pipeline(vector_db).ainvoke(question, doc_ids)
+
+
+def astream_question(
+    question: str, vector_db: VectorDB, doc_ids: Optional[list[str]] = None
+) -> AsyncIterator[dict[str, Any]]:
+    """
+    Асинхронная версия stream_question.
+
+    Args:
+        question: Вопрос пользователя
+        vector_db: Векторная база данных
+        doc_ids: Документы корпуса, по которым ищется ответ (None - весь корпус)
+
+    Yields:
+        dict: Событие вида {"event": ..., "data": {...}}
+    """
+    return get_rag_pipeline(vector_db).astream(question, doc_ids)
@@ -15,34 +15,42 @@ class PromptLoader:
             prompts_dir: Путь к директории с промптами
         """
         self.prompts_dir = Path(prompts_dir)
-        self._prompts_cache: dict[str, str] = {}
+        # Кэш: имя промпта -> (mtime файла, содержимое)
+        self._prompts_cache: dict[str, tuple[float, str]] = {}
 
     def get_prompt(self, prompt_name: str) -> Optional[str]:
         """Загружает промпт по имени файла.
 
+        Промпт перечитывается с диска, только если изменилось mtime файла,
+        поэтому правки в .txt подхватываются без перезапуска.
+
         Args:
             prompt_name: Имя файла промпта (без расширения .txt)
 
         Returns:
             Содержимое промпта или None, если файл не найден
         """
-        # Проверяем кэш
-        if prompt_name in self._prompts_cache:
-            return self._prompts_cache[prompt_name]
-
         # Формируем путь к файлу
         prompt_file = self.prompts_dir / f"{prompt_name}.txt"
 
-        if not prompt_file.exists():
+        try:
+            mtime = prompt_file.stat().st_mtime
+        except OSError:
+            self._prompts_cache.pop(prompt_name, None)
             return None
 
+        # Проверяем кэш
+        cached = self._prompts_cache.get(prompt_name)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
         try:
             # Читаем содержимое файла
             with open(prompt_file, encoding="utf-8") as f:
                 content = f.read().strip()
 
             # Кэшируем промпт
-            self._prompts_cache[prompt_name] = content
+            self._prompts_cache[prompt_name] = (mtime, content)
             return content
 
         except Exception as e:
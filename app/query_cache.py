@@ -0,0 +1,354 @@
+"""Двухуровневый кэш эмбеддингов запросов и результатов поиска."""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any, Generic, Optional, TypeVar
+
+import numpy as np
+
+from app.config import (
+    get_query_cache_max_entries,
+    is_query_cache_disk_enabled,
+    is_query_cache_enabled,
+)
+from app.embeddings import embed_queries
+
+logger = logging.getLogger(__name__)
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+# Имя файла дискового уровня кэша внутри директории векторной базы
+QUERY_CACHE_FILENAME = "query_cache.sqlite3"
+
+
+class LRUCache(Generic[K, V]):
+    """Простой потокобезопасный LRU-кэш."""
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._data: OrderedDict[K, V] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> Optional[V]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key: K, value: V) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def discard(self, predicate: Callable[[K], bool]) -> None:
+        """Удаляет записи, ключи которых удовлетворяют условию."""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+def normalize_query(text: str) -> str:
+    """Нормализует текст запроса для ключа кэша (пробелы)."""
+    return " ".join(text.split())
+
+
+def vector_hash(vector: list[float]) -> str:
+    """Хэш вектора запроса (по байтам float32)."""
+    return hashlib.sha1(np.asarray(vector, dtype=np.float32).tobytes()).hexdigest()
+
+
+def _results_hash(vector: list[float], scope: str) -> str:
+    """
+    Ключ результатов поиска: хэш вектора и область поиска. Область не
+    входит в версию индекса, иначе запись результатов одной области
+    удаляла бы с диска результаты остальных.
+    """
+    vhash = vector_hash(vector)
+    return f"{vhash}@{scope}" if scope else vhash
+
+
+class DiskQueryCache:
+    """
+    Дисковый уровень кэша (sqlite), переживающий перезапуски.
+
+    Результаты поиска хранятся с версией индекса. Во время замены индекса
+    запросы обслуживают две версии сразу, поэтому запись результатов не
+    трогает строки другой версии: строки версии удаляются, когда она
+    выведена из работы (``drop_results``).
+    """
+
+    def __init__(self, path: str, max_entries: int) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                "model TEXT NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, text))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_results ("
+                "index_version TEXT NOT NULL, vector_hash TEXT NOT NULL, "
+                "k INTEGER NOT NULL, ids TEXT NOT NULL, "
+                "PRIMARY KEY (index_version, vector_hash, k))"
+            )
+
+    def get_embedding(self, model: str, text: str) -> Optional[list[float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector FROM query_embeddings WHERE model = ? AND text = ?",
+                (model, text),
+            ).fetchone()
+        if row is None:
+            return None
+        vector: list[float] = np.frombuffer(row[0], dtype=np.float32).tolist()
+        return vector
+
+    def put_embedding(self, model: str, text: str, vector: list[float]) -> None:
+        blob = np.asarray(vector, dtype=np.float32).tobytes()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?)",
+                (model, text, blob),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._prune("query_embeddings")
+
+    def get_results(
+        self, index_version: str, vhash: str, k: int
+    ) -> Optional[list[str]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT ids FROM search_results "
+                "WHERE index_version = ? AND vector_hash = ? AND k = ?",
+                (index_version, vhash, k),
+            ).fetchone()
+        if row is None:
+            return None
+        ids: list[str] = json.loads(row[0])
+        return ids
+
+    def put_results(
+        self, index_version: str, vhash: str, k: int, ids: list[str]
+    ) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_results VALUES (?, ?, ?, ?)",
+                (index_version, vhash, k, json.dumps(ids)),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._prune("search_results")
+
+    def drop_results(self, index_version: str) -> None:
+        """Удаляет результаты поиска указанной версии индекса."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM search_results WHERE index_version = ?",
+                (index_version,),
+            )
+
+    def _prune(self, table: str) -> None:
+        """Оставляет в таблице не более max_entries последних строк."""
+        self._conn.execute(
+            f"DELETE FROM {table} WHERE rowid NOT IN "
+            f"(SELECT rowid FROM {table} ORDER BY rowid DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class QueryCache:
+    """
+    Кэш промежуточных шагов поиска.
+
+    - (модель эмбеддингов, нормализованный текст) -> вектор запроса
+    - (версия индекса, хэш вектора и область поиска, k) -> ранжированные
+      id чанков
+
+    Первый уровень - LRU в памяти, второй (опционально) - sqlite на диске.
+    Ключи результатов содержат версию индекса, поэтому после переиндексации
+    устаревшие чанки не возвращаются.
+    """
+
+    def __init__(self, max_entries: int, disk: Optional[DiskQueryCache] = None) -> None:
+        self._embeddings: LRUCache[tuple[str, str], list[float]] = LRUCache(max_entries)
+        self._results: LRUCache[tuple[str, str, int], list[str]] = LRUCache(max_entries)
+        self.disk = disk
+        self._stats_lock = threading.Lock()
+        self.stats_counters = {
+            "embedding_hits": 0,
+            "embedding_disk_hits": 0,
+            "embedding_misses": 0,
+            "results_hits": 0,
+            "results_disk_hits": 0,
+            "results_misses": 0,
+        }
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self.stats_counters[name] += 1
+
+    def embed(self, embeddings: Any, texts: list[str]) -> list[list[float]]:
+        """
+        Эмбеддинги запросов с кэшированием; промахи считаются одним батчем.
+
+        Args:
+            embeddings: Клиент эмбеддингов LangChain
+            texts: Тексты запросов
+
+        Returns:
+            Векторы в том же порядке
+        """
+        model = str(getattr(embeddings, "model", type(embeddings).__name__))
+        vectors: list[Optional[list[float]]] = []
+        missing: list[int] = []
+        for i, text in enumerate(texts):
+            key = (model, normalize_query(text))
+            vector = self._embeddings.get(key)
+            if vector is None and self.disk is not None:
+                vector = self.disk.get_embedding(*key)
+                if vector is not None:
+                    self._embeddings.put(key, vector)
+                    self._count("embedding_disk_hits")
+            elif vector is not None:
+                self._count("embedding_hits")
+            if vector is None:
+                self._count("embedding_misses")
+                missing.append(i)
+            vectors.append(vector)
+
+        if missing:
+            computed = embed_queries(embeddings, [texts[i] for i in missing])
+            for i, vector in zip(missing, computed, strict=True):
+                key = (model, normalize_query(texts[i]))
+                self._embeddings.put(key, vector)
+                if self.disk is not None:
+                    self.disk.put_embedding(*key, vector)
+                vectors[i] = vector
+
+        return [v for v in vectors if v is not None]
+
+    def get_results(
+        self, index_version: str, vector: list[float], k: int, scope: str = ""
+    ) -> Optional[list[str]]:
+        """
+        Ранжированные id чанков для вектора запроса, если они уже известны.
+
+        Args:
+            index_version: Версия индекса
+            vector: Вектор запроса
+            k: Количество результатов
+            scope: Область поиска - документы корпуса (пусто - весь корпус)
+
+        Returns:
+            Список id записей или None
+        """
+        key = (index_version, _results_hash(vector, scope), k)
+        ids = self._results.get(key)
+        if ids is not None:
+            self._count("results_hits")
+            return ids
+        if self.disk is not None:
+            ids = self.disk.get_results(*key)
+            if ids is not None:
+                self._results.put(key, ids)
+                self._count("results_disk_hits")
+                return ids
+        self._count("results_misses")
+        return None
+
+    def put_results(
+        self,
+        index_version: str,
+        vector: list[float],
+        k: int,
+        ids: list[str],
+        scope: str = "",
+    ) -> None:
+        """Сохраняет ранжированные id чанков для вектора запроса."""
+        key = (index_version, _results_hash(vector, scope), k)
+        self._results.put(key, ids)
+        if self.disk is not None:
+            self.disk.put_results(*key, ids)
+
+    def drop_results(self, index_version: str) -> None:
+        """
+        Освобождает результаты поиска версии индекса, выведенной из работы
+        (эмбеддинги запросов от индекса не зависят).
+
+        Args:
+            index_version: Версия замененного индекса
+        """
+        self._results.discard(lambda key: key[0] == index_version)
+        if self.disk is not None:
+            self.disk.drop_results(index_version)
+
+    def stats(self) -> dict[str, Any]:
+        """Счетчики попаданий/промахов и размеры уровней в памяти."""
+        with self._stats_lock:
+            return {
+                **self.stats_counters,
+                "embedding_entries": len(self._embeddings),
+                "results_entries": len(self._results),
+                "disk": self.disk is not None,
+            }
+
+
+# Кэш общий для процесса (переживает пересоздание пайплайна)
+query_cache: Optional[QueryCache] = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> Optional[QueryCache]:
+    """
+    Получить кэш запросов процесса (создается при первом обращении).
+
+    Returns:
+        QueryCache или None, если кэш выключен
+    """
+    global query_cache
+
+    if not is_query_cache_enabled():
+        return None
+
+    with _query_cache_lock:
+        if query_cache is None:
+            from app.vector_store import VECTOR_DB_PATH
+
+            max_entries = get_query_cache_max_entries()
+            disk = None
+            if is_query_cache_disk_enabled():
+                path = os.path.join(VECTOR_DB_PATH, QUERY_CACHE_FILENAME)
+                try:
+                    disk = DiskQueryCache(path, max_entries=max_entries * 10)
+                    logger.info(f"Query cache disk tier: {path}")
+                except (OSError, sqlite3.Error) as e:
+                    logger.warning(f"Query cache disk tier disabled: {e}")
+            query_cache = QueryCache(max_entries, disk)
+        return query_cache
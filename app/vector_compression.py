@@ -0,0 +1,309 @@
+"""Сжатие векторов плоского индекса: float16/int8 и понижение размерности."""
+
+import time
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+
+# Типы хранения сжатых векторов
+COMPRESSION_DTYPES = ("float32", "float16", "int8")
+# Способы понижения размерности
+REDUCTIONS = ("truncate", "pca")
+
+# Строк сжатой матрицы, переводимых в float32 за раз при скоринге
+SCORE_BLOCK_ROWS = 4096
+
+# Повторов замера задержки в отчете (берется лучший)
+REPORT_REPEATS = 3
+
+
+def normalize_rows(vectors: Any) -> np.ndarray:
+    """Нормирует строки матрицы (нулевые строки остаются нулевыми)."""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    normalized: np.ndarray = matrix / np.where(norms > 0, norms, 1.0)
+    return normalized
+
+
+def take_rows(matrix: np.ndarray, rows: np.ndarray) -> np.ndarray:
+    """
+    Строки матрицы по возрастающим номерам: непрерывный диапазон - срез
+    без копирования (для mmap читаются только его страницы), иначе копия.
+    """
+    if len(rows) and int(rows[-1]) - int(rows[0]) + 1 == len(rows):
+        return matrix[int(rows[0]) : int(rows[-1]) + 1]
+    taken: np.ndarray = matrix[rows]
+    return taken
+
+
+def top_k(
+    scores: np.ndarray, k: int, mask: Optional[np.ndarray] = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k по строкам матрицы оценок через ``argpartition``.
+
+    Args:
+        scores: Оценки (запросы x записи), изменяются при заданной маске
+        k: Количество результатов на запрос
+        mask: Допустимые записи
+
+    Returns:
+        Номера записей и оценки, отсортированные по убыванию
+        (запросы x min(k, число допустимых записей))
+    """
+    available = scores.shape[1]
+    if mask is not None:
+        scores[:, ~mask] = -np.inf
+        available = int(mask.sum())
+    k = min(k, available)
+    if k <= 0:
+        empty = np.zeros((scores.shape[0], 0))
+        return empty.astype(np.int64), empty.astype(np.float32)
+    if k < scores.shape[1]:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    return (
+        np.take_along_axis(top, order, axis=1),
+        np.take_along_axis(top_scores, order, axis=1),
+    )
+
+
+@dataclass
+class VectorCompression:
+    """
+    Параметры сжатия векторов для грубого поиска.
+
+    ``dimensions`` - 0 (все измерения) или число измерений после усечения
+    (``truncate``: первые измерения, как в Matryoshka-эмбеддингах) или
+    проекции на главные компоненты (``pca``).
+    """
+
+    dtype: str = "float32"
+    dimensions: int = 0
+    reduction: str = "truncate"
+
+    def __post_init__(self) -> None:
+        if self.dtype not in COMPRESSION_DTYPES:
+            raise ValueError(f"Unsupported vector dtype: {self.dtype}")
+        if self.reduction not in REDUCTIONS:
+            raise ValueError(f"Unsupported dimension reduction: {self.reduction}")
+        if self.dimensions < 0:
+            raise ValueError(f"Invalid vector dimensions: {self.dimensions}")
+
+    @property
+    def enabled(self) -> bool:
+        """Отличаются ли сжатые векторы от исходных float32."""
+        return self.dtype != "float32" or self.dimensions > 0
+
+    def describe(self) -> str:
+        dims = f"{self.dimensions}d {self.reduction}" if self.dimensions else "full"
+        return f"{self.dtype}/{dims}"
+
+
+class CompressedVectors:
+    """
+    Сжатая копия нормированной матрицы векторов.
+
+    Векторы приводятся к меньшей размерности, перенормируются и хранятся
+    как float16 или int8 с масштабом на вектор (``x ≈ code * scale``).
+    Оценка запроса - косинусная близость в сжатом пространстве; NumPy не
+    умножает int8/float16 матрицы через BLAS, поэтому блоки строк
+    переводятся в float32 по ``SCORE_BLOCK_ROWS`` за раз.
+    """
+
+    def __init__(
+        self,
+        codes: np.ndarray,
+        scales: Optional[np.ndarray] = None,
+        projection: Optional[np.ndarray] = None,
+    ) -> None:
+        """
+        Args:
+            codes: Сжатые векторы (записи x измерения)
+            scales: Масштаб каждого вектора (только для int8)
+            projection: Матрица проекции PCA (измерения x исходные измерения)
+        """
+        self.codes = codes
+        self.scales = scales
+        self.projection = projection
+
+    @classmethod
+    def encode(
+        cls, vectors: np.ndarray, compression: VectorCompression
+    ) -> "CompressedVectors":
+        """
+        Сжимает нормированные векторы.
+
+        Args:
+            vectors: Нормированная матрица float32
+            compression: Параметры сжатия
+
+        Returns:
+            CompressedVectors
+        """
+        full = np.asarray(vectors, dtype=np.float32)
+        dimensions = min(compression.dimensions or full.shape[1], full.shape[1])
+        projection = None
+        if compression.reduction == "pca" and dimensions < full.shape[1]:
+            # Без центрирования: скалярные произведения сохраняются в подпространстве
+            _, _, vt = np.linalg.svd(full, full_matrices=False)
+            projection = np.ascontiguousarray(vt[:dimensions], dtype=np.float32)
+        compressed = cls(np.zeros((0, dimensions), dtype=np.float32), None, projection)
+        reduced = compressed.reduce(full)
+
+        if compression.dtype == "int8":
+            scales = np.abs(reduced).max(axis=1) / 127.0
+            scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+            compressed.codes = np.round(reduced / scales[:, None]).astype(np.int8)
+            compressed.scales = scales
+        else:
+            compressed.codes = reduced.astype(compression.dtype)
+        return compressed
+
+    @property
+    def dimensions(self) -> int:
+        return int(self.codes.shape[1])
+
+    @property
+    def nbytes(self) -> int:
+        """Память сжатых векторов, масштабов и проекции, байт."""
+        total = int(self.codes.nbytes)
+        if self.scales is not None:
+            total += int(self.scales.nbytes)
+        if self.projection is not None:
+            total += int(self.projection.nbytes)
+        return total
+
+    def reduce(self, vectors: np.ndarray) -> np.ndarray:
+        """Понижает размерность векторов и перенормирует их."""
+        if self.projection is not None:
+            return normalize_rows(vectors @ self.projection.T)
+        return normalize_rows(vectors[:, : self.dimensions])
+
+    def scores(
+        self, queries: np.ndarray, rows: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Приближенные косинусные близости запросов к векторам.
+
+        Args:
+            queries: Нормированные векторы запросов исходной размерности
+            rows: Номера записей по возрастанию (None - все записи)
+
+        Returns:
+            Матрица оценок (запросы x записи ``rows``)
+        """
+        reduced = self.reduce(queries)
+        codes = self.codes if rows is None else take_rows(self.codes, rows)
+        scores = np.empty((len(reduced), len(codes)), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+            block = codes[start : start + SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[:, start : start + len(block)] = reduced @ block.T
+        if self.scales is not None:
+            scales = self.scales if rows is None else take_rows(self.scales, rows)
+            scores *= scales[None, :]
+        return scores
+
+    def save(self, path: str) -> None:
+        """Сохраняет сжатые векторы в ``.npz`` (без сжатия zip)."""
+        arrays = {"codes": self.codes}
+        if self.scales is not None:
+            arrays["scales"] = self.scales
+        if self.projection is not None:
+            arrays["projection"] = self.projection
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "CompressedVectors":
+        with np.load(path) as data:
+            return cls(
+                data["codes"],
+                data["scales"] if "scales" in data else None,
+                data["projection"] if "projection" in data else None,
+            )
+
+
+def rescore(
+    queries: np.ndarray,
+    vectors: np.ndarray,
+    candidates: np.ndarray,
+    k: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Точная переоценка кандидатов грубого поиска по векторам float32.
+
+    Args:
+        queries: Нормированные векторы запросов
+        vectors: Исходная нормированная матрица (читаются только строки
+            кандидатов, в том числе из mmap)
+        candidates: Номера кандидатов (запросы x N)
+        k: Количество результатов на запрос
+
+    Returns:
+        Номера записей и точные косинусные близости, по убыванию
+    """
+    exact = np.matmul(vectors[candidates], queries[:, :, None])[:, :, 0]
+    top, top_scores = top_k(exact, k)
+    return np.take_along_axis(candidates, top, axis=1), top_scores
+
+
+def recall_report(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    settings: list[VectorCompression],
+    candidates: list[int],
+) -> list[dict[str, Any]]:
+    """
+    Recall@k сжатых вариантов индекса относительно точного поиска float32.
+
+    Args:
+        vectors: Нормированная матрица float32
+        queries: Векторы запросов
+        k: Количество результатов на запрос
+        settings: Варианты сжатия
+        candidates: Размеры пула для точной переоценки (0 - без нее)
+
+    Returns:
+        Строки отчета: сжатие, пул, recall@k, память (байт на вектор и
+        всего, с матрицей проекции PCA) и задержка поиска (мс на запрос,
+        лучший из ``REPORT_REPEATS`` замеров)
+    """
+    queries = normalize_rows(queries)
+    expected, _ = top_k(queries @ vectors.T, k)
+    rows: list[dict[str, Any]] = []
+    for compression in settings:
+        compressed = CompressedVectors.encode(vectors, compression)
+        for pool in candidates:
+            elapsed = float("inf")
+            for _ in range(REPORT_REPEATS):
+                started = time.perf_counter()
+                scores = compressed.scores(queries)
+                if pool > 0:
+                    found, _ = top_k(scores, max(pool, k))
+                    found, _ = rescore(queries, vectors, found, k)
+                else:
+                    found, _ = top_k(scores, k)
+                elapsed = min(elapsed, time.perf_counter() - started)
+            hits = [
+                len(set(row.tolist()) & set(truth.tolist()))
+                for row, truth in zip(found, expected, strict=True)
+            ]
+            rows.append(
+                {
+                    "compression": compression.describe(),
+                    "rescore": pool,
+                    "recall": sum(hits) / max(expected.size, 1),
+                    "bytes_per_vector": compressed.nbytes / max(len(vectors), 1),
+                    "memory_bytes": compressed.nbytes,
+                    "ms_per_query": elapsed * 1000 / max(len(queries), 1),
+                }
+            )
+    return rows
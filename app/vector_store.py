@@ -1,21 +1,105 @@
+import asyncio
 import logging
+import multiprocessing
 import os
-import re
-from typing import Optional, Union
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Optional, TypeVar, Union
 
 import fitz
+import numpy as np
+from chromadb.api.client import SharedSystemClient
 from langchain.schema import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import OllamaEmbeddings
 from langchain_community.vectorstores import Chroma
 
+from app.block_cache import Block, BlockCache
+from app.citation_index import SectionIndex
 from app.config import (
     get_chunk_overlap,
     get_chunk_size,
-    get_document_path,
+    get_dedup_threshold,
+    get_document_paths,
+    get_embed_concurrency,
+    get_embed_max_retries,
+    get_embed_retry_backoff_seconds,
+    get_embed_timeout_seconds,
+    get_embedding_cache_max_mb,
     get_embedding_model,
-    get_ollama_embedding_base_url,
+    get_flat_index_dimensions,
+    get_flat_index_dtype,
+    get_flat_index_reduction,
+    get_flat_rescore_candidates,
+    get_index_drain_timeout_seconds,
+    get_index_keep_versions,
+    get_index_snapshot_path,
+    get_ingest_batch_size,
+    get_ingest_workers,
+    get_search_workers,
+    get_vector_backend,
+    is_block_cache_enabled,
+    is_dedup_enabled,
+    is_embedding_cache_enabled,
 )
+from app.context_packer import count_tokens, tokenizer_name
+from app.corpus import (
+    DOC_ID_KEY,
+    RECORD_ID_SEPARATOR,
+    document_id,
+)
+from app.document_parser import PARSER_VERSION, iter_blocks, parse_document
+from app.embedding_cache import CachedEmbeddings, EmbeddingCache
+from app.embedding_executor import EmbeddingExecutor
+from app.embeddings import EMBEDDING_FORMAT, create_embeddings
+from app.flat_index import (
+    FLAT_METADATA_FILENAME,
+    FLAT_VECTORS_FILENAME,
+    FlatIndex,
+    FlatVectorStore,
+)
+from app.index_manifest import IndexManifest, content_hash, file_sha256
+from app.index_snapshot import (
+    SNAPSHOT_MANIFEST_FILENAME,
+    SNAPSHOT_NORMS_FILENAME,
+    SnapshotManifest,
+    copy_files,
+)
+from app.index_status import (
+    IndexStatus,
+    IngestStats,
+    get_index_status,
+    get_rebuild_status,
+)
+from app.index_versions import (
+    CHROMA_DB_FILENAME,
+    collect_garbage,
+    new_version_name,
+    read_current_version,
+    remove_legacy_index,
+    version_directory,
+    write_current_version,
+)
+from app.ingest_checkpoint import IngestCheckpoint
+from app.lexical_index import BM25Index
+from app.near_duplicates import (
+    DUPLICATE_KEYS,
+    NO_DUPLICATES,
+    ChunkDeduplicator,
+    strip_duplicate_metadata,
+)
+from app.parent_store import ParentBlock, ParentBlockStore, ParentBlockWriter
+from app.pdf_extract import iter_page_texts, iter_page_texts_parallel
+from app.query_cache import get_query_cache
+from app.vector_compression import VectorCompression
 
 # Отключаем телеметрию ChromaDB
 os.environ["ANONYMIZED_TELEMETRY"] = "False"
@@ -23,163 +107,757 @@ os.environ["ANONYMIZED_TELEMETRY"] = "False"
 # Настройка логирования
 logger = logging.getLogger(__name__)
 
-# Глобальная переменная для хранения векторной базы
-vector_db: Optional[Chroma] = None
+T = TypeVar("T")
 
-# Путь к директории для сохранения векторной базы
+# Векторная база на пути запроса: Chroma или плоский индекс NumPy
+VectorDB = Union[Chroma, FlatVectorStore]
+
+# Корневая директория векторной базы: версии индекса и общие кэши
 VECTOR_DB_PATH = "/app/vector_db"
 
+# Размер пачки обновлений метаданных и удалений записей коллекции
+UPDATE_BATCH_SIZE = 500
+
+# Файлы индекса в директории версии, рядом с Chroma
+LEXICAL_INDEX_FILENAME = "bm25_index.json"
+SECTION_INDEX_FILENAME = "section_index.json"
+PARENT_STORE_FILENAME = "parent_blocks.jsonl"
+# Чекпоинт незавершенной индексации
+INGEST_CHECKPOINT_FILENAME = "ingest_checkpoint.json"
+# Манифест готового индекса (документ, параметры чанкинга, модель, схема)
+INDEX_MANIFEST_FILENAME = "index_manifest.json"
+
+# Кэш эмбеддингов чанков в корне, общий для всех версий индекса
+EMBEDDING_CACHE_FILENAME = "embedding_cache.sqlite3"
+# Кэш разбора PDF (блоки § разделов) в корне, общий для всех версий индекса
+BLOCK_CACHE_DIRNAME = "block_cache"
+
+# Индекс sqlite Chroma по значениям метаданных для фильтров where по doc_id
+METADATA_INDEX_NAME = "embedding_metadata_key_string_value"
+
+# Файлы снимка индекса (кроме манифеста снимка): плоский индекс с нормами
+# исходных векторов, манифест сборки и производные индексы
+SNAPSHOT_FILENAMES = (
+    FLAT_VECTORS_FILENAME,
+    FLAT_METADATA_FILENAME,
+    SNAPSHOT_NORMS_FILENAME,
+    INDEX_MANIFEST_FILENAME,
+    LEXICAL_INDEX_FILENAME,
+    SECTION_INDEX_FILENAME,
+    PARENT_STORE_FILENAME,
+)
+
+
+@dataclass
+class IndexHandle:
+    """
+    Векторная база вместе с производными индексами одной версии и
+    счетчиком запросов, которые сейчас по ней выполняются.
+    """
+
+    vector_db: VectorDB
+    lexical_index: Optional[BM25Index] = None
+    section_index: Optional[SectionIndex] = None
+    parent_store: Optional[ParentBlockStore] = None
+    manifest: Optional[IndexManifest] = None
+    in_flight: int = 0
+    _idle: threading.Condition = field(default_factory=threading.Condition, repr=False)
+
+    @classmethod
+    def open(cls, vectordb: VectorDB) -> "IndexHandle":
+        """
+        Загружает производные индексы для векторной базы. С бэкендом
+        ``flat`` поиск переключается на плоский индекс, а клиент Chroma
+        версии освобождается.
+        """
+        handle = cls(
+            vector_db=vectordb,
+            parent_store=load_parent_store(vectordb),
+            lexical_index=load_lexical_index(vectordb),
+            section_index=load_section_index(vectordb),
+            manifest=IndexManifest.load(
+                os.path.join(index_directory(vectordb), INDEX_MANIFEST_FILENAME)
+            ),
+        )
+        if get_vector_backend() == "flat":
+            flat_index = load_flat_index(vectordb)
+            if flat_index is not None:
+                directory = index_directory(vectordb)
+                handle.vector_db = FlatVectorStore(
+                    flat_index, vectordb.embeddings, directory
+                )
+                release_chroma(directory)
+        return handle
+
+    @property
+    def directory(self) -> str:
+        """Директория версии индекса."""
+        return index_directory(self.vector_db)
+
+    def acquire(self) -> None:
+        with self._idle:
+            self.in_flight += 1
+
+    def release(self) -> None:
+        with self._idle:
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                self._idle.notify_all()
+
+    def drain(self, timeout: float) -> bool:
+        """
+        Ждет завершения запросов по индексу.
+
+        Returns:
+            True, если запросов не осталось до истечения таймаута
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self.in_flight == 0, timeout)
+
+
+# Активный индекс процесса (новые запросы идут только в него)
+active_index: Optional[IndexHandle] = None
+
+# Индексы, замененные новой версией, пока по ним дорабатывают запросы
+retiring_indexes: list[IndexHandle] = []
+
+# Смена активного индекса и выбор индекса для запроса
+_swap_lock = threading.Lock()
+
+# Одновременно собирается не больше одной новой версии
+_rebuild_lock = threading.Lock()
+
+
+def iter_chunks(
+    blocks: Iterable[Block],
+    splitter: RecursiveCharacterTextSplitter,
+    doc_id: str,
+) -> Iterator[tuple[ParentBlock, list[Document]]]:
+    """
+    Нарезает блоки на чанки.
+
+    Args:
+        blocks: Поток блоков § разделов
+        splitter: Сплиттер текста
+        doc_id: Id документа (``doc_id`` в метаданных каждого чанка)
+
+    Yields:
+        (родительский блок, чанки блока)
+    """
+    for block_index, b in enumerate(blocks):
+        text = b.get("text", "")
+        if not isinstance(text, str):
+            logger.warning(f"Skipping block with non-string text: {type(text)}")
+            continue
+        # Полный текст блока хранится один раз в хранилище родительских
+        # блоков, а не в метаданных каждого чанка
+        parent = ParentBlock(
+            block_index=block_index,
+            section=str(b["section"]),
+            citation=str(b["citation"]),
+            title=str(b["title"]),
+            page_start=int(b["page_start"]),
+            page_end=int(b["page_end"]),
+            text=text,
+            token_count=count_tokens(text),
+            doc_id=doc_id,
+        )
+        chunks = []
+        for i, chunk in enumerate(splitter.split_text(text), 1):
+            meta = {k: v for k, v in b.items() if k != "text"}
+            meta[DOC_ID_KEY] = doc_id
+            chunk_id = str(b["chunk_id"])
+            base = chunk_id.rsplit("-", 1)[0]  # '164-502'
+            meta["chunk_id"] = f"{base}-{i:02d}"
+            # Позиция чанка в блоке и размер в токенах для сборки контекста
+            meta["block_index"] = block_index
+            meta["chunk_index"] = i
+            meta["token_count"] = count_tokens(chunk)
+            # Хеш текста: неизменные чанки не эмбеддятся повторно
+            meta["content_hash"] = content_hash(chunk)
+            chunks.append(Document(page_content=chunk, metadata=meta))
+        yield parent, chunks
+
+
+def create_splitter() -> RecursiveCharacterTextSplitter:
+    """Сплиттер чанков с настройками из конфигурации."""
+    return RecursiveCharacterTextSplitter(
+        chunk_size=get_chunk_size(),
+        chunk_overlap=get_chunk_overlap(),
+        separators=["\n\n", "\n", ". "],
+    )
+
+
+def index_dedup_threshold() -> float:
+    """Порог удаления почти повторяющихся чанков для манифеста (0 - выключено)."""
+    return get_dedup_threshold() if is_dedup_enabled() else 0.0
+
+
+def chunk_record_id(metadata: dict[str, Any]) -> str:
+    """
+    Детерминированный id записи чанка в коллекции (документ и позиция в
+    нем), чтобы повторная запись после сбоя обновляла, а не дублировала
+    чанки. Записи одного документа идут подряд при сортировке по id.
+    """
+    return (
+        f"{metadata[DOC_ID_KEY]}{RECORD_ID_SEPARATOR}"
+        f"b{int(metadata['block_index']):06d}-c{int(metadata['chunk_index']):03d}"
+    )
+
+
+def open_block_cache() -> Optional[BlockCache]:
+    """Кэш разбора PDF или None, если он выключен."""
+    if not is_block_cache_enabled():
+        return None
+    return BlockCache(os.path.join(VECTOR_DB_PATH, BLOCK_CACHE_DIRNAME), PARSER_VERSION)
+
+
+def iter_pdf_chunks(
+    doc: Any,
+    pdf_path: str,
+    stats: Optional[IngestStats] = None,
+    workers: Optional[int] = None,
+    block_cache: Optional[BlockCache] = None,
+    document_sha256: Optional[str] = None,
+    doc_id: Optional[str] = None,
+) -> Iterator[tuple[ParentBlock, list[Document]]]:
+    """
+    Поток (родительский блок, чанки) для PDF.
+
+    При ``workers > 1`` текст страниц извлекается пулом процессов,
+    результат совпадает с последовательным режимом чанк в чанк.
+
+    С кэшем разбора блоки документа, уже разобранного той же версией
+    парсера, читаются из кэша и сразу нарезаются на чанки; иначе блоки
+    разбора сохраняются в кэш.
+
+    Args:
+        doc: Открытый документ PyMuPDF
+        pdf_path: Путь к PDF файлу (для процессов-воркеров)
+        stats: Счетчики индексации
+        workers: Количество процессов извлечения (по умолчанию из конфигурации)
+        block_cache: Кэш разбора PDF (None - разбирать всегда)
+        document_sha256: SHA-256 PDF файла (по умолчанию считается)
+        doc_id: Id документа (по умолчанию - по имени файла)
+
+    Returns:
+        Итератор (родительский блок, чанки блока)
+    """
+    doc_id = doc_id or document_id(pdf_path)
+    blocks: Iterable[Block]
+    if block_cache is not None:
+        document_sha256 = document_sha256 or file_sha256(pdf_path)
+        cached = block_cache.load(document_sha256)
+        if cached is not None:
+            logger.info(f"Parsed blocks loaded from cache: {len(cached)} blocks")
+            blocks = cached if stats is None else stats.count_block_pages(cached)
+            return iter_chunks(blocks, create_splitter(), doc_id)
+
+    workers = get_ingest_workers() if workers is None else workers
+    if workers > 1:
+        pages = iter_page_texts_parallel(pdf_path, doc.page_count, workers)
+    else:
+        pages = iter_page_texts(doc)
+    if stats is not None:
+        pages = stats.count_pages(pages)
+    blocks = iter_blocks(pages)
+    if block_cache is not None and document_sha256 is not None:
+        blocks = block_cache.record(document_sha256, blocks)
+    return iter_chunks(blocks, create_splitter(), doc_id)
+
+
+def iter_parsed_documents(
+    pdf_paths: Sequence[str],
+    workers: int,
+    block_cache: Optional[BlockCache] = None,
+    documents: Optional[Mapping[str, str]] = None,
+) -> Iterator[tuple[str, int, list[Block]]]:
+    """
+    Блоки документов корпуса в порядке ``pdf_paths``.
+
+    Каждый документ разбирается целиком одним процессом пула
+    (``parse_document``); в работе не больше ``2 * workers`` документов,
+    поэтому память не зависит от размера корпуса. Документы из кэша разбора
+    в пул не отправляются, разобранные сохраняются в кэш.
 
-def create_vector_db(pdf_path: str) -> Chroma:
+    Args:
+        pdf_paths: Пути к PDF файлам
+        workers: Количество процессов (1 - разбор в текущем процессе)
+        block_cache: Кэш разбора PDF (None - разбирать всегда)
+        documents: Id документа -> SHA-256 файла (по умолчанию считается)
+
+    Yields:
+        (путь к PDF, количество страниц, блоки документа)
+    """
+    # spawn: родительский процесс уже держит потоки (Chroma, пулы поиска)
+    pool = (
+        ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        if workers > 1
+        else None
+    )
+    paths = iter(pdf_paths)
+    pending: deque[
+        tuple[
+            str,
+            Optional[str],
+            Union[list[Block], Future[tuple[int, list[Block]]], None],
+        ]
+    ] = deque()
+
+    def submit_next() -> None:
+        path = next(paths, None)
+        if path is None:
+            return
+        sha = None
+        if block_cache is not None:
+            sha = (documents or {}).get(document_id(path)) or file_sha256(path)
+            cached = block_cache.load(sha)
+            if cached is not None:
+                pending.append((path, sha, cached))
+                return
+        pending.append((path, sha, pool.submit(parse_document, path) if pool else None))
+
+    try:
+        for _ in range(2 * workers if pool else 1):
+            submit_next()
+        while pending:
+            path, sha, item = pending.popleft()
+            if isinstance(item, list):
+                blocks = item
+                page_count = max((int(b["page_end"]) for b in blocks), default=0)
+                logger.info(
+                    f"Parsed blocks of {os.path.basename(path)} loaded from cache: "
+                    f"{len(blocks)} blocks"
+                )
+            else:
+                page_count, blocks = (
+                    item.result() if item is not None else parse_document(path)
+                )
+                if block_cache is not None and sha is not None:
+                    try:
+                        block_cache.save(sha, blocks)
+                    except OSError as e:
+                        logger.warning(f"Failed to save block cache: {e}")
+            submit_next()
+            yield path, page_count, blocks
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def iter_corpus_chunks(
+    pdf_paths: Sequence[str],
+    stats: Optional[IngestStats] = None,
+    workers: Optional[int] = None,
+    block_cache: Optional[BlockCache] = None,
+    documents: Optional[Mapping[str, str]] = None,
+) -> Iterator[tuple[ParentBlock, list[Document]]]:
+    """
+    Поток (родительский блок, чанки) для корпуса PDF документов.
+
+    Один документ обрабатывается потоково (``iter_pdf_chunks``, страницы
+    извлекаются пулом при ``workers > 1``); в корпусе документы разбираются
+    параллельно пулом процессов, а чанки отдаются по документам в порядке
+    ``pdf_paths``, поэтому результат не зависит от числа процессов.
+
+    Args:
+        pdf_paths: Пути к PDF файлам
+        stats: Счетчики индексации
+        workers: Количество процессов (по умолчанию ``INGEST_WORKERS``)
+        block_cache: Кэш разбора PDF (None - разбирать всегда)
+        documents: Id документа -> SHA-256 файла (по умолчанию считается)
+
+    Yields:
+        (родительский блок, чанки блока)
+    """
+    workers = get_ingest_workers() if workers is None else workers
+    if len(pdf_paths) == 1:
+        pdf_path = pdf_paths[0]
+        doc = fitz.open(pdf_path)
+        try:
+            yield from iter_pdf_chunks(
+                doc,
+                pdf_path,
+                stats,
+                workers,
+                block_cache,
+                (documents or {}).get(document_id(pdf_path)),
+            )
+        finally:
+            doc.close()
+        return
+
+    splitter = create_splitter()
+    offset = 0
+    for pdf_path, page_count, blocks in iter_parsed_documents(
+        pdf_paths, min(workers, len(pdf_paths)), block_cache, documents
+    ):
+        parsed: Iterable[Block] = blocks
+        if stats is not None:
+            parsed = stats.count_block_pages(blocks, offset)
+        yield from iter_chunks(parsed, splitter, document_id(pdf_path))
+        offset += page_count
+        if stats is not None:
+            stats.pages = offset
+
+
+def check_corpus_files(pdf_paths: Sequence[str]) -> None:
+    """
+    Проверяет файлы корпуса перед сборкой.
+
+    Args:
+        pdf_paths: Пути к PDF файлам
+
+    Raises:
+        FileNotFoundError: Если PDF файл не найден
+        ValueError: Если документов нет, файл пуст или у двух документов
+            совпадает id
+    """
+    if not pdf_paths:
+        raise ValueError("No PDF documents to index")
+    paths_by_id: dict[str, str] = {}
+    for pdf_path in pdf_paths:
+        # Проверяем существование файла
+        if not os.path.exists(pdf_path):
+            raise FileNotFoundError(f"PDF file not found: {pdf_path}")
+
+        # Проверяем, что файл не пустой
+        if os.path.getsize(pdf_path) == 0:
+            raise ValueError(f"PDF file is empty: {pdf_path}")
+
+        doc_id = document_id(pdf_path)
+        if doc_id in paths_by_id:
+            raise ValueError(
+                f"Documents {paths_by_id[doc_id]} and {pdf_path} have the same "
+                f"id: {doc_id}"
+            )
+        paths_by_id[doc_id] = pdf_path
+
+
+def count_corpus_pages(pdf_paths: Sequence[str]) -> int:
     """
-    Обрабатывает загруженный PDF, формирует
+    Общее количество страниц корпуса (для прогресса сборки).
+
+    Raises:
+        ValueError: Если в PDF файле нет страниц
+    """
+    total = 0
+    for pdf_path in pdf_paths:
+        doc = fitz.open(pdf_path)
+        try:
+            if doc.page_count == 0:
+                raise ValueError(f"PDF file has no pages: {pdf_path}")
+            total += doc.page_count
+        finally:
+            doc.close()
+    return total
+
+
+def create_vector_db(
+    pdf_paths: Union[str, Sequence[str]],
+    directory: str,
+    status: Optional[IndexStatus] = None,
+) -> Chroma:
+    """
+    Обрабатывает загруженные PDF, формирует
     чанки c богатыми метаданными и строит Chroma-хранилище.
-    Логика исключительно для документа hipaa-combined.pdf
+    Логика рассчитана на структуру документов CFR (PART / SUBPART / §),
+    как в hipaa-combined.pdf
+
+    Обработка потоковая: страница -> строки -> блок § -> чанки -> пачка
+    эмбеддингов -> запись в Chroma. В памяти одновременно находятся только
+    текущая страница, текущий блок и одна пачка чанков. Блоки документа,
+    уже разобранного той же версией парсера, берутся из кэша разбора
+    (``BLOCK_CACHE_ENABLED``), и сборка сразу переходит к нарезке.
+
+    Корпус из нескольких документов разбирается пулом процессов
+    (``INGEST_WORKERS``) по документу на процесс; каждый чанк получает
+    ``doc_id`` своего документа, по которому поиск ограничивается
+    документами, а в sqlite Chroma строится индекс по значениям метаданных.
+
+    Сборка инкрементальная: если в коллекции уже есть чанки той же модели
+    эмбеддингов, заново эмбеддятся только новые и измененные (по хешу
+    текста) чанки, у неизменных обновляются метаданные, исчезнувшие
+    удаляются. Чанк, текст которого уже есть в индексе на другой позиции
+    (после вставки или удаления блока выше), записывается под новым id с
+    сохраненным вектором. По завершении пишется манифест индекса.
+
+    Почти повторяющиеся чанки (MinHash + LSH, порог ``DEDUP_THRESHOLD``)
+    не индексируются: их цитаты и страницы дописываются в метаданные
+    первого из повторов в том же документе.
 
     Args:
-        pdf_path: Путь к PDF файлу
+        pdf_paths: Путь к PDF файлу или пути к документам корпуса
+        directory: Директория версии индекса
+        status: Состояние сборки для прогресса (по умолчанию - сборка при
+            запуске приложения)
 
     Returns:
         Chroma: векторная база, готовая к поиску.
 
     Raises:
         FileNotFoundError: Если PDF файл не найден
-        ValueError: Если PDF файл поврежден или пуст
+        ValueError: Если PDF файл поврежден или пуст, документов нет или у
+            двух документов совпадает id
         RuntimeError: Если не удалось создать векторную базу
     """
-    logger.info(f"Create vector DB from: {pdf_path}")
+    pdf_paths = [pdf_paths] if isinstance(pdf_paths, str) else list(pdf_paths)
+    logger.info(
+        f"Create vector DB from: {', '.join(pdf_paths)}"
+        if len(pdf_paths) == 1
+        else f"Create vector DB from {len(pdf_paths)} documents"
+    )
 
-    # Проверяем существование файла
-    if not os.path.exists(pdf_path):
-        raise FileNotFoundError(f"PDF file not found: {pdf_path}")
+    check_corpus_files(pdf_paths)
 
-    # Проверяем, что файл не пустой
-    if os.path.getsize(pdf_path) == 0:
-        raise ValueError(f"PDF file is empty: {pdf_path}")
-
-    doc = None
+    cache = None
     try:
-        # ── 1. Читаем весь текст страниц через PyMuPDF ───────────
-        doc = fitz.open(pdf_path)
-        if doc.page_count == 0:
-            raise ValueError(f"PDF file has no pages: {pdf_path}")
-
-        raw_pages = [p.get_text("text") for p in doc]
-
-        # Проверяем, что получили текст
-        if not any(raw_pages):
-            raise ValueError(f"PDF file contains no text: {pdf_path}")
-
-        # ── 2. Регэкспы для структуры ────────────────────────────
-        part_rx = re.compile(r"^PART\s+(\d{3})", re.I)
-        subpart_rx = re.compile(
-            r"^SUBPART\s+([A-Z])(?:[\s—\-:]+(.+))?", re.I
-        )  # ← ловим доп. заголовок после SUBPART X
-        header_rx = re.compile(r"^\s*§\s*(\d{3}\.\d+)\s{2,}", re.I)
-
-        def is_header(line: str) -> bool:
-            return bool(header_rx.match(line.strip()))
-
-        # ── 3. Проход: строим annotated список ─────────────────────
-        state: dict[str, Optional[str]] = {
-            "part": None,
-            "subpart": None,
-            "section": None,
-            "title": None,
-        }
-        annotated = []
-
-        for page_no, text in enumerate(raw_pages, 1):
-            for line in text.splitlines():
-                if m := part_rx.match(line):
-                    state["part"], state["subpart"] = m.group(1), None
-                elif m := subpart_rx.match(line):
-                    state["subpart"] = m.group(1)
-                    title = m.group(2)
-                    if title:
-                        # Убираем лишние точки, пробелы
-                        title = re.sub(r"[\.—\-:]+", " ", title).strip()
-                        state["title"] = title
-                    else:
-                        state["title"] = None
-                elif m := header_rx.match(line):
-                    state["section"] = m.group(1)
-                    # аккуратный заголовок после номера
-                    title = line.split(None, 2)[-1]
-                    title = re.sub(r"^[\s\.]+", "", title).strip()
-                    state["title"] = title
-                annotated.append((page_no, state.copy(), line))
-
-        # ── 4. Склеиваем строки в блоки § ─────────────────────────
-        def new_meta(
-            st: dict[str, Optional[str]], pg: int, idx: int
-        ) -> dict[str, Union[str, int]]:
-            cite = f"§{st['section']}" if st["section"] else "unknown"
-            suf = st["section"].split(".")[1] if st["section"] else "xx"
-            cid = f"{st['part']}-{suf}-{idx:02d}"
-            return {
-                "part": st["part"] or "unknown",
-                "subpart": st["subpart"] or "unknown",
-                "section": st["section"] or "unknown",
-                "title": st["title"] or "unknown",
-                "page_start": pg,
-                "page_end": pg,
-                "chunk_id": cid,
-                "citation": cite,
-            }
+        total_pages = count_corpus_pages(pdf_paths)
 
-        blocks, buf, cur_meta = [], [], None
-        for pg, st, line in annotated:
-            if cur_meta is None:
-                cur_meta = new_meta(st, pg, 0)
-            elif is_header(line) and st["section"] != cur_meta["section"]:
-                if any(s.strip() for s in buf) and cur_meta is not None:
-                    cur_meta["text"] = "\n".join(buf)
-                    blocks.append(cur_meta)
-                cur_meta, buf = new_meta(st, pg, 0), []
-            if cur_meta is not None:
-                buf.append(line)
-                cur_meta["page_end"] = pg
-        if any(s.strip() for s in buf) and cur_meta is not None:
-            cur_meta["text"] = "\n".join(buf)
-            blocks.append(cur_meta)
-
-        # ── 5. Чанкинг ──────────────────────────────────
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=get_chunk_size(),
-            chunk_overlap=get_chunk_overlap(),
-            separators=["\n\n", "\n", ". "],
-        )
-        documents = []
-        for b in blocks:
-            text = b.get("text", "")
-            if not isinstance(text, str):
-                logger.warning(f"Skipping block with non-string text: {type(text)}")
-                continue
-            for i, chunk in enumerate(splitter.split_text(text), 1):
-                meta = b.copy()
-                chunk_id = str(b["chunk_id"])
-                base = chunk_id.rsplit("-", 1)[0]  # '164-502'
-                meta["chunk_id"] = f"{base}-{i:02d}"
-                documents.append(Document(page_content=chunk, metadata=meta))
-        logger.info(f"Created {len(documents)} chunks")
-
-        # ── 6. Индексация в Chroma (с persist) ─────────────────
-        embeddings = OllamaEmbeddings(
-            model=get_embedding_model(), base_url=get_ollama_embedding_base_url()
-        )
-
-        # Создаем persistent ChromaDB
-        vectordb = Chroma.from_documents(
-            documents=documents,
-            embedding=embeddings,
+        batch_size = get_ingest_batch_size()
+        embeddings = create_embeddings(
+            batch_size=batch_size, timeout=get_embed_timeout_seconds()
+        )
+
+        # Persistent ChromaDB, в которую чанки пишутся пачками
+        vectordb = Chroma(
             collection_name="document",
-            persist_directory=VECTOR_DB_PATH,
+            embedding_function=embeddings,
+            persist_directory=directory,
         )
+        checkpoint_path = os.path.join(directory, INGEST_CHECKPOINT_FILENAME)
+
+        # Обновленная на месте версия больше не совпадает со снимком, из
+        # которого она восстановлена
+        snapshot_path = os.path.join(directory, SNAPSHOT_MANIFEST_FILENAME)
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+
+        manifest = IndexManifest.for_source(
+            pdf_paths,
+            get_chunk_size(),
+            get_chunk_overlap(),
+            get_embedding_model(),
+            index_dedup_threshold(),
+            EMBEDDING_FORMAT,
+            tokenizer_name(),
+        )
+        previous = IngestCheckpoint.load(checkpoint_path)
+        if previous is not None:
+            logger.info(
+                f"Resuming interrupted ingestion ({previous.chunks_done} chunks "
+                "were embedded), stored chunks with unchanged text are kept"
+            )
+
+        # Векторы другой модели, формата или схемы записей переиспользовать
+        # нельзя (коллекции без отметки формата собраны до L2-нормализации)
+        build = vectordb._collection.metadata or {}
+        count = vectordb._collection.count()
+        if count > 0 and (
+            build.get("embedding_model") != manifest.embedding_model
+            or build.get("embedding_format") != manifest.embedding_format
+            or build.get("schema_version") != manifest.schema_version
+        ):
+            logger.info(
+                f"Clearing {count} chunks embedded with another model, vector "
+                "format or schema"
+            )
+            vectordb.delete_collection()
+            vectordb = Chroma(
+                collection_name="document",
+                embedding_function=embeddings,
+                persist_directory=directory,
+            )
+
+        # Записи текущего индекса: неизменные чанки остаются как есть
+        records = vectordb._collection.get(include=["metadatas"])
+        stored: dict[str, dict[str, Any]] = {
+            record_id: metadata or {}
+            for record_id, metadata in zip(
+                records["ids"], records["metadatas"] or [], strict=True
+            )
+        }
+        if stored:
+            logger.info(f"Updating existing index of {len(stored)} chunks")
+        # Id записей по хешу текста: чанк, текст которого сместился на другую
+        # позицию (вставка или удаление блока выше), получает сохраненный
+        # вектор; векторы перезаписанных записей ждут своего текста в
+        # displaced, пока он не встретится на новой позиции
+        stored_ids: dict[str, list[str]] = {}
+        for record_id, metadata in stored.items():
+            if metadata.get("content_hash"):
+                stored_ids.setdefault(metadata["content_hash"], []).append(record_id)
+        displaced: dict[str, np.ndarray] = {}
+
+        # Новая версия индекса инвалидирует кэши и производные индексы
+        manifest.index_version = uuid.uuid4().hex
+        set_collection_build(
+            vectordb,
+            embedding_model=manifest.embedding_model,
+            embedding_format=manifest.embedding_format,
+            schema_version=manifest.schema_version,
+            index_version=manifest.index_version,
+        )
+
+        checkpoint = IngestCheckpoint.for_source(
+            pdf_paths,
+            manifest.chunk_size,
+            manifest.chunk_overlap,
+            manifest.embedding_model,
+        )
+        checkpoint.save(checkpoint_path)
+
+        # Неизменные тексты берутся из кэша эмбеддингов, а не из Ollama
+        embedder: Any = embeddings
+        if is_embedding_cache_enabled():
+            cache = EmbeddingCache.open(
+                os.path.join(VECTOR_DB_PATH, EMBEDDING_CACHE_FILENAME),
+                get_embedding_cache_max_mb() * 2**20,
+            )
+            if cache is not None:
+                embedder = CachedEmbeddings(embeddings, cache, manifest.embedding_model)
+
+        stats = IngestStats(total_pages=total_pages)
+        (status or get_index_status()).track(stats)
+        executor: EmbeddingExecutor[list[Document]] = EmbeddingExecutor(
+            embedder,
+            max_in_flight=get_embed_concurrency(),
+            max_retries=get_embed_max_retries(),
+            backoff_seconds=get_embed_retry_backoff_seconds(),
+        )
+        seen: set[str] = set()
+        # Почти повторяющиеся чанки (оглавления, колонтитулы, повторенные
+        # определения) не эмбеддятся: их цитаты и страницы переходят к
+        # первому такому чанку того же документа
+        dedup = (
+            ChunkDeduplicator(manifest.dedup_threshold)
+            if manifest.dedup_threshold > 0
+            else None
+        )
+
+        # Страницы -> блоки § -> чанки -> пачки новых и измененных чанков
+        with ParentBlockWriter(
+            os.path.join(directory, PARENT_STORE_FILENAME), manifest.index_version
+        ) as parents:
+
+            def iter_batches() -> Iterator[tuple[list[Document], list[str]]]:
+                batch: list[Document] = []
+                relabeled: list[Document] = []
+                moved: list[Document] = []
+                for parent, chunks in iter_corpus_chunks(
+                    pdf_paths,
+                    stats,
+                    block_cache=open_block_cache(),
+                    documents=manifest.documents,
+                ):
+                    parents.write(parent)
+                    stats.blocks += 1
+                    for chunk in chunks:
+                        record_id = chunk_record_id(chunk.metadata)
+                        if (
+                            dedup is not None
+                            and dedup.check(record_id, chunk, parent.doc_id) is not None
+                        ):
+                            stats.duplicates += 1
+                            continue
+                        seen.add(record_id)
+                        old = stored.get(record_id)
+                        if old is not None:
+                            old = strip_duplicate_metadata(old)
+                        if old == chunk.metadata:
+                            stats.unchanged += 1
+                        elif (
+                            old
+                            and old.get("content_hash")
+                            == chunk.metadata["content_hash"]
+                        ):
+                            # Текст тот же - обновляем только метаданные
+                            relabeled.append(chunk)
+                        elif chunk.metadata["content_hash"] in stored_ids:
+                            # Текст уже в индексе под другим id
+                            moved.append(chunk)
+                        else:
+                            batch.append(chunk)
+                    if len(relabeled) >= UPDATE_BATCH_SIZE:
+                        update_chunk_metadata(vectordb, relabeled)
+                        stats.updated += len(relabeled)
+                        relabeled = []
+                    if len(moved) >= UPDATE_BATCH_SIZE:
+                        missing = write_moved_chunks(
+                            vectordb, moved, stored, stored_ids, displaced
+                        )
+                        stats.moved += len(moved) - len(missing)
+                        batch.extend(missing)
+                        moved = []
+                    while len(batch) >= batch_size:
+                        stats.phase = "embed"
+                        yield (
+                            batch[:batch_size],
+                            [d.page_content for d in batch[:batch_size]],
+                        )
+                        batch = batch[batch_size:]
+                if relabeled:
+                    update_chunk_metadata(vectordb, relabeled)
+                    stats.updated += len(relabeled)
+                if moved:
+                    missing = write_moved_chunks(
+                        vectordb, moved, stored, stored_ids, displaced
+                    )
+                    stats.moved += len(moved) - len(missing)
+                    batch.extend(missing)
+                if batch:
+                    stats.phase = "embed"
+                    yield batch, [d.page_content for d in batch]
+
+            for documents, vectors in executor.map(iter_batches()):
+                write_chunks(vectordb, documents, vectors, stored, displaced)
+                checkpoint.chunks_done += len(documents)
+                checkpoint.save(checkpoint_path)
+                stats.chunks += len(documents)
+                stats.log()
+
+        if not seen:
+            raise ValueError(f"PDF files contain no text: {', '.join(pdf_paths)}")
+        stats.phase = "persist"
+
+        # Чанки, которых больше нет в документе (сместившиеся уже записаны
+        # под новыми id)
+        removed = [record_id for record_id in stored if record_id not in seen]
+        for start in range(0, len(removed), UPDATE_BATCH_SIZE):
+            vectordb._collection.delete(ids=removed[start : start + UPDATE_BATCH_SIZE])
+        stats.deleted = len(removed)
+
+        # Цитаты и страницы слитых повторов в метаданных канонических чанков
+        update_duplicate_metadata(vectordb, stored, seen, dedup)
+
+        stats.log(final=True)
+        if dedup is not None:
+            dedup.log()
+        if executor.retries:
+            logger.info(f"Embedding batches retried {executor.retries} times")
+        if cache is not None:
+            cache.log_stats()
 
         # Сохраняем базу на диск
         vectordb.persist()
-        logger.info(f"Vector DB saved to: {VECTOR_DB_PATH}")
+        logger.info(f"Vector DB saved to: {directory}")
+
+        # Лексический индекс BM25 по тем же чанкам
+        build_lexical_index(vectordb)
+
+        # Индекс разделов для прямого поиска по ссылкам §
+        build_section_index(vectordb)
+
+        # Фильтр по документам читает id записей из индекса, а не перебором
+        create_metadata_index(directory)
+
+        # Сборка завершена - база больше не считается неполной
+        manifest.chunk_count = len(seen)
+        manifest.duplicates_removed = stats.duplicates
+        manifest.save(os.path.join(directory, INDEX_MANIFEST_FILENAME))
+        IngestCheckpoint.clear(checkpoint_path)
 
         logger.info("Vector DB ready")
         return vectordb
@@ -189,34 +867,79 @@ def create_vector_db(pdf_path: str) -> Chroma:
         raise RuntimeError(f"Failed to create vector database: {e}") from e
 
     finally:
-        # Закрываем PDF документ
-        if doc is not None:
-            doc.close()
-            logger.debug("PDF document closed")
+        if cache is not None:
+            cache.close()
+
 
+def get_index_directory() -> Optional[str]:
+    """
+    Директория индекса для запуска: активная версия (файл ``CURRENT``) или
+    корень векторной базы для индекса старой раскладки.
+
+    Returns:
+        Путь к директории или None, если индекса еще нет
+    """
+    name = read_current_version(VECTOR_DB_PATH)
+    if name is not None:
+        return version_directory(VECTOR_DB_PATH, name)
+    if os.path.exists(os.path.join(VECTOR_DB_PATH, CHROMA_DB_FILENAME)):
+        return VECTOR_DB_PATH
+    return None
 
-def load_vector_db() -> Optional[Chroma]:
+
+def index_directory(vectordb: VectorDB) -> str:
+    """Директория, в которой хранится векторная база и ее индексы."""
+    return str(vectordb._persist_directory)  # type: ignore[has-type]
+
+
+def load_vector_db(directory: Optional[str] = None) -> Optional[VectorDB]:
     """
-    Загружает векторную базу из файла, если она существует
+    Загружает векторную базу из файла, если она существует и
+    соответствует манифесту
+
+    Версия, восстановленная из снимка, с бэкендом ``flat`` открывается
+    как плоский индекс (векторы через mmap, без Chroma); иначе снимок
+    сначала импортируется в коллекцию Chroma.
+
+    Args:
+        directory: Директория индекса (по умолчанию - активная версия)
 
     Returns:
-        Chroma или None если файл не найден
+        VectorDB или None если файл не найден, сборка не завершена или
+        индекс устарел
     """
-    if not os.path.exists(VECTOR_DB_PATH):
-        logger.info(f"Vector DB not found at: {VECTOR_DB_PATH}")
+    directory = directory or get_index_directory()
+    if directory is None or not os.path.exists(directory):
+        logger.info(f"Vector DB not found at: {directory or VECTOR_DB_PATH}")
+        return None
+
+    if os.path.exists(os.path.join(directory, INGEST_CHECKPOINT_FILENAME)):
+        logger.info("Vector DB build is incomplete, it will be resumed")
         return None
 
     try:
-        logger.info(f"Loading vector DB from: {VECTOR_DB_PATH}")
-        embeddings = OllamaEmbeddings(
-            model=get_embedding_model(), base_url=get_ollama_embedding_base_url()
-        )
+        logger.info(f"Loading vector DB from: {directory}")
+        embeddings = create_embeddings()
+
+        snapshot = SnapshotManifest.load(directory)
+        if (
+            snapshot is not None
+            and get_vector_backend() == "flat"
+            and not os.path.exists(os.path.join(directory, CHROMA_DB_FILENAME))
+            and check_index_manifest(get_document_paths(), directory)
+        ):
+            index = FlatIndex.load(directory, get_flat_rescore_candidates())
+            logger.info(f"Vector DB loaded from snapshot with {index.count()} vectors")
+            return FlatVectorStore(index, embeddings, directory)
 
         vectordb = Chroma(
             collection_name="document",
             embedding_function=embeddings,
-            persist_directory=VECTOR_DB_PATH,
+            persist_directory=directory,
         )
+        # Снимок не импортирован в Chroma или импорт был прерван
+        if snapshot is not None and vectordb._collection.count() != snapshot.count:
+            vectordb = import_snapshot(directory)
 
         # Проверяем, что база действительно загружена
         collection = vectordb._collection
@@ -224,6 +947,19 @@ def load_vector_db() -> Optional[Chroma]:
             logger.warning("Vector DB file exists but is empty")
             return None
 
+        # Коллекция без отметки формата векторов собрана до L2-нормализации:
+        # ранжирование по ней с нормированными запросами было бы неверным
+        embedding_format = (collection.metadata or {}).get("embedding_format")
+        if embedding_format != EMBEDDING_FORMAT:
+            logger.warning(
+                f"Vector DB vectors have format {embedding_format or 'unknown'}, "
+                f"{EMBEDDING_FORMAT} expected, the index will be rebuilt"
+            )
+            return None
+
+        if not check_index_manifest(get_document_paths(), directory):
+            return None
+
         logger.info(
             f"Vector DB loaded successfully with {collection.count()} documents"
         )
@@ -234,48 +970,1198 @@ def load_vector_db() -> Optional[Chroma]:
         return None
 
 
-def initialize_vector_db() -> Chroma:
+def initialize_vector_db() -> VectorDB:
     """
     Инициализирует векторную базу при запуске приложения.
-    Сначала пытается загрузить из файла, если не получается - создает новую.
+    Сначала пытается загрузить из файла (при первом запуске - из снимка
+    ``INDEX_SNAPSHOT_PATH``), если не получается - создает новую.
+
+    Ход инициализации отражается в состоянии сборки (``get_index_status``);
+    база и производные индексы публикуются вместе, когда все готово к поиску.
 
     Returns:
-        Chroma: инициализированная векторная база
+        VectorDB: инициализированная векторная база
     """
-    global vector_db
+    global active_index
 
-    if vector_db is not None:
+    if active_index is not None:
         logger.info("Vector DB already initialized")
-        return vector_db
+        return active_index.vector_db
+
+    status = get_index_status()
+    status.start()
+    try:
+        # Сначала пытаемся загрузить из файла, при первом запуске - из снимка
+        directory = get_index_directory()
+        if directory is None:
+            directory = restore_snapshot(get_index_snapshot_path())
+        db = load_vector_db(directory)
+        if db is not None:
+            logger.info("Vector DB loaded from file successfully")
+        else:
+            # Если файл не найден или поврежден, создаем новую базу
+            pdf_paths = get_document_paths()
+            missing = [path for path in pdf_paths if not os.path.exists(path)]
+            if not pdf_paths or missing:
+                message = (
+                    f"PDF file not found: {', '.join(missing)}"
+                    if missing
+                    else "No PDF documents found in DOCUMENTS_DIR"
+                )
+                logger.error(message)
+                raise FileNotFoundError(message)
+
+            logger.info("Creating new vector database...")
+            if directory is None:
+                # Первая сборка - сразу в директорию версии
+                name = new_version_name()
+                db = create_vector_db(
+                    pdf_paths, version_directory(VECTOR_DB_PATH, name)
+                )
+                write_current_version(VECTOR_DB_PATH, name)
+            else:
+                # Продолжение или инкрементальное обновление на месте
+                db = create_vector_db(pdf_paths, directory)
+            logger.info("Vector database created and saved successfully")
+
+        handle = IndexHandle.open(db)
+        with _swap_lock:
+            active_index = handle
+        collect_index_garbage()
+        status.ready()
+        return handle.vector_db
+    except Exception as e:
+        logger.error(f"Failed to initialize vector database: {e}")
+        status.fail(str(e))
+        raise
+
 
-    # Сначала пытаемся загрузить из файла
-    vector_db = load_vector_db()
-    if vector_db is not None:
-        logger.info("Vector DB loaded from file successfully")
-        return vector_db
+def import_snapshot(directory: str) -> Chroma:
+    """
+    Импортирует векторы, тексты и метаданные снимка в коллекцию Chroma
+    той же директории без пересчета эмбеддингов.
 
-    # Если файл не найден или поврежден, создаем новую базу
-    pdf_path = get_document_path()
+    Args:
+        directory: Директория версии, восстановленной из снимка
 
-    if not os.path.exists(pdf_path):
-        logger.error(f"PDF file not found: {pdf_path}")
-        raise FileNotFoundError(f"PDF file not found: {pdf_path}")
+    Returns:
+        Chroma с версией индекса снимка
+    """
+    started = time.perf_counter()
+    index = FlatIndex.load(directory)
+    norms = np.load(os.path.join(directory, SNAPSHOT_NORMS_FILENAME))
+    manifest = IndexManifest.load(os.path.join(directory, INDEX_MANIFEST_FILENAME))
+    if manifest is None:
+        raise ValueError(f"Index manifest not found in snapshot: {directory}")
 
+    embeddings = create_embeddings()
+    vectordb = Chroma(
+        collection_name="document",
+        embedding_function=embeddings,
+        persist_directory=directory,
+    )
+    if vectordb._collection.count() > 0:
+        # Остаток прерванного импорта
+        vectordb.delete_collection()
+        vectordb = Chroma(
+            collection_name="document",
+            embedding_function=embeddings,
+            persist_directory=directory,
+        )
+    set_collection_build(
+        vectordb,
+        embedding_model=manifest.embedding_model,
+        embedding_format=manifest.embedding_format,
+        schema_version=manifest.schema_version,
+        index_version=index.index_version,
+    )
+    for start in range(0, index.count(), UPDATE_BATCH_SIZE):
+        end = min(start + UPDATE_BATCH_SIZE, index.count())
+        # Chroma ищет по l2, поэтому векторам возвращаются исходные нормы
+        vectors = np.asarray(index.vectors[start:end]) * norms[start:end, None]
+        vectordb._collection.upsert(
+            ids=index.ids[start:end],
+            embeddings=vectors.tolist(),
+            metadatas=[index.metadata_at(i) for i in range(start, end)],
+            documents=index.documents[start:end],
+        )
+    vectordb.persist()
+    create_metadata_index(directory)
+    logger.info(
+        f"Snapshot imported into Chroma: {index.count()} chunks in "
+        f"{time.perf_counter() - started:.1f}s"
+    )
+    return vectordb
+
+
+def seed_embedding_cache(directory: str) -> int:
+    """
+    Записывает векторы снимка в кэш эмбеддингов, чтобы инкрементальное
+    обновление восстановленной версии не отправляло в Ollama неизменные
+    тексты.
+
+    Args:
+        directory: Директория версии, восстановленной из снимка
+
+    Returns:
+        Количество записанных векторов
+    """
+    manifest = IndexManifest.load(os.path.join(directory, INDEX_MANIFEST_FILENAME))
+    if not is_embedding_cache_enabled() or manifest is None:
+        return 0
+    cache = EmbeddingCache.open(
+        os.path.join(VECTOR_DB_PATH, EMBEDDING_CACHE_FILENAME),
+        get_embedding_cache_max_mb() * 2**20,
+    )
+    if cache is None:
+        return 0
     try:
-        logger.info("Creating new vector database...")
-        vector_db = create_vector_db(pdf_path)
-        logger.info("Vector database created and saved successfully")
-        return vector_db
+        index = FlatIndex.load(directory)
+        norms = np.load(os.path.join(directory, SNAPSHOT_NORMS_FILENAME))
+        for start in range(0, index.count(), UPDATE_BATCH_SIZE):
+            end = min(start + UPDATE_BATCH_SIZE, index.count())
+            vectors = np.asarray(index.vectors[start:end]) * norms[start:end, None]
+            cache.put_many(
+                manifest.embedding_model,
+                [
+                    (content_hash(text), vector)
+                    for text, vector in zip(
+                        index.documents[start:end], vectors.tolist(), strict=True
+                    )
+                ],
+            )
+        return index.count()
+    finally:
+        cache.close()
+
+
+def restore_snapshot(snapshot_path: str) -> Optional[str]:
+    """
+    Копирует снимок индекса в новую версию и делает ее активной.
+
+    Снимок другой модели эмбеддингов или неполный пропускается: индекс
+    тогда собирается из PDF как обычно.
+
+    Args:
+        snapshot_path: Директория снимка (пусто - снимок не используется)
+
+    Returns:
+        Директория восстановленной версии или None
+    """
+    if not snapshot_path:
+        return None
+    snapshot = SnapshotManifest.load(snapshot_path)
+    if snapshot is None:
+        logger.info(f"Index snapshot not found at: {snapshot_path}")
+        return None
+    problems = snapshot.problems(snapshot_path)
+    if snapshot.embedding_model != get_embedding_model():
+        problems.append(
+            f"embedding model {snapshot.embedding_model}, "
+            f"{get_embedding_model()} expected"
+        )
+    if problems:
+        logger.warning(f"Index snapshot skipped: {'; '.join(problems)}")
+        return None
+
+    started = time.perf_counter()
+    name = new_version_name()
+    directory = version_directory(VECTOR_DB_PATH, name)
+    try:
+        copy_files(snapshot_path, directory, snapshot.files)
+        snapshot.save(directory)
+        seeded = seed_embedding_cache(directory)
     except Exception as e:
-        logger.error(f"Failed to create vector database: {e}")
+        logger.error(f"Failed to restore index snapshot: {e}")
+        shutil.rmtree(directory, ignore_errors=True)
+        return None
+    write_current_version(VECTOR_DB_PATH, name)
+    logger.info(
+        f"Index snapshot {snapshot.index_version} restored to {directory} in "
+        f"{time.perf_counter() - started:.1f}s ({snapshot.count} chunks, "
+        f"{seeded} embeddings cached)"
+    )
+    return directory
+
+
+def export_snapshot(vectordb: Chroma, out: str) -> SnapshotManifest:
+    """
+    Сохраняет версию индекса как снимок: нормированные векторы ``.npy``
+    (открываются через mmap), их нормы, тексты и метаданные по колонкам,
+    манифест сборки, производные индексы и манифест снимка.
+
+    Args:
+        vectordb: Собранная векторная база
+        out: Директория снимка (создается; прежний снимок заменяется)
+
+    Returns:
+        SnapshotManifest
+    """
+    os.makedirs(out, exist_ok=True)
+    # Пока файлы перезаписываются, снимок считается неполным
+    manifest_path = os.path.join(out, SNAPSHOT_MANIFEST_FILENAME)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    records = vectordb._collection.get(include=["documents", "metadatas", "embeddings"])
+    vectors = np.asarray(records["embeddings"], dtype=np.float32)
+    index = FlatIndex.from_records(
+        records["ids"],
+        [text or "" for text in records["documents"] or []],
+        records["metadatas"] or [],
+        vectors,
+        get_index_version(vectordb),
+    )
+    index.save(out)
+    # Плоский индекс упорядочивает записи по id, нормы - в его порядке
+    positions = {record_id: i for i, record_id in enumerate(records["ids"])}
+    order = [positions[record_id] for record_id in index.ids]
+    norms_path = os.path.join(out, SNAPSHOT_NORMS_FILENAME)
+    with open(f"{norms_path}.tmp", "wb") as f:
+        np.save(f, np.linalg.norm(vectors[order], axis=1).astype(np.float32))
+    os.replace(f"{norms_path}.tmp", norms_path)
+
+    directory = index_directory(vectordb)
+    copy_files(
+        directory,
+        out,
+        [
+            INDEX_MANIFEST_FILENAME,
+            LEXICAL_INDEX_FILENAME,
+            SECTION_INDEX_FILENAME,
+            PARENT_STORE_FILENAME,
+        ],
+    )
+    build = IndexManifest.load(os.path.join(directory, INDEX_MANIFEST_FILENAME))
+    snapshot = SnapshotManifest(
+        index_version=index.index_version,
+        embedding_model=build.embedding_model if build else get_embedding_model(),
+        count=index.count(),
+        dimensions=int(vectors.shape[1]) if index.count() else 0,
+        files={
+            name: os.path.getsize(os.path.join(out, name))
+            for name in SNAPSHOT_FILENAMES
+        },
+    )
+    snapshot.save(out)
+    return snapshot
+
+
+def build_index_version(
+    pdf_paths: Union[str, Sequence[str]], status: Optional[IndexStatus] = None
+) -> IndexHandle:
+    """
+    Собирает новую версию индекса в отдельной директории, не трогая
+    активную. Неизменные чанки берутся из кэша эмбеддингов.
+
+    Args:
+        pdf_paths: Путь к PDF файлу или PDF файлы корпуса
+        status: Состояние сборки для прогресса
+
+    Returns:
+        IndexHandle новой версии (еще не активной)
+
+    Raises:
+        RuntimeError: Если сборка не удалась
+    """
+    directory = version_directory(VECTOR_DB_PATH, new_version_name())
+    logger.info(f"Building new index version in: {directory}")
+    try:
+        db = create_vector_db(pdf_paths, directory, status)
+        return IndexHandle.open(db)
+    except Exception:
+        # Каждая пересборка пишет новую версию, продолжать эту не будем
+        release_chroma(directory)
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+
+def activate_index(handle: IndexHandle) -> Optional[IndexHandle]:
+    """
+    Атомарно делает версию активной: новые запросы сразу идут в нее,
+    файл ``CURRENT`` указывает на нее для следующих запусков.
+
+    Args:
+        handle: Загруженная версия индекса
+
+    Returns:
+        Прежний активный индекс (по нему могут дорабатывать запросы)
+    """
+    global active_index
+
+    with _swap_lock:
+        previous = active_index
+        active_index = handle
+        if previous is not None:
+            retiring_indexes.append(previous)
+        if handle.directory != VECTOR_DB_PATH:
+            write_current_version(VECTOR_DB_PATH, os.path.basename(handle.directory))
+
+    logger.info(
+        f"Index version {get_index_version(handle.vector_db)} is active: "
+        f"{handle.directory}"
+    )
+    return previous
+
+
+def retire_index(handle: IndexHandle, timeout: Optional[float] = None) -> None:
+    """
+    Дожидается запросов по замененному индексу и освобождает его ресурсы.
+
+    Args:
+        handle: Замененный индекс
+        timeout: Максимальное ожидание запросов, секунды (по умолчанию -
+            ``INDEX_DRAIN_TIMEOUT_SECONDS``)
+    """
+    timeout = get_index_drain_timeout_seconds() if timeout is None else timeout
+    if not handle.drain(timeout):
+        logger.warning(
+            f"{handle.in_flight} queries still running on the retired index "
+            f"after {timeout:.0f}s, releasing it anyway"
+        )
+    with _swap_lock:
+        if handle in retiring_indexes:
+            retiring_indexes.remove(handle)
+        active = active_index
+    # Результаты поиска версии больше не понадобятся (если она не стала
+    # снова активной, например при перезагрузке той же версии)
+    index_version = get_index_version(handle.vector_db)
+    query_cache = get_query_cache()
+    if (
+        query_cache is not None
+        and index_version
+        and (active is None or get_index_version(active.vector_db) != index_version)
+    ):
+        query_cache.drop_results(index_version)
+    release_chroma(handle.directory)
+    if handle.directory == VECTOR_DB_PATH:
+        remove_legacy_index(
+            VECTOR_DB_PATH,
+            [
+                LEXICAL_INDEX_FILENAME,
+                SECTION_INDEX_FILENAME,
+                PARENT_STORE_FILENAME,
+                INGEST_CHECKPOINT_FILENAME,
+                INDEX_MANIFEST_FILENAME,
+            ],
+        )
+    logger.info(f"Retired index released: {handle.directory}")
+    collect_index_garbage()
+
+
+def release_chroma(directory: str) -> None:
+    """
+    Останавливает клиент Chroma директории (закрывает sqlite и HNSW в
+    памяти): клиенты кэшируются по пути на все время процесса.
+    """
+    system = SharedSystemClient._identifer_to_system.pop(directory, None)
+    if system is not None:
+        system.stop()
+
+
+def collect_index_garbage() -> list[str]:
+    """
+    Удаляет старые и незавершенные версии индекса, кроме активной, ее
+    предшественников по ``INDEX_KEEP_VERSIONS`` и индексов, по которым еще
+    идут запросы.
+
+    Returns:
+        Имена удаленных версий
+    """
+    with _swap_lock:
+        handles = [h for h in [active_index, *retiring_indexes] if h is not None]
+    keep = {os.path.basename(h.directory) for h in handles}
+    current = read_current_version(VECTOR_DB_PATH)
+    if current is not None:
+        keep.add(current)
+    if _rebuild_lock.locked():
+        # Собираемая версия еще не активна, но удалять ее нельзя: она новее
+        # всех остальных и будет сохранена как последняя незавершенная
+        return []
+    return collect_garbage(
+        VECTOR_DB_PATH, keep, get_index_keep_versions(), INGEST_CHECKPOINT_FILENAME
+    )
+
+
+def is_rebuild_running() -> bool:
+    """Идет ли сейчас сборка новой версии индекса."""
+    return _rebuild_lock.locked()
+
+
+def rebuild_vector_db(
+    pdf_paths: Optional[Sequence[str]] = None,
+    prewarm: Optional[Callable[[VectorDB], Any]] = None,
+) -> Optional[IndexHandle]:
+    """
+    Сборка новой версии индекса с горячей заменой (blue/green): старая
+    версия обслуживает запросы, пока собирается новая, затем активный
+    индекс атомарно заменяется.
+
+    Замененный индекс нужно освободить через ``retire_index``, когда по
+    нему доработают начатые запросы.
+
+    Args:
+        pdf_paths: PDF файлы (по умолчанию - корпус из конфигурации)
+        prewarm: Подготовка новой версии до замены (например, создание RAG
+            пайплайна), чтобы первый запрос к ней не делал эту работу
+
+    Returns:
+        Замененный индекс или None, если активного индекса не было
+
+    Raises:
+        RuntimeError: Если пересборка уже идет или сборка не удалась
+    """
+    if not _rebuild_lock.acquire(blocking=False):
+        raise RuntimeError("Index rebuild is already running")
+    status = get_rebuild_status()
+    status.start()
+    try:
+        handle = build_index_version(pdf_paths or get_document_paths(), status)
+        if prewarm is not None:
+            prewarm(handle.vector_db)
+        previous = activate_index(handle)
+        status.ready()
+        return previous
+    except Exception as e:
+        logger.error(f"Index rebuild failed: {e}")
+        status.fail(str(e))
         raise
+    finally:
+        _rebuild_lock.release()
+
+
+def reload_vector_db(
+    prewarm: Optional[Callable[[VectorDB], Any]] = None,
+) -> Optional[IndexHandle]:
+    """
+    Переключается на версию из файла ``CURRENT``, если она отличается от
+    активной (например, собранную командой ``python -m app.cli rebuild``
+    в другом процессе).
+
+    Args:
+        prewarm: Подготовка версии до замены (см. ``rebuild_vector_db``)
+
+    Returns:
+        Замененный индекс (освобождается через ``retire_index``) или None,
+        если переключаться не на что
+
+    Raises:
+        RuntimeError: Если версию из ``CURRENT`` не удалось загрузить
+    """
+    directory = get_index_directory()
+    active = active_index
+    if directory is None or (active is not None and active.directory == directory):
+        return None
+    db = load_vector_db(directory)
+    if db is None:
+        raise RuntimeError(f"Failed to load index version: {directory}")
+    handle = IndexHandle.open(db)
+    if prewarm is not None:
+        try:
+            prewarm(handle.vector_db)
+        except Exception as e:
+            release_chroma(directory)
+            raise RuntimeError(f"Failed to prepare index version: {e}") from e
+    return activate_index(handle)
+
+
+@contextmanager
+def acquire_vector_db() -> Iterator[Optional[VectorDB]]:
+    """
+    Векторная база для одного запроса: пока запрос выполняется, замененный
+    индекс не освобождается.
+
+    Yields:
+        Векторная база активного индекса или None, если индекс не загружен
+    """
+    with _swap_lock:
+        handle = active_index
+        if handle is not None:
+            handle.acquire()
+    try:
+        yield handle.vector_db if handle is not None else None
+    finally:
+        if handle is not None:
+            handle.release()
+
+
+def _handle_for(vectordb: Optional[VectorDB]) -> Optional[IndexHandle]:
+    """Индекс для векторной базы (активный, если база не указана)."""
+    with _swap_lock:
+        if vectordb is None:
+            return active_index
+        for handle in [active_index, *retiring_indexes]:
+            if handle is not None and handle.vector_db is vectordb:
+                return handle
+    return None
+
+
+def check_index_manifest(pdf_paths: Union[str, Sequence[str]], directory: str) -> bool:
+    """
+    Сравнивает манифест индекса с текущими документами и конфигурацией.
+
+    Args:
+        pdf_paths: Путь к PDF файлу или PDF файлы корпуса
+        directory: Директория индекса
+
+    Returns:
+        False, если индекс собран из другого документа или с другими
+        параметрами и его нужно обновить
+    """
+    manifest_path = os.path.join(directory, INDEX_MANIFEST_FILENAME)
+    manifest = IndexManifest.load(manifest_path)
+    if manifest is None:
+        logger.warning(
+            f"Index manifest not found at {manifest_path}: changes of the "
+            "document, chunking or embedding model are not detected until the "
+            "index is rebuilt"
+        )
+        return True
+    paths = [pdf_paths] if isinstance(pdf_paths, str) else list(pdf_paths)
+    missing = [path for path in paths if not os.path.exists(path)]
+    if not paths or missing:
+        logger.warning(
+            "Documents not found, index manifest not checked: "
+            f"{', '.join(missing) or 'empty corpus'}"
+        )
+        return True
+    mismatches = manifest.mismatches(
+        IndexManifest.for_source(
+            paths,
+            get_chunk_size(),
+            get_chunk_overlap(),
+            get_embedding_model(),
+            index_dedup_threshold(),
+            EMBEDDING_FORMAT,
+            tokenizer_name(),
+        )
+    )
+    if mismatches:
+        logger.warning(
+            "Vector DB does not match the current document or configuration "
+            f"({'; '.join(mismatches)}), the index will be updated"
+        )
+        return False
+    return True
+
+
+def get_index_version(vectordb: VectorDB) -> str:
+    """
+    Версия индекса: новая при каждой сборке или инкрементальном обновлении
+    (для коллекций старых версий - id коллекции Chroma). Используется для
+    инвалидации кэшей.
+
+    Args:
+        vectordb: Векторная база
+
+    Returns:
+        str: Версия индекса
+    """
+    metadata = vectordb._collection.metadata or {}
+    return str(metadata.get("index_version") or vectordb._collection.id)
+
+
+def set_collection_build(vectordb: Chroma, **values: Union[str, int]) -> None:
+    """
+    Записывает параметры сборки (модель, схема, версия индекса) в
+    метаданные коллекции Chroma, рядом с самими векторами.
+
+    Args:
+        vectordb: Векторная база
+        **values: Значения для записи
+    """
+    collection = vectordb._collection
+    collection.modify(metadata={**(collection.metadata or {}), **values})
+
+
+def create_metadata_index(directory: str) -> None:
+    """
+    Создает в sqlite Chroma индекс ``embedding_metadata (key, string_value)``.
+
+    Chroma 0.4 хранит метаданные с ключом (id, key), и фильтр ``where`` по
+    ``doc_id`` перебирал бы метаданные всех чанков корпуса; с индексом id
+    записей документа читаются диапазоном индекса.
+
+    Args:
+        directory: Директория версии индекса
+    """
+    path = os.path.join(directory, CHROMA_DB_FILENAME)
+    with closing(sqlite3.connect(path, timeout=30)) as connection:
+        connection.execute(
+            f"CREATE INDEX IF NOT EXISTS {METADATA_INDEX_NAME} "
+            "ON embedding_metadata (key, string_value)"
+        )
+        connection.commit()
+
+
+def update_chunk_metadata(vectordb: Chroma, chunks: list[Document]) -> None:
+    """
+    Обновляет метаданные записей чанков без пересчета эмбеддингов.
+
+    Args:
+        vectordb: Векторная база
+        chunks: Чанки с новыми метаданными
+    """
+    for start in range(0, len(chunks), UPDATE_BATCH_SIZE):
+        batch = chunks[start : start + UPDATE_BATCH_SIZE]
+        vectordb._collection.update(
+            ids=[chunk_record_id(d.metadata) for d in batch],
+            metadatas=[d.metadata for d in batch],
+        )
 
 
-def get_vector_db() -> Optional[Chroma]:
+def write_chunks(
+    vectordb: Chroma,
+    chunks: list[Document],
+    vectors: list[list[float]],
+    stored: dict[str, dict[str, Any]],
+    displaced: dict[str, np.ndarray],
+) -> None:
+    """
+    Записывает чанки с векторами.
+
+    Векторы записей, которые перезаписываются другим текстом, сохраняются
+    в ``displaced``: их текст мог сместиться дальше по документу.
+
+    Args:
+        vectordb: Векторная база
+        chunks: Чанки
+        vectors: Векторы чанков
+        stored: Метаданные записей индекса (обновляются записанными чанками)
+        displaced: Хеш текста -> вектор перезаписанной записи
+    """
+    ids = [chunk_record_id(d.metadata) for d in chunks]
+    replaced = [
+        record_id
+        for record_id, chunk in zip(ids, chunks, strict=True)
+        if record_id in stored
+        and stored[record_id].get("content_hash") != chunk.metadata["content_hash"]
+    ]
+    if replaced:
+        records = vectordb._collection.get(
+            ids=replaced, include=["embeddings", "metadatas"]
+        )
+        for metadata, vector in zip(
+            records["metadatas"] or [], records["embeddings"] or [], strict=True
+        ):
+            if metadata and metadata.get("content_hash"):
+                displaced[str(metadata["content_hash"])] = np.asarray(
+                    vector, dtype=np.float32
+                )
+    vectordb._collection.upsert(
+        ids=ids,
+        embeddings=vectors,
+        metadatas=[d.metadata for d in chunks],
+        documents=[d.page_content for d in chunks],
+    )
+    for record_id, chunk in zip(ids, chunks, strict=True):
+        stored[record_id] = chunk.metadata
+
+
+def write_moved_chunks(
+    vectordb: Chroma,
+    chunks: list[Document],
+    stored: dict[str, dict[str, Any]],
+    stored_ids: dict[str, list[str]],
+    displaced: dict[str, np.ndarray],
+) -> list[Document]:
+    """
+    Записывает чанки, текст которых уже есть в индексе под другим id,
+    с сохраненными векторами вместо нового эмбеддинга.
+
+    Args:
+        vectordb: Векторная база
+        chunks: Чанки со сместившимся текстом
+        stored: Метаданные записей индекса
+        stored_ids: Хеш текста -> id записей индекса до сборки
+        displaced: Хеш текста -> вектор перезаписанной записи
+
+    Returns:
+        Чанки, сохраненный вектор которых уже не найден (их нужно эмбеддить)
+    """
+    vectors: dict[str, list[float]] = {}
+    sources: dict[str, str] = {}
+    for chunk in chunks:
+        content = chunk.metadata["content_hash"]
+        if content in vectors or content in sources:
+            continue
+        if content in displaced:
+            vectors[content] = displaced.pop(content).tolist()
+            continue
+        # Запись, которая еще хранит этот текст
+        source = next(
+            (
+                record_id
+                for record_id in stored_ids.get(content, [])
+                if stored.get(record_id, {}).get("content_hash") == content
+            ),
+            None,
+        )
+        if source is not None:
+            sources[content] = source
+    if sources:
+        records = vectordb._collection.get(
+            ids=list(set(sources.values())), include=["embeddings"]
+        )
+        by_id = dict(zip(records["ids"], records["embeddings"] or [], strict=True))
+        for content, source in sources.items():
+            vectors[content] = np.asarray(by_id[source], dtype=np.float32).tolist()
+
+    found = [d for d in chunks if d.metadata["content_hash"] in vectors]
+    if found:
+        write_chunks(
+            vectordb,
+            found,
+            [vectors[d.metadata["content_hash"]] for d in found],
+            stored,
+            displaced,
+        )
+    return [d for d in chunks if d.metadata["content_hash"] not in vectors]
+
+
+def update_duplicate_metadata(
+    vectordb: Chroma,
+    stored: dict[str, dict[str, Any]],
+    seen: Iterable[str],
+    dedup: Optional[ChunkDeduplicator],
+) -> None:
+    """
+    Записывает сведения о слитых повторах в метаданные канонических чанков.
+
+    Обновляются только записи, у которых эти сведения изменились; чанкам,
+    у которых повторов больше нет (или при выключенном удалении повторов),
+    записываются пустые значения ``NO_DUPLICATES``.
+
+    Args:
+        vectordb: Векторная база
+        stored: Метаданные записей до сборки
+        seen: Id записей текущего документа
+        dedup: Результат удаления повторов (None - выключено)
+    """
+    updates: dict[str, dict[str, Any]] = {}
+    for record_id in seen:
+        wanted = (
+            dedup.duplicate_metadata(record_id) if dedup is not None else NO_DUPLICATES
+        )
+        old = stored.get(record_id, {})
+        if wanted != {key: old.get(key, NO_DUPLICATES[key]) for key in DUPLICATE_KEYS}:
+            updates[record_id] = wanted
+    record_ids = list(updates)
+    for start in range(0, len(record_ids), UPDATE_BATCH_SIZE):
+        batch = record_ids[start : start + UPDATE_BATCH_SIZE]
+        vectordb._collection.update(
+            ids=batch, metadatas=[updates[record_id] for record_id in batch]
+        )
+
+
+def build_lexical_index(vectordb: VectorDB) -> BM25Index:
+    """
+    Строит лексический индекс BM25 по всем чанкам коллекции и сохраняет
+    его рядом с директорией Chroma.
+
+    Args:
+        vectordb: Векторная база
+
+    Returns:
+        BM25Index: лексический индекс
+    """
+    records = vectordb._collection.get(include=["documents"])
+    # Записи по id: чанки одного документа корпуса идут подряд
+    ordered = sorted(
+        zip(records["ids"], records["documents"] or [], strict=True),
+        key=lambda record: record[0],
+    )
+    index = BM25Index.from_texts(
+        [record_id for record_id, _ in ordered],
+        [text or "" for _, text in ordered],
+        get_index_version(vectordb),
+    )
+    path = os.path.join(index_directory(vectordb), LEXICAL_INDEX_FILENAME)
+    index.save(path)
+    logger.info(
+        f"Lexical index built: {len(index.ids)} chunks, "
+        f"{len(index.postings)} terms, saved to: {path}"
+    )
+    return index
+
+
+def load_lexical_index(vectordb: VectorDB) -> Optional[BM25Index]:
+    """
+    Загружает лексический индекс BM25; если файла нет или он построен по
+    другой версии коллекции - перестраивает его.
+
+    Args:
+        vectordb: Векторная база
+
+    Returns:
+        BM25Index или None, если индекс построить не удалось
+    """
+    path = os.path.join(index_directory(vectordb), LEXICAL_INDEX_FILENAME)
+    try:
+        if os.path.exists(path):
+            index = BM25Index.load(path)
+            if index.index_version == get_index_version(vectordb):
+                logger.info(f"Lexical index loaded with {len(index.ids)} chunks")
+                return index
+            logger.info("Lexical index is stale, rebuilding")
+        return build_lexical_index(vectordb)
+    except Exception as e:
+        logger.error(f"Failed to load lexical index: {e}")
+        return None
+
+
+def get_flat_compression() -> VectorCompression:
+    """Параметры сжатия векторов плоского индекса из конфигурации."""
+    return VectorCompression(
+        dtype=get_flat_index_dtype(),
+        dimensions=get_flat_index_dimensions(),
+        reduction=get_flat_index_reduction(),
+    )
+
+
+def build_flat_index(vectordb: VectorDB) -> FlatIndex:
+    """
+    Выгружает векторы, тексты и метаданные коллекции в плоский индекс и
+    сохраняет его рядом с директорией Chroma. Сжатые векторы для грубого
+    поиска строятся по ``FLAT_INDEX_DTYPE`` и ``FLAT_INDEX_DIMENSIONS``.
+
+    Args:
+        vectordb: Векторная база
+
+    Returns:
+        FlatIndex: плоский индекс
+    """
+    records = vectordb._collection.get(include=["documents", "metadatas", "embeddings"])
+    index = FlatIndex.from_records(
+        records["ids"],
+        [text or "" for text in records["documents"] or []],
+        records["metadatas"] or [],
+        records["embeddings"],
+        get_index_version(vectordb),
+        get_flat_compression(),
+    )
+    directory = index_directory(vectordb)
+    index.save(directory)
+    coarse = ""
+    if index.coarse is not None:
+        coarse = (
+            f", coarse {index.compression.describe()} "
+            f"{index.coarse.nbytes / 2**20:.1f} MB "
+            f"(float32 {index.vectors.nbytes / 2**20:.1f} MB)"
+        )
+    logger.info(
+        f"Flat index built: {index.count()} vectors of dimension "
+        f"{index.vectors.shape[1] if index.count() else 0}{coarse}, "
+        f"saved to: {directory}"
+    )
+    return FlatIndex.load(directory, get_flat_rescore_candidates())
+
+
+def load_flat_index(vectordb: VectorDB) -> Optional[FlatIndex]:
+    """
+    Загружает плоский индекс (векторы через mmap); если файлов нет,
+    индекс построен по другой версии коллекции или с другими параметрами
+    сжатия - перестраивает его.
+
+    Args:
+        vectordb: Векторная база
+
+    Returns:
+        FlatIndex или None, если индекс построить не удалось
+    """
+    directory = index_directory(vectordb)
+    try:
+        if os.path.exists(os.path.join(directory, FLAT_METADATA_FILENAME)):
+            index = FlatIndex.load(directory, get_flat_rescore_candidates())
+            compression = get_flat_compression()
+            same_compression = (
+                index.compression == compression
+                if compression.enabled
+                else index.coarse is None
+            )
+            if index.index_version == get_index_version(vectordb) and same_compression:
+                logger.info(f"Flat index loaded with {index.count()} vectors")
+                return index
+            logger.info("Flat index is stale, rebuilding")
+        return build_flat_index(vectordb)
+    except Exception as e:
+        logger.error(f"Failed to load flat index, using Chroma: {e}")
+        return None
+
+
+def get_lexical_index(vectordb: Optional[VectorDB] = None) -> Optional[BM25Index]:
+    """
+    Получить лексический индекс BM25 векторной базы
+
+    Args:
+        vectordb: Векторная база (по умолчанию - активная)
+
+    Returns:
+        BM25Index или None если индекс не загружен
+    """
+    handle = _handle_for(vectordb)
+    return handle.lexical_index if handle is not None else None
+
+
+def build_section_index(vectordb: VectorDB) -> SectionIndex:
+    """
+    Строит индекс разделов (§ -> id чанков) по метаданным коллекции и
+    сохраняет его рядом с директорией Chroma.
+
+    Args:
+        vectordb: Векторная база
+
+    Returns:
+        SectionIndex: индекс разделов
+    """
+    records = vectordb._collection.get(include=["metadatas"])
+    index = SectionIndex.from_metadatas(
+        records["ids"], records["metadatas"] or [], get_index_version(vectordb)
+    )
+    path = os.path.join(index_directory(vectordb), SECTION_INDEX_FILENAME)
+    index.save(path)
+    logger.info(
+        f"Section index built: {len(index.sections)} sections, saved to: {path}"
+    )
+    return index
+
+
+def load_section_index(vectordb: VectorDB) -> Optional[SectionIndex]:
+    """
+    Загружает индекс разделов; если файла нет или он построен по другой
+    версии коллекции - перестраивает его.
+
+    Args:
+        vectordb: Векторная база
+
+    Returns:
+        SectionIndex или None, если индекс построить не удалось
+    """
+    path = os.path.join(index_directory(vectordb), SECTION_INDEX_FILENAME)
+    try:
+        if os.path.exists(path):
+            index = SectionIndex.load(path)
+            if index.index_version == get_index_version(vectordb):
+                logger.info(f"Section index loaded with {len(index.sections)} sections")
+                return index
+            logger.info("Section index is stale, rebuilding")
+        return build_section_index(vectordb)
+    except Exception as e:
+        logger.error(f"Failed to load section index: {e}")
+        return None
+
+
+def get_section_index(vectordb: Optional[VectorDB] = None) -> Optional[SectionIndex]:
+    """
+    Получить индекс разделов векторной базы
+
+    Args:
+        vectordb: Векторная база (по умолчанию - активная)
+
+    Returns:
+        SectionIndex или None если индекс не загружен
+    """
+    handle = _handle_for(vectordb)
+    return handle.section_index if handle is not None else None
+
+
+def _chunk_index_from_id(chunk_id: Any) -> int:
+    """Номер чанка в блоке из chunk_id вида '164-502-03'."""
+    try:
+        return int(str(chunk_id).rsplit("-", 1)[1])
+    except (IndexError, ValueError):
+        return 0
+
+
+def migrate_chunk_metadata(vectordb: Chroma) -> Optional[ParentBlockStore]:
+    """
+    Миграция индекса со старой схемой метаданных, где полный текст блока
+    хранился в метаданных каждого чанка (ключ ``text``).
+
+    Текст блоков переносится в хранилище родительских блоков, из метаданных
+    чанков ключ ``text`` удаляется, добавляются ``block_index``,
+    ``chunk_index`` и ``token_count``. Эмбеддинги не пересчитываются.
+
+    Args:
+        vectordb: Векторная база
+
+    Returns:
+        ParentBlockStore или None, если индекс уже в новой схеме
+    """
+    collection = vectordb._collection
+    records = collection.get(include=["documents", "metadatas"])
+    legacy = [
+        (record_id, document or "", metadata)
+        for record_id, document, metadata in zip(
+            records["ids"],
+            records["documents"] or [],
+            records["metadatas"] or [],
+            strict=True,
+        )
+        if metadata and "text" in metadata
+    ]
+    if not legacy:
+        return None
+
+    logger.info(f"Migrating metadata of {len(legacy)} chunks to slim schema")
+    legacy.sort(
+        key=lambda r: (int(r[2].get("page_start", 0)), str(r[2].get("chunk_id")))
+    )
+    blocks: dict[tuple[Any, Any, Any], ParentBlock] = {}
+    ids: list[str] = []
+    updates: list[dict[str, Any]] = []
+    for record_id, document, metadata in legacy:
+        key = (metadata.get("section"), metadata.get("page_start"), metadata["text"])
+        block = blocks.get(key)
+        if block is None:
+            text = str(metadata["text"])
+            block = ParentBlock(
+                block_index=len(blocks),
+                section=str(metadata.get("section", "unknown")),
+                citation=str(metadata.get("citation", "unknown")),
+                title=str(metadata.get("title", "unknown")),
+                page_start=int(metadata.get("page_start", 0)),
+                page_end=int(metadata.get("page_end", 0)),
+                text=text,
+                token_count=count_tokens(text),
+            )
+            blocks[key] = block
+        ids.append(record_id)
+        updates.append(
+            {
+                "text": None,  # None удаляет ключ из метаданных Chroma
+                "block_index": block.block_index,
+                "chunk_index": _chunk_index_from_id(metadata.get("chunk_id")),
+                "token_count": count_tokens(document),
+            }
+        )
+
+    # Collection.update отклоняет None на клиентской валидации, хотя сегмент
+    # метаданных Chroma удаляет ключи со значением None - вызываем API клиента
+    for start in range(0, len(ids), UPDATE_BATCH_SIZE):
+        collection._client._update(
+            collection.id,
+            ids=ids[start : start + UPDATE_BATCH_SIZE],
+            metadatas=updates[start : start + UPDATE_BATCH_SIZE],
+        )
+
+    store = ParentBlockStore(list(blocks.values()), get_index_version(vectordb))
+    path = os.path.join(index_directory(vectordb), PARENT_STORE_FILENAME)
+    store.save(path)
+    logger.info(f"Metadata migrated: {len(blocks)} parent blocks saved to: {path}")
+    return store
+
+
+def load_parent_store(vectordb: VectorDB) -> Optional[ParentBlockStore]:
+    """
+    Загружает хранилище родительских блоков. Индекс в старой схеме
+    метаданных мигрируется на месте.
+
+    Args:
+        vectordb: Векторная база
+
+    Returns:
+        ParentBlockStore или None, если блоки недоступны
+    """
+    path = os.path.join(index_directory(vectordb), PARENT_STORE_FILENAME)
+    try:
+        if os.path.exists(path):
+            store = ParentBlockStore.load(path)
+            if store.index_version == get_index_version(vectordb):
+                logger.info(
+                    f"Parent block store loaded with {len(store.blocks)} blocks"
+                )
+                return store
+        migrated = (
+            migrate_chunk_metadata(vectordb) if isinstance(vectordb, Chroma) else None
+        )
+        if migrated is None:
+            logger.warning(
+                "Parent block store not found; rebuild the index to enable "
+                "small-to-big expansion"
+            )
+        return migrated
+    except Exception as e:
+        logger.error(f"Failed to load parent block store: {e}")
+        return None
+
+
+def get_index_manifest(
+    vectordb: Optional[VectorDB] = None,
+) -> Optional[IndexManifest]:
+    """
+    Получить манифест сборки векторной базы (документы корпуса и их хеши)
+
+    Args:
+        vectordb: Векторная база (по умолчанию - активная)
+
+    Returns:
+        IndexManifest или None если индекс не загружен или собран без манифеста
+    """
+    handle = _handle_for(vectordb)
+    return handle.manifest if handle is not None else None
+
+
+def get_parent_store(
+    vectordb: Optional[VectorDB] = None,
+) -> Optional[ParentBlockStore]:
+    """
+    Получить хранилище родительских блоков векторной базы
+
+    Args:
+        vectordb: Векторная база (по умолчанию - активная)
+
+    Returns:
+        ParentBlockStore или None если хранилище не загружено
+    """
+    handle = _handle_for(vectordb)
+    return handle.parent_store if handle is not None else None
+
+
+def get_vector_db() -> Optional[VectorDB]:
     """
     Получить инициализированную векторную базу
 
     Returns:
-        Chroma или None если база не инициализирована
+        VectorDB или None если база не инициализирована
+    """
+    handle = active_index
+    return handle.vector_db if handle is not None else None
+
+
+# Ограниченный пул потоков для синхронных вызовов Chroma/Ollama из async-кода
+_search_executor = ThreadPoolExecutor(
+    max_workers=get_search_workers(), thread_name_prefix="vector-search"
+)
+
+
+def submit_search(func: Callable[..., T], *args: Any, **kwargs: Any) -> Future[T]:
+    """
+    Запускает синхронный запрос к векторной базе в пуле потоков поиска.
+
+    Args:
+        func: Синхронная функция
+        *args: Позиционные аргументы функции
+        **kwargs: Именованные аргументы функции
+
+    Returns:
+        Future с результатом функции
+    """
+    return _search_executor.submit(func, *args, **kwargs)
+
+
+async def run_in_search_pool(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Выполняет синхронный запрос к векторной базе в ограниченном пуле потоков,
+    не блокируя event loop.
+
+    Args:
+        func: Синхронная функция (например, similarity_search)
+        *args: Позиционные аргументы функции
+        **kwargs: Именованные аргументы функции
+
+    Returns:
+        Результат функции
     """
-    return vector_db
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_search_executor, partial(func, *args, **kwargs))
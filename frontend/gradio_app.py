@@ -1,6 +1,8 @@
+import json
 import logging
 import os
 import time
+from collections.abc import Iterator
 from datetime import datetime
 from typing import Any
 
@@ -18,80 +20,140 @@ logger = logging.getLogger(__name__)
 API_BASE_URL = os.getenv("API_BASE_URL", "http://nginx/api")
 
 
-def send_message(message: str) -> tuple[str, list[list[str]]]:
+def _format_history(history_data: list[dict[str, Any]]) -> list[list[str]]:
     """
-    Отправить сообщение в чат с документом
+    Преобразовать историю с бэкенда в формат для Gradio
 
     Args:
-        message: Текст сообщения
+        history_data: Список сообщений из /history
 
     Returns:
+        Список сообщений в формате для Gradio
+    """
+    chat_messages = []
+    for item in history_data:
+        timestamp = datetime.fromisoformat(item["timestamp"].replace("Z", "+00:00"))
+        formatted_time = timestamp.strftime("%H:%M:%S")
+        chat_messages.append([f"[{formatted_time}] Вы", item["user_message"]])
+        chat_messages.append([f"[{formatted_time}] Документ", item["bot_response"]])
+    return chat_messages
+
+
+def _iter_sse(response: requests.Response) -> Iterator[tuple[str, dict[str, Any]]]:
+    """
+    Разобрать поток Server-Sent Events
+
+    Args:
+        response: Потоковый ответ requests
+
+    Yields:
+        Пары (имя события, данные)
+    """
+    event = "message"
+    data_lines: list[str] = []
+    for raw_line in response.iter_lines():
+        line = raw_line.decode("utf-8")
+        if not line:
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:") :].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:") :].strip())
+    if data_lines:
+        yield event, json.loads("\n".join(data_lines))
+
+
+def send_message(message: str) -> Iterator[tuple[str, list[list[str]]]]:
+    """
+    Отправить сообщение в чат с документом и показывать ответ по мере генерации
+
+    Args:
+        message: Текст сообщения
+
+    Yields:
         Tuple с пустой строкой (для очистки поля ввода) и списком сообщений
     """
     if not message.strip():
         logger.warning("Попытка отправить пустое сообщение")
-        return "", []
+        yield "", []
+        return
 
     logger.info(
         f"Отправка сообщения: '{message[:50]}{'...' if len(message) > 50 else ''}'"
     )
 
     try:
+        # Текущая история, к которой дописываем новый ответ
+        history_response = requests.get(f"{API_BASE_URL}/history")
+        if history_response.status_code == 200:
+            chat_messages = _format_history(history_response.json())
+        else:
+            chat_messages = []
+
+        now = datetime.now()
+        formatted_time = now.strftime("%H:%M:%S")
+        chat_messages.append([f"[{formatted_time}] Вы", message])
+        answer = [f"[{formatted_time}] Документ", "⏳ Поиск по документу..."]
+        chat_messages.append(answer)
+        yield "", chat_messages
+
         # Создаем объект сообщения
         message_data = {
             "text": message,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": now.isoformat(),
             "user_id": "user",
         }
 
-        # Отправляем сообщение на бэкенд
-        response = requests.post(
-            f"{API_BASE_URL}/chat",
+        # Отправляем сообщение на бэкенд и читаем поток токенов
+        with requests.post(
+            f"{API_BASE_URL}/chat/stream",
             json=message_data,
-            headers={"Content-Type": "application/json"},
-        )
-
-        if response.status_code == 200:
-            # Получаем обновленную историю с бэкенда
-            history_response = requests.get(f"{API_BASE_URL}/history")
-            if history_response.status_code == 200:
-                history_data = history_response.json()
-
-                # Преобразуем историю в формат для Gradio
-                chat_messages = []
-                for item in history_data:
-                    timestamp = datetime.fromisoformat(
-                        item["timestamp"].replace("Z", "+00:00")
-                    )
-                    formatted_time = timestamp.strftime("%H:%M:%S")
-                    chat_messages.append(
-                        [f"[{formatted_time}] Вы", item["user_message"]]
-                    )
-                    chat_messages.append(
-                        [f"[{formatted_time}] Документ", item["bot_response"]]
-                    )
+            headers={
+                "Content-Type": "application/json",
+                "Accept": "text/event-stream",
+            },
+            stream=True,
+        ) as response:
+            if response.status_code == 503:
+                retry_after = response.headers.get("Retry-After", "несколько")
+                answer[1] = (
+                    f"⏳ Индекс документа еще строится, повторите через {retry_after} с"
+                )
+                yield "", chat_messages
+                return
 
-                return "", chat_messages
-            else:
+            if response.status_code != 200:
                 error_message = [
-                    [
-                        "Система",
-                        f"Ошибка получения истории: {history_response.status_code}",
-                    ]
+                    ["Система", f"Ошибка отправки сообщения: {response.status_code}"]
                 ]
-                return "", error_message
-        else:
-            error_message = [
-                ["Система", f"Ошибка отправки сообщения: {response.status_code}"]
-            ]
-            return "", error_message
+                yield "", error_message
+                return
+
+            text = ""
+            for event, data in _iter_sse(response):
+                if event == "metadata":
+                    citations = ", ".join(
+                        c["citation"] for c in data.get("citations", [])
+                    )
+                    logger.info(f"Найдены источники: {citations}")
+                    answer[1] = "✍️ Формирование ответа..."
+                elif event == "token":
+                    text += data.get("text", "")
+                    answer[1] = text
+                elif event == "done":
+                    answer[1] = data.get("text", text)
+                elif event == "error":
+                    answer[1] = data.get("detail", "Ошибка при обработке сообщения")
+                yield "", chat_messages
 
     except requests.exceptions.RequestException as e:
         error_message = [["Система", f"Ошибка соединения с сервером: {str(e)}"]]
-        return "", error_message
+        yield "", error_message
     except Exception as e:
         error_message = [["Система", f"Неожиданная ошибка: {str(e)}"]]
-        return "", error_message
+        yield "", error_message
 
 
 def load_chat_history() -> list[list[str]]:
@@ -110,16 +172,7 @@ def load_chat_history() -> list[list[str]]:
             logger.info(f"Получено {len(history_data)} сообщений из истории")
 
             # Преобразуем историю в формат для Gradio
-            chat_messages = []
-            for item in history_data:
-                timestamp = datetime.fromisoformat(
-                    item["timestamp"].replace("Z", "+00:00")
-                )
-                formatted_time = timestamp.strftime("%H:%M:%S")
-                chat_messages.append([f"[{formatted_time}] Вы", item["user_message"]])
-                chat_messages.append(
-                    [f"[{formatted_time}] Документ", item["bot_response"]]
-                )
+            chat_messages = _format_history(history_data)
 
             logger.info(
                 f"Подготовлено {len(chat_messages)} элементов для отображения в Gradio"
@@ -165,11 +218,20 @@ def get_document_info() -> tuple[str, str]:
         logger.info(f"Ответ от API: статус {response.status_code}")
 
         if response.status_code == 200:
-            doc_info: dict[str, Any] = response.json()
-            logger.info(f"Получена информация о документе: {doc_info}")
-
-            document_name = str(doc_info.get("name", "Документ"))
-            filename = str(doc_info.get("filename", "unknown.pdf"))
+            documents: list[dict[str, Any]] = response.json()
+            logger.info(f"Получена информация о документах: {documents}")
+            if not documents:
+                return "Документ", "unknown.pdf"
+
+            if len(documents) == 1:
+                document_name = str(documents[0].get("name", "Документ"))
+                filename = str(documents[0].get("filename", "unknown.pdf"))
+            else:
+                # Корпус из нескольких документов
+                document_name = f"Корпус: {len(documents)} документов"
+                filename = ", ".join(
+                    str(doc.get("filename", "unknown.pdf")) for doc in documents
+                )
 
             logger.info(f"Извлечено: название='{document_name}', файл='{filename}'")
             return document_name, filename
@@ -181,6 +243,56 @@ def get_document_info() -> tuple[str, str]:
         return "Документ", "unknown.pdf"
 
 
+def format_index_status(status: dict[str, Any]) -> str:
+    """
+    Текст прогресса сборки индекса для view загрузки
+
+    Args:
+        status: Ответ /index/status
+
+    Returns:
+        Markdown с фазой, процентом, скоростью и оставшимся временем
+    """
+    if status.get("state") == "failed":
+        return f"❌ Ошибка сборки индекса: {status.get('error')}"
+    phases = {
+        "pending": "ожидание",
+        "load": "загрузка индекса",
+        "parse": "разбор документа",
+        "embed": "эмбеддинг чанков",
+        "persist": "сохранение индекса",
+        "ready": "готово",
+    }
+    phase = status.get("phase", "pending")
+    text = f"**{phases.get(phase, phase)}** - {status.get('percent', 0):.0f}%"
+    if status.get("chunks_per_second"):
+        text += f", {status['chunks_per_second']:.0f} чанков/с"
+    if status.get("eta_seconds") is not None:
+        text += f", осталось ~{status['eta_seconds']:.0f} с"
+    return text
+
+
+def iter_index_status() -> Iterator[dict[str, Any]]:
+    """
+    Опрашивать состояние сборки индекса до готовности или ошибки
+
+    Yields:
+        Ответы /index/status (последний - ready или failed)
+    """
+    while True:
+        try:
+            response = requests.get(f"{API_BASE_URL}/index/status", timeout=5)
+            if response.status_code == 200:
+                status: dict[str, Any] = response.json()
+                yield status
+                if status.get("state") in ("ready", "failed"):
+                    return
+        except requests.exceptions.RequestException:
+            # Бэкенд еще запускается
+            pass
+        time.sleep(2)
+
+
 def create_chat_interface() -> gr.Interface:
     """
     Создать интерфейс чата с документом
@@ -193,6 +305,7 @@ def create_chat_interface() -> gr.Interface:
         with gr.Column(visible=True) as loading_view:
             gr.Markdown("### ⏳ Проверка готовности векторной базы...")
             gr.Markdown("Пожалуйста, подождите. Это может занять несколько минут.")
+            index_status_markdown = gr.Markdown("")
 
         # View чата (скрыт до готовности)
         with gr.Column(visible=False) as chat_view:
@@ -238,25 +351,27 @@ def create_chat_interface() -> gr.Interface:
 
             clear_button.click(fn=clear_chat, outputs=[chat_area])
 
-        # Функция ожидания готовности векторной базы
-        def wait_for_db() -> bool:
-            """Ожидать готовности векторной базы"""
-            while True:
-                try:
-                    response = requests.get(f"{API_BASE_URL}/health")
-                    if response.status_code == 200:
-                        health_data = response.json()
-                        if health_data.get("vector_db_status") == "initialized":
-                            return True
-                except Exception:
-                    pass
-                time.sleep(2)
-
         # Функция переключения view после готовности базы
-        def switch_views() -> tuple[gr.update, gr.update, str, str, list[list[str]]]:
-            """Переключить view после готовности векторной базы и загрузить данные"""
-            # Ждем готовности базы
-            wait_for_db()
+        def switch_views() -> Iterator[
+            tuple[gr.update, gr.update, str, str, list[list[str]], str]
+        ]:
+            """Показывать прогресс сборки индекса, затем переключить view"""
+            # Ждем готовности базы, показывая фазу и процент сборки индекса
+            for status in iter_index_status():
+                if status.get("state") == "ready":
+                    break
+                yield (
+                    gr.update(),
+                    gr.update(),
+                    gr.update(),
+                    gr.update(),
+                    gr.update(),
+                    format_index_status(status),  # index_status_markdown
+                )
+                if status.get("state") == "failed":
+                    # Чат без индекса недоступен - остаемся на view загрузки
+                    logger.error(f"Сборка индекса завершилась ошибкой: {status}")
+                    return
 
             # Загружаем информацию о документе
             try:
@@ -276,12 +391,13 @@ def create_chat_interface() -> gr.Interface:
                 chat_history = [["Система", "Ошибка загрузки истории чата"]]
 
             # Возвращаем обновления для всех компонентов
-            return (
+            yield (
                 gr.update(visible=False),  # loading_view
                 gr.update(visible=True),  # chat_view
                 header_text,  # header_markdown
                 file_info_text,  # file_info_markdown
                 chat_history,  # chat_area
+                "",  # index_status_markdown
             )
 
         # Переключаем view и загружаем данные после готовности векторной базы
@@ -293,6 +409,7 @@ def create_chat_interface() -> gr.Interface:
                 header_markdown,
                 file_info_markdown,
                 chat_area,
+                index_status_markdown,
             ],
         )
 
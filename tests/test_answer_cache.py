@@ -0,0 +1,50 @@
+"""Семантический кэш ответов: порог близости, область поиска и сброс."""
+
+from app.answer_cache import SemanticAnswerCache
+
+QUESTION = [1.0, 0.0, 0.0]
+# Перефразированный вопрос: косинусная близость ~0.995
+PARAPHRASE = [1.0, 0.1, 0.0]
+# Другой вопрос: косинусная близость ~0.71
+UNRELATED = [1.0, 1.0, 0.0]
+
+
+def make_cache() -> SemanticAnswerCache:
+    cache = SemanticAnswerCache(threshold=0.95, max_entries=10, ttl_seconds=0)
+    cache.store(QUESTION, "What is PHI?", "answer", {}, "v1", scope="doc-a")
+    return cache
+
+
+def test_paraphrase_above_threshold_hits() -> None:
+    cache = make_cache()
+
+    entry = cache.lookup(PARAPHRASE, "v1", scope="doc-a")
+
+    assert entry is not None
+    assert entry.answer == "answer"
+    assert cache.stats()["hits"] == 1
+
+
+def test_question_below_threshold_misses() -> None:
+    cache = make_cache()
+
+    assert cache.lookup(UNRELATED, "v1", scope="doc-a") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_other_scope_misses() -> None:
+    cache = make_cache()
+
+    assert cache.lookup(QUESTION, "v1", scope="doc-b") is None
+    assert cache.lookup(QUESTION, "v1") is None
+    assert cache.lookup(QUESTION, "v1", scope="doc-a") is not None
+
+
+def test_fingerprint_change_resets_cache() -> None:
+    cache = make_cache()
+
+    assert cache.lookup(QUESTION, "v2", scope="doc-a") is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["invalidations"] == 1
+    # Записи прежнего fingerprint не возвращаются и после возврата к нему
+    assert cache.lookup(QUESTION, "v1", scope="doc-a") is None
@@ -0,0 +1,80 @@
+"""Сборка контекста: склейка соседних чанков и бюджет токенов."""
+
+from collections.abc import Iterator
+
+import pytest
+from langchain.schema import Document
+
+from app import context_packer
+from app.context_packer import context_tokens, pack_context
+
+OVERLAP = "covered entities may disclose protected health information"
+
+
+@pytest.fixture(autouse=True)
+def approx_tokens(monkeypatch: pytest.MonkeyPatch) -> Iterator[None]:
+    """Оценка chars/4 вместо словаря tiktoken (недоступного без сети)."""
+    monkeypatch.setattr(context_packer, "_get_encoding", lambda: None)
+    yield
+
+
+def make_chunk(text: str, block_index: int, chunk_index: int) -> Document:
+    return Document(
+        page_content=text,
+        metadata={
+            "doc_id": "hipaa-combined",
+            "citation": f"§164.{500 + block_index}",
+            "title": "Uses and disclosures",
+            "part": "164",
+            "subpart": "E",
+            "page_start": block_index,
+            "page_end": block_index,
+            "chunk_id": f"164-{block_index}-{chunk_index:02d}",
+            "block_index": block_index,
+            "chunk_index": chunk_index,
+        },
+    )
+
+
+def test_adjacent_overlapping_chunks_are_merged() -> None:
+    first = make_chunk(f"A covered entity may not use. {OVERLAP}", 2, 0)
+    second = make_chunk(f"{OVERLAP} without an authorization.", 2, 1)
+
+    # Порядок ранга не совпадает с порядком чанков в блоке
+    packed = pack_context([second, first], token_budget=None)
+
+    assert packed.merged == 1
+    assert len(packed.documents) == 1
+    merged = packed.documents[0]
+    assert merged.page_content == (
+        f"A covered entity may not use. {OVERLAP} without an authorization."
+    )
+    assert merged.metadata["merged_chunk_ids"] == ["164-2-00", "164-2-01"]
+
+
+def test_non_adjacent_chunks_are_left_alone() -> None:
+    chunks = [
+        make_chunk(f"first chunk. {OVERLAP}", 2, 0),
+        make_chunk(f"{OVERLAP} third chunk.", 2, 2),
+        make_chunk(f"{OVERLAP} other block.", 3, 1),
+    ]
+
+    packed = pack_context(chunks, token_budget=None)
+
+    assert packed.merged == 0
+    assert [doc.page_content for doc in packed.documents] == [
+        doc.page_content for doc in chunks
+    ]
+
+
+def test_packing_stops_at_token_budget() -> None:
+    chunks = [make_chunk(f"chunk {i} " + "word " * 40, i, 0) for i in range(4)]
+    cost = context_tokens(chunks[0])
+    budget = 2 * cost + cost // 2
+
+    packed = pack_context(chunks, token_budget=budget)
+
+    assert [doc.metadata["block_index"] for doc in packed.documents] == [0, 1]
+    assert packed.dropped == 2
+    assert packed.tokens <= budget
+    assert pack_context(chunks, token_budget=None).dropped == 0
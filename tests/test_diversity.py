@@ -0,0 +1,34 @@
+"""MMR переранжирование: вес релевантности, повторы и бюджет токенов."""
+
+import numpy as np
+
+from app.diversity import mmr_select
+
+QUERY = np.array([1.0, 0.0, 0.0])
+CANDIDATES = np.array(
+    [
+        [1.0, 0.0, 0.0],  # самый релевантный
+        [0.99, 0.01, 0.0],  # почти копия первого
+        [0.7, 0.0, 0.714],  # менее релевантный, но другой
+    ]
+)
+
+
+def test_lambda_one_keeps_relevance_order() -> None:
+    assert mmr_select(QUERY, CANDIDATES, top_n=3, lambda_mult=1.0) == [0, 1, 2]
+
+
+def test_near_copy_is_skipped_at_lower_lambda() -> None:
+    assert mmr_select(QUERY, CANDIDATES, top_n=2, lambda_mult=0.3) == [0, 2]
+
+
+def test_token_budget_is_respected() -> None:
+    costs = np.array([30, 5, 5])
+
+    # Первый кандидат не помещается в бюджет, остальные берутся по порядку
+    assert mmr_select(
+        QUERY, CANDIDATES, top_n=3, lambda_mult=1.0, costs=costs, budget=20
+    ) == [1, 2]
+    assert mmr_select(
+        QUERY, CANDIDATES, top_n=3, lambda_mult=1.0, costs=costs, budget=7
+    ) == [1]
@@ -0,0 +1,31 @@
+"""Плоский индекс NumPy, построенный по текстам."""
+
+from typing import Any
+
+from app.flat_index import FlatIndex, FlatVectorStore
+
+TEXTS = ["access control", "audit controls", "integrity", "transmission security"]
+
+
+class FakeEmbeddings:
+    """Эмбеддинги-индикаторы: текст совпадает только сам с собой."""
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return [1.0 if text == known else 0.0 for known in TEXTS]
+
+
+def test_from_texts_searches_embedded_texts(tmp_path: Any) -> None:
+    metadatas = [{"citation": f"§164.312({i})"} for i in range(len(TEXTS))]
+    store = FlatVectorStore.from_texts(
+        TEXTS, FakeEmbeddings(), metadatas, directory=str(tmp_path)
+    )
+
+    results = store.similarity_search_with_score("integrity", k=2)
+
+    assert results[0][0].page_content == "integrity"
+    assert results[0][0].metadata == {"citation": "§164.312(2)"}
+    assert results[0][1] < results[1][1]
+    assert FlatIndex.load(str(tmp_path)).count() == len(TEXTS)
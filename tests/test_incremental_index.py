@@ -0,0 +1,119 @@
+"""Инкрементальная сборка индекса эмбеддит только новый текст."""
+
+import hashlib
+import os
+from collections.abc import Iterator
+from typing import Any
+
+import numpy as np
+import pytest
+from langchain.schema import Document
+
+from app import vector_store
+from app.parent_store import ParentBlock
+
+PDF_PATH = os.path.join(
+    os.path.dirname(__file__), os.pardir, "app", "resources", "hipaa-combined.pdf"
+)
+
+
+class FakeEmbeddings:
+    """Детерминированные эмбеддинги по хешу текста с учетом эмбеддированных текстов."""
+
+    model = "fake"
+
+    def __init__(self) -> None:
+        self.texts: list[str] = []
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.texts.extend(texts)
+        return [fake_vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return fake_vector(text)
+
+
+def fake_vector(text: str) -> list[float]:
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    vector = np.frombuffer(digest, dtype=np.uint8)[:8].astype(np.float32) + 1.0
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def make_block(number: int) -> dict[str, Any]:
+    """Блок § раздела из нескольких чанков с уникальным текстом."""
+    words = " ".join(f"section{number}word{i}" for i in range(400))
+    return {
+        "part": "164",
+        "subpart": "A",
+        "section": f"164.{number}",
+        "title": f"Section {number}",
+        "page_start": number,
+        "page_end": number,
+        "chunk_id": f"164-{number}-00",
+        "citation": f"§164.{number}",
+        "text": words,
+    }
+
+
+@pytest.fixture
+def build(monkeypatch: pytest.MonkeyPatch, tmp_path: Any) -> Iterator[Any]:
+    """Сборка индекса из заданных блоков; возвращает эмбеддированные тексты."""
+    embeddings = FakeEmbeddings()
+    blocks: list[dict[str, Any]] = []
+
+    def iter_corpus_chunks(
+        pdf_paths: Any, stats: Any = None, **kwargs: Any
+    ) -> Iterator[tuple[ParentBlock, list[Document]]]:
+        return vector_store.iter_chunks(
+            blocks, vector_store.create_splitter(), "hipaa-combined"
+        )
+
+    monkeypatch.setattr(vector_store, "VECTOR_DB_PATH", str(tmp_path))
+    monkeypatch.setattr(vector_store, "create_embeddings", lambda **kw: embeddings)
+    monkeypatch.setattr(vector_store, "is_embedding_cache_enabled", lambda: False)
+    monkeypatch.setattr(vector_store, "index_dedup_threshold", lambda: 0.0)
+    monkeypatch.setattr(vector_store, "iter_corpus_chunks", iter_corpus_chunks)
+    directory = str(tmp_path / "index")
+
+    def run(numbers: list[int]) -> tuple[Any, list[str]]:
+        blocks[:] = [make_block(number) for number in numbers]
+        embeddings.texts.clear()
+        vectordb = vector_store.create_vector_db([PDF_PATH], directory)
+        return vectordb, list(embeddings.texts)
+
+    yield run
+    vector_store.release_chroma(directory)
+
+
+def block_chunks(number: int) -> list[str]:
+    """Тексты чанков блока."""
+    splitter = vector_store.create_splitter()
+    return splitter.split_text(make_block(number)["text"])
+
+
+def assert_index_matches(vectordb: Any, numbers: list[int]) -> None:
+    """Записи индекса - ровно чанки блоков, каждая с вектором своего текста."""
+    records = vectordb._collection.get(include=["documents", "embeddings"])
+    expected = [text for number in numbers for text in block_chunks(number)]
+    assert sorted(records["documents"]) == sorted(expected)
+    for text, vector in zip(records["documents"], records["embeddings"], strict=True):
+        assert np.allclose(vector, fake_vector(text), atol=1e-6)
+
+
+def test_inserted_block_embeds_only_its_chunks(build: Any) -> None:
+    _, embedded = build([1, 2, 3, 4])
+    assert len(embedded) == sum(len(block_chunks(n)) for n in (1, 2, 3, 4))
+
+    vectordb, embedded = build([1, 9, 2, 3, 4])
+
+    assert embedded == block_chunks(9)
+    assert_index_matches(vectordb, [1, 9, 2, 3, 4])
+
+
+def test_removed_block_embeds_nothing(build: Any) -> None:
+    build([1, 2, 3, 4])
+
+    vectordb, embedded = build([1, 3, 4])
+
+    assert embedded == []
+    assert_index_matches(vectordb, [1, 3, 4])
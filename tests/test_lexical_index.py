@@ -0,0 +1,90 @@
+"""BM25 поиск с ограничением по документам и слияние рангов RRF."""
+
+from langchain.schema import Document
+
+from app.lexical_index import BM25Index
+from app.process_question import fuse_ranked_results, parse_citation_query
+
+RECORDS = {
+    "doc-a/b000001-c001": "privacy rule covered entity disclosure",
+    "doc-a/b000002-c001": "security rule safeguards",
+    "doc-b/b000001-c001": "disclosure disclosure of protected health information",
+    "doc-b/b000002-c001": "breach notification",
+    "doc-a/b000003-c001": "minimum necessary disclosure standard",
+}
+
+
+def make_index() -> BM25Index:
+    return BM25Index.from_texts(list(RECORDS), list(RECORDS.values()), "v1")
+
+
+def ranked(*record_ids: str) -> list[tuple[str, Document]]:
+    return [(record_id, Document(page_content=record_id)) for record_id in record_ids]
+
+
+def test_unscoped_search_ranks_by_bm25() -> None:
+    results = make_index().search("disclosure", k=10)
+
+    ids = [record_id for record_id, _ in results]
+    scores = [score for _, score in results]
+    assert set(ids) == {
+        "doc-a/b000001-c001",
+        "doc-b/b000001-c001",
+        "doc-a/b000003-c001",
+    }
+    # Двойное вхождение термина поднимает запись на первое место
+    assert ids[0] == "doc-b/b000001-c001"
+    assert scores == sorted(scores, reverse=True)
+    assert make_index().search("disclosure", k=1) == results[:1]
+
+
+def test_scoped_search_keeps_unscoped_scores() -> None:
+    index = make_index()
+    unscoped = dict(index.search("disclosure", k=10))
+
+    scoped = index.search("disclosure", k=10, doc_ids=["doc-a"])
+
+    # Записи doc-a идут двумя несмежными диапазонами
+    assert [record_id for record_id, _ in scoped] == [
+        record_id for record_id in unscoped if record_id.startswith("doc-a/")
+    ]
+    for record_id, score in scoped:
+        assert score == unscoped[record_id]
+    assert index.search("disclosure", k=10, doc_ids=["doc-c"]) == []
+    assert index.search("unknown", k=10) == []
+
+
+def test_rank_fusion_prefers_records_found_by_both_lists() -> None:
+    vector = ranked("a", "b", "c")
+    lexical = ranked("c", "a", "d")
+
+    fused = fuse_ranked_results([vector, lexical], rrf_k=60, limit=10)
+
+    # a: 1/61 + 1/62, c: 1/63 + 1/61, b: 1/62, d: 1/63
+    assert [record_id for record_id, _ in fused] == ["a", "c", "b", "d"]
+    assert [
+        record_id
+        for record_id, _ in fuse_ranked_results([vector, lexical], rrf_k=60, limit=2)
+    ] == ["a", "c"]
+
+
+def test_parse_section_with_paragraph() -> None:
+    citation = parse_citation_query("What does 164.502(a) permit?")
+
+    assert citation.sections == ["164.502"]
+    assert citation
+
+
+def test_parse_section_sign() -> None:
+    citation = parse_citation_query("Explain § 164.502 and Part 160, subpart c")
+
+    assert citation.sections == ["164.502"]
+    assert citation.parts == ["160"]
+    assert citation.subparts == ["C"]
+
+
+def test_parse_question_without_citation() -> None:
+    citation = parse_citation_query("Who is a covered entity under HIPAA?")
+
+    assert not citation
+    assert citation.sections == [] and citation.parts == [] and citation.subparts == []
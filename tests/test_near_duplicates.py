@@ -0,0 +1,55 @@
+"""Поиск почти повторяющихся чанков по MinHash сигнатурам."""
+
+from langchain.schema import Document
+
+from app.near_duplicates import ChunkDeduplicator, NearDuplicateIndex
+
+SECTION = (
+    "A covered entity or business associate may not use or disclose protected "
+    "health information, except as permitted or required by this subpart or "
+    "by subpart C of part 160 of this subchapter. A covered entity is "
+    "permitted to use or disclose protected health information to the "
+    "individual and for treatment, payment, or health care operations."
+)
+# Тот же текст с другими переносами строк, регистром и пробелами
+REFORMATTED = SECTION.upper().replace(", ", ",\n").replace(". ", ".\n\n  ")
+OTHER_SECTION = (
+    "A covered entity must provide a notice of privacy practices that "
+    "describes the uses and disclosures of protected health information that "
+    "may be made by the covered entity, and the individual's rights and the "
+    "covered entity's legal duties with respect to protected health "
+    "information."
+)
+
+
+def test_index_flags_reformatted_duplicate_only() -> None:
+    index = NearDuplicateIndex(threshold=0.8)
+    signature = index.signature(SECTION)
+    assert signature is not None
+    index.add("section", signature)
+
+    reformatted = index.signature(REFORMATTED)
+    other = index.signature(OTHER_SECTION)
+    assert reformatted is not None and other is not None
+    assert index.find(reformatted) == "section"
+    assert index.find(other) is None
+
+
+def test_deduplicator_merges_duplicates_within_document() -> None:
+    dedup = ChunkDeduplicator(threshold=0.8)
+
+    def chunk(text: str, citation: str) -> Document:
+        return Document(
+            page_content=text,
+            metadata={"citation": citation, "page_start": 7, "page_end": 7},
+        )
+
+    assert dedup.check("a", chunk(SECTION, "§164.502"), scope="doc") is None
+    assert dedup.check("b", chunk(OTHER_SECTION, "§164.520"), scope="doc") is None
+    assert dedup.check("c", chunk(REFORMATTED, "§164.502"), scope="doc") == "a"
+    # В другом документе тот же текст не считается повтором
+    assert dedup.check("d", chunk(SECTION, "§164.502"), scope="other") is None
+
+    assert dedup.removed == 1
+    assert dedup.duplicate_metadata("a")["duplicate_citations"] == "§164.502"
+    assert dedup.duplicate_metadata("b")["duplicate_count"] == 0
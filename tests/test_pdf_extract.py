@@ -0,0 +1,41 @@
+"""Параллельное извлечение текста PDF совпадает с последовательным."""
+
+import os
+from typing import Any
+
+import fitz
+import pytest
+
+from app.config import config
+from app.vector_store import iter_pdf_chunks
+
+PDF_PATH = os.path.join(
+    os.path.dirname(__file__), os.pardir, "app", "resources", "hipaa-combined.pdf"
+)
+
+
+def extract_chunks(
+    monkeypatch: pytest.MonkeyPatch, workers: int
+) -> list[tuple[str, dict[str, Any]]]:
+    """Все чанки PDF как (текст, метаданные) при ``INGEST_WORKERS=workers``."""
+    monkeypatch.setattr(config, "INGEST_WORKERS", workers)
+    doc = fitz.open(PDF_PATH)
+    try:
+        return [
+            (chunk.page_content, chunk.metadata)
+            for _, chunks in iter_pdf_chunks(doc, PDF_PATH)
+            for chunk in chunks
+        ]
+    finally:
+        doc.close()
+
+
+def test_parallel_extraction_matches_serial(monkeypatch: pytest.MonkeyPatch) -> None:
+    serial = extract_chunks(monkeypatch, 1)
+    parallel = extract_chunks(monkeypatch, 2)
+
+    assert serial
+    assert [text for text, _ in parallel] == [text for text, _ in serial]
+    assert [metadata for _, metadata in parallel] == [
+        metadata for _, metadata in serial
+    ]
@@ -0,0 +1,28 @@
+"""Кэш результатов поиска при одновременной работе двух версий индекса."""
+
+import os
+from typing import Any
+
+from app.query_cache import DiskQueryCache, QueryCache
+
+VECTOR = [0.1, 0.2, 0.3]
+
+
+def test_versions_keep_results_until_dropped(tmp_path: Any) -> None:
+    disk = DiskQueryCache(os.path.join(tmp_path, "query_cache.sqlite3"), 100)
+    cache = QueryCache(10, disk)
+
+    # Запросы на старой и новой версии во время замены индекса
+    cache.put_results("old", VECTOR, 3, ["a"])
+    cache.put_results("new", VECTOR, 3, ["b"])
+    cache.put_results("old", VECTOR, 3, ["a"])
+
+    restarted = QueryCache(10, disk)
+    assert restarted.get_results("old", VECTOR, 3) == ["a"]
+    assert restarted.get_results("new", VECTOR, 3) == ["b"]
+
+    cache.drop_results("old")
+
+    assert cache.get_results("old", VECTOR, 3) is None
+    assert cache.get_results("new", VECTOR, 3) == ["b"]
+    assert QueryCache(10, disk).get_results("old", VECTOR, 3) is None